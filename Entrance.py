@@ -1,6 +1,8 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING, Optional, Any
 
+from Region import entrances_versions
+
 if TYPE_CHECKING:
     from Region import Region
     from RulesCommon import AccessRule
@@ -61,6 +63,8 @@ class Entrance:
     def connect(self, region: Region) -> None:
         self.connected_region = region
         region.entrances.append(self)
+        region.entrances_version = next(entrances_versions)
+        region.world.graph_version += 1
 
     def disconnect(self) -> Optional[Region]:
         if self.connected_region is None:
@@ -71,6 +75,8 @@ class Entrance:
             raise e
         previously_connected = self.connected_region
         self.connected_region = None
+        previously_connected.entrances_version = next(entrances_versions)
+        previously_connected.world.graph_version += 1
         return previously_connected
 
     def bind_two_way(self, other_entrance: Entrance) -> None:
@@ -1,10 +1,12 @@
 from __future__ import annotations
+import hashlib
 import random
 import logging
-from collections import OrderedDict
+import traceback
+from collections import Counter, OrderedDict
 from collections.abc import Iterable, Container
 from itertools import chain
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Optional, Any
 
 from Fill import ShuffleError
 from Search import Search
@@ -14,6 +16,7 @@ from State import State
 from Item import ItemFactory
 from Hints import HintArea, HintAreaNotFound
 from HintList import misc_item_hint_table
+from Utils import can_fork_attempts
 
 if TYPE_CHECKING:
     from Entrance import Entrance
@@ -417,6 +420,86 @@ class EntranceShuffleError(ShuffleError):
     pass
 
 
+# The cause of an error raised again from a worker process, with the traceback it had there.
+class WorkerTraceback(Exception):
+    def __str__(self) -> str:
+        return '\n' + self.args[0]
+
+
+# How many of the searches validate_world uses were made from scratch ('full'),
+# reused as they were ('reused'), or reused after exploring the worlds whose
+# entrances changed again ('updated'), see validation_search.
+# Logged and cleared once the entrances are set.
+validation_statistics: Counter[str] = Counter()
+
+
+# A search kept by validation_search, with the states it started from and the
+# graph version of their worlds when it was last explored.
+class ValidationSearch:
+    def __init__(self, key: tuple, states: list[State], collect_locations: bool) -> None:
+        self.key: tuple = key
+        self.states: list[State] = states
+        self.graph_versions: list[int] = [state.world.graph_version for state in states]
+        self.search: Search = Search(states)
+        if collect_locations:
+            self.search.collect_locations()
+        # A world explored again forgets which items it found for other worlds,
+        # so the search is only updated if all the items are found in their own world.
+        self.updatable: bool = not collect_locations or all(location.item.world is location.world for location in self.search.progression_locations())
+
+
+# The searches validate_world keeps between placements, by what they are for.
+# Cleared once the entrances are set.
+validation_searches: dict[str, ValidationSearch] = {}
+
+
+# Returns a search over the worlds, from their states (or from empty states if
+# starting_items is off) having collected the itempool, and having collected the
+# items of every reachable location if collect_locations is set.
+# The search is kept under the name, and returned again by the next calls with
+# the same worlds, states and items. Exits never lead to another world, so only
+# the worlds whose entrances were connected or disconnected since are explored
+# again. Callers can look up what the search reached, but must copy it to visit
+# or collect anything else.
+def validation_search(name: str, worlds: list[World], itempool: Iterable[Item] = (), starting_items: bool = True, collect_locations: bool = False) -> Search:
+    key = (tuple(map(id, worlds)), tuple(world.state.version for world in worlds) if starting_items else None,
+           tuple((item.name, item.world.id) for item in itempool if item.solver_id is not None and item.world is not None))
+    cached = validation_searches.get(name)
+    if cached is not None and cached.key == key:
+        changed_worlds = [world.id for world in worlds if world.graph_version != cached.graph_versions[world.id]]
+        if not changed_worlds:
+            validation_statistics['reused'] += 1
+            return cached.search
+        if cached.updatable:
+            # Exploring every world again is as good as a new search.
+            validation_statistics['updated' if len(changed_worlds) < len(worlds) else 'full'] += 1
+            for world_id in changed_worlds:
+                cached.search.restart_world(cached.states[world_id])
+                cached.graph_versions[world_id] = worlds[world_id].graph_version
+            if collect_locations:
+                cached.search.collect_locations()
+            return cached.search
+    validation_statistics['full'] += 1
+    states = [world.state.copy() if starting_items else State(world) for world in worlds]
+    for item in itempool:
+        if item.solver_id is not None and item.world is not None:
+            states[item.world.id].collect(item)
+    validation_searches[name] = ValidationSearch(key, states, collect_locations)
+    return validation_searches[name].search
+
+
+# The results of the age checks validate_world makes with entrance_unreachable_as, by entrance, age and
+# the entrance the check started out ignoring, along with the regions whose entrances the check went
+# through and their entrances_version at the time. Cleared once the entrances are set.
+unreachable_as_results: dict[tuple[Entrance, str, Optional[Entrance]], tuple[bool, tuple[tuple[Region, int], ...]]] = {}
+
+
+# What change_connections did to the regions it gave or took entrances from, by the rollback it belongs to,
+# kept until the change is confirmed or restored. Holds the entrances_version of those regions before and
+# after the change, and the results that were no longer valid after the change and got replaced.
+connection_journal: dict[tuple[Entrance, Entrance], tuple[dict[Region, int], dict[Region, int], dict[tuple[Entrance, str, Optional[Entrance]], tuple[bool, tuple[tuple[Region, int], ...]]]]] = {}
+
+
 # Set entrances of all worlds, first initializing them to their default regions, then potentially shuffling part of them
 def set_entrances(worlds: list[World], savewarps_to_connect: list[tuple[Entrance, str]]) -> None:
     for world in worlds:
@@ -432,7 +515,15 @@ def set_entrances(worlds: list[World], savewarps_to_connect: list[tuple[Entrance
             set_all_entrances_data(world)
 
     if worlds[0].entrance_shuffle:
-        shuffle_random_entrances(worlds)
+        try:
+            shuffle_random_entrances(worlds)
+        finally:
+            logging.getLogger('').info('Entrance validation: %d full searches, %d avoided by reusing a search, %d by exploring only the worlds whose entrances changed.',
+                                       validation_statistics['full'], validation_statistics['reused'], validation_statistics['updated'])
+            validation_statistics.clear()
+            validation_searches.clear()
+            unreachable_as_results.clear()
+            connection_journal.clear()
 
     set_entrances_based_rules(worlds)
 
@@ -581,6 +672,9 @@ def shuffle_random_entrances(worlds: list[World]) -> None:
         for pool_type, entrance_pool in entrance_pools.items():
             target_entrance_pools[pool_type] = assume_entrance_pool(entrance_pool)
 
+        # Rule out the targets each entrance can never replace before trying any placement
+        compatibility = EntranceCompatibility(world, {**one_way_entrance_pools, **entrance_pools}, {**one_way_target_entrance_pools, **target_entrance_pools})
+
         # Set entrances defined in the distribution
         world.distribution.set_shuffled_entrances(worlds, {**one_way_entrance_pools, **entrance_pools}, {**one_way_target_entrance_pools, **target_entrance_pools}, locations_to_ensure_reachable, complete_itempool)
 
@@ -601,29 +695,13 @@ def shuffle_random_entrances(worlds: list[World]) -> None:
                         del one_way_priorities[key]
                         break
 
-        # Place priority entrances
-        placed_one_way_entrances = shuffle_one_way_priority_entrances(worlds, world, one_way_priorities, one_way_entrance_pools, one_way_target_entrance_pools, locations_to_ensure_reachable, complete_itempool, retry_count=2)
-
-        # Delete all targets that we just placed from one way target pools so multiple one way entrances don't use the same target
-        replaced_entrances = [entrance.replaces for entrance in chain.from_iterable(one_way_entrance_pools.values())]
-        for remaining_target in chain.from_iterable(one_way_target_entrance_pools.values()):
-            if remaining_target.replaces in replaced_entrances:
-                delete_target_entrance(remaining_target)
-
-        # Shuffle all entrances among the pools to shuffle
-        for pool_type, entrance_pool in one_way_entrance_pools.items():
-            placed_one_way_entrances += shuffle_entrance_pool(world, worlds, entrance_pool, one_way_target_entrance_pools[pool_type], locations_to_ensure_reachable, check_all=True, placed_one_way_entrances=placed_one_way_entrances)
-            # Delete all targets that we just placed from other one way target pools so multiple one way entrances don't use the same target
-            replaced_entrances = [entrance.replaces for entrance in entrance_pool]
-            for remaining_target in chain.from_iterable(one_way_target_entrance_pools.values()):
-                if remaining_target.replaces in replaced_entrances:
-                    delete_target_entrance(remaining_target)
-            # Delete all unused extra targets after placing a one way pool, since the unused targets won't ever be replaced
-            for unused_target in one_way_target_entrance_pools[pool_type]:
-                delete_target_entrance(unused_target)
-
-        for pool_type, entrance_pool in entrance_pools.items():
-            shuffle_entrance_pool(world, worlds, entrance_pool, target_entrance_pools[pool_type], locations_to_ensure_reachable, placed_one_way_entrances=placed_one_way_entrances)
+        # Place the entrances, possibly trying several times at once in worker processes
+        placement = (worlds, world, one_way_priorities, one_way_entrance_pools, one_way_target_entrance_pools,
+                     entrance_pools, target_entrance_pools, locations_to_ensure_reachable, complete_itempool, compatibility)
+        if worlds[0].settings.speculative_entrance_attempts > 1 and can_fork_attempts():
+            placed_one_way_entrances, _ = place_entrances_speculatively(worlds[0].settings.speculative_entrance_attempts, *placement)
+        else:
+            placed_one_way_entrances, _ = place_entrances(*placement)
 
         # Determine blue warp targets
         # if a boss room is inside a boss door, make the blue warp go outside the dungeon's entrance
@@ -670,7 +748,7 @@ def shuffle_random_entrances(worlds: list[World]) -> None:
 
 
     # Multiple checks after shuffling entrances to make sure everything went fine
-    max_search = Search.max_explore([world.state for world in worlds], complete_itempool)
+    max_search = validation_search('max', worlds, complete_itempool, collect_locations=True)
 
     # Check that all shuffled entrances are properly connected to a region
     for world in worlds:
@@ -696,17 +774,165 @@ def shuffle_random_entrances(worlds: list[World]) -> None:
             raise EntranceShuffleError('Worlds are not valid after shuffling entrances, Reason: %s' % error)
 
 
+# Places the entrances of the pools shuffle_random_entrances built for the world, and returns the one way
+# entrances (priority ones included) and the two way entrances that were placed, with the targets they replaced
+def place_entrances(worlds: list[World], world: World, one_way_priorities: dict[str, tuple[list[str], list[str]]],
+                    one_way_entrance_pools: dict[str, list[Entrance]], one_way_target_entrance_pools: dict[str, list[Entrance]],
+                    entrance_pools: dict[str, list[Entrance]], target_entrance_pools: dict[str, list[Entrance]],
+                    locations_to_ensure_reachable: Iterable[Location], complete_itempool: list[Item],
+                    compatibility: Optional[EntranceCompatibility] = None) -> tuple[list[tuple[Entrance, Entrance]], list[tuple[Entrance, Entrance]]]:
+    # Place priority entrances
+    placed_one_way_entrances = shuffle_one_way_priority_entrances(worlds, world, one_way_priorities, one_way_entrance_pools, one_way_target_entrance_pools, locations_to_ensure_reachable, complete_itempool, retry_count=2, compatibility=compatibility)
+
+    # Delete all targets that we just placed from one way target pools so multiple one way entrances don't use the same target
+    replaced_entrances = [entrance.replaces for entrance in chain.from_iterable(one_way_entrance_pools.values())]
+    for remaining_target in chain.from_iterable(one_way_target_entrance_pools.values()):
+        if remaining_target.replaces in replaced_entrances:
+            delete_target_entrance(remaining_target)
+
+    # Shuffle all entrances among the pools to shuffle
+    for pool_type, entrance_pool in one_way_entrance_pools.items():
+        placed_one_way_entrances += shuffle_entrance_pool(world, worlds, entrance_pool, one_way_target_entrance_pools[pool_type], locations_to_ensure_reachable, check_all=True, placed_one_way_entrances=placed_one_way_entrances, compatibility=compatibility)
+        # Delete all targets that we just placed from other one way target pools so multiple one way entrances don't use the same target
+        replaced_entrances = [entrance.replaces for entrance in entrance_pool]
+        for remaining_target in chain.from_iterable(one_way_target_entrance_pools.values()):
+            if remaining_target.replaces in replaced_entrances:
+                delete_target_entrance(remaining_target)
+        # Delete all unused extra targets after placing a one way pool, since the unused targets won't ever be replaced
+        for unused_target in one_way_target_entrance_pools[pool_type]:
+            delete_target_entrance(unused_target)
+
+    placed_entrances = []
+    for pool_type, entrance_pool in entrance_pools.items():
+        placed_entrances += shuffle_entrance_pool(world, worlds, entrance_pool, target_entrance_pools[pool_type], locations_to_ensure_reachable, placed_one_way_entrances=placed_one_way_entrances, compatibility=compatibility)
+    return placed_one_way_entrances, placed_entrances
+
+
+# Places the entrances like place_entrances, with that many attempts running at once in forked worker processes.
+# The first attempt starts from the current random state and the next ones from seeds derived from it, and the
+# lowest numbered attempt that succeeds is always the one kept, no matter which one finishes first. Its connections
+# are then made again in this process, which carries on from the random state the attempt ended with.
+# An attempt that fails with any other error than EntranceShuffleError has that error raised again here, as it
+# would be without workers. An attempt whose worker dies is made again in a new worker, and if that one fails
+# with an EntranceShuffleError the next attempts are tried. Attempts are never made in this process, which has
+# to be left as it was for the connections of the kept attempt.
+def place_entrances_speculatively(attempts: int, worlds: list[World], world: World, one_way_priorities: dict[str, tuple[list[str], list[str]]],
+                                  one_way_entrance_pools: dict[str, list[Entrance]], one_way_target_entrance_pools: dict[str, list[Entrance]],
+                                  entrance_pools: dict[str, list[Entrance]], target_entrance_pools: dict[str, list[Entrance]],
+                                  locations_to_ensure_reachable: Iterable[Location], complete_itempool: list[Item],
+                                  compatibility: Optional[EntranceCompatibility] = None) -> tuple[list[tuple[Entrance, Entrance]], list[tuple[Entrance, Entrance]]]:
+    import multiprocessing
+    placement = (worlds, world, one_way_priorities, one_way_entrance_pools, one_way_target_entrance_pools,
+                 entrance_pools, target_entrance_pools, locations_to_ensure_reachable, complete_itempool, compatibility)
+    # Workers report the targets they used by their position in this list, which is the same in every process
+    targets = list(chain(chain.from_iterable(one_way_target_entrance_pools.values()), chain.from_iterable(target_entrance_pools.values())))
+    # The random module is seeded again in forked processes, so each worker is given the random state to start from
+    random_states = speculative_random_states(attempts)
+
+    context = multiprocessing.get_context('fork')
+    running = []
+
+    def start_attempt(random_state: tuple) -> Any:
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=speculative_entrance_attempt, args=(placement, targets, random_state, sender), daemon=True)
+        process.start()
+        sender.close()
+        running.append((process, receiver))
+        return receiver
+
+    def receive(receiver: Any) -> Optional[tuple]:
+        try:
+            return receiver.recv()
+        except EOFError:
+            return None
+
+    result = None
+    errors = []
+    try:
+        receivers = [start_attempt(random_state) for random_state in random_states]
+        for attempt, receiver in enumerate(receivers, start=1):
+            result = receive(receiver)
+            if result is None:
+                logging.getLogger('').warning('The worker of entrance placement attempt %d for world %d exited unexpectedly, making the attempt again.', attempt, world.id)
+                result = receive(start_attempt(random_states[attempt - 1]))
+                if result is None:
+                    raise RuntimeError(f'The workers of entrance placement attempt {attempt} for world {world.id} exited unexpectedly.')
+            if result[0] is None:
+                break
+            if result[0] is not EntranceShuffleError:
+                _, error, worker_traceback = result
+                raise error from WorkerTraceback(worker_traceback)
+            logging.getLogger('').info('Entrance placement attempt %d of %d failed for world %d: %s', attempt, attempts, world.id, result[1])
+            errors.append(result[1])
+    finally:
+        for process, receiver in running:
+            process.terminate()
+            process.join()
+            receiver.close()
+    if len(errors) == attempts:
+        raise EntranceShuffleError(f'All {attempts} entrance placement attempts failed for world {world.id}, the first one with: {errors[0]}')
+
+    _, one_way_placements, placements, random_state = result
+    placed = []
+    for entrance_name, target_index in one_way_placements + placements:
+        entrance, target = world.get_entrance(entrance_name), targets[target_index]
+        change_connections(entrance, target)
+        confirm_replacement(entrance, target)
+        placed.append((entrance, target))
+    # The one way targets left over were deleted as well
+    for target in chain.from_iterable(one_way_target_entrance_pools.values()):
+        delete_target_entrance(target)
+    random.setstate(random_state)
+    return placed[:len(one_way_placements)], placed[len(one_way_placements):]
+
+
+# The random states the attempts of place_entrances_speculatively start from: the current one for the first
+# attempt, and states seeded from it for the next ones. Doesn't change the current random state.
+def speculative_random_states(attempts: int) -> list[tuple]:
+    random_states = [random.getstate()]
+    rng = random.Random()
+    rng.setstate(random_states[0])
+    base_seed = rng.getrandbits(64)
+    for attempt in range(2, attempts + 1):
+        random_states.append(random.Random(int(hashlib.sha256(f'{base_seed}-entrance-attempt-{attempt}'.encode('utf-8')).hexdigest(), 16)).getstate())
+    return random_states
+
+
+# Runs one attempt of place_entrances_speculatively in a worker process, and sends back either the message of
+# the EntranceShuffleError it failed with, any other error with its traceback, or the names of the entrances
+# it placed with the positions of their targets in the list.
+def speculative_entrance_attempt(placement: tuple, targets: list[Entrance], random_state: tuple, connection: Any) -> None:
+    # The placement messages are logged again when the connections are made in the main process.
+    logging.disable(logging.WARNING)
+    random.setstate(random_state)
+    target_indexes = {target: index for index, target in enumerate(targets)}
+    try:
+        placed_one_way_entrances, placed_entrances = place_entrances(*placement)
+        connection.send((None, [(entrance.name, target_indexes[target]) for entrance, target in placed_one_way_entrances],
+                         [(entrance.name, target_indexes[target]) for entrance, target in placed_entrances], random.getstate()))
+    except EntranceShuffleError as e:
+        connection.send((EntranceShuffleError, str(e)))
+    except Exception as e:
+        try:
+            connection.send((Exception, e, traceback.format_exc()))
+        except Exception:
+            # The error can't be pickled.
+            connection.send((Exception, RuntimeError(f'{type(e).__name__}: {e}'), traceback.format_exc()))
+    finally:
+        connection.close()
+
+
 def shuffle_one_way_priority_entrances(worlds: list[World], world: World, one_way_priorities: dict[str, tuple[list[str], list[str]]],
                                        one_way_entrance_pools: dict[str, list[Entrance]], one_way_target_entrance_pools: dict[str, list[Entrance]],
                                        locations_to_ensure_reachable: Iterable[Location], complete_itempool: list[Item],
-                                       retry_count: int = 2) -> list[tuple[Entrance, Entrance]]:
+                                       retry_count: int = 2, compatibility: Optional[EntranceCompatibility] = None) -> list[tuple[Entrance, Entrance]]:
     while retry_count:
         retry_count -= 1
         rollbacks = []
 
         try:
             for key, (regions, types) in one_way_priorities.items():
-                place_one_way_priority_entrance(worlds, world, key, regions, types, rollbacks, locations_to_ensure_reachable, complete_itempool, one_way_entrance_pools, one_way_target_entrance_pools)
+                place_one_way_priority_entrance(worlds, world, key, regions, types, rollbacks, locations_to_ensure_reachable, complete_itempool, one_way_entrance_pools, one_way_target_entrance_pools, compatibility)
 
             # If all entrances could be connected without issues, log connections and continue
             for entrance, target in rollbacks:
@@ -729,7 +955,8 @@ def shuffle_one_way_priority_entrances(worlds: list[World], world: World, one_wa
 # Shuffle all entrances within a provided pool
 def shuffle_entrance_pool(world: World, worlds: list[World], entrance_pool: list[Entrance], target_entrances: list[Entrance],
                           locations_to_ensure_reachable: Iterable[Location], check_all: bool = False, retry_count: int = 20,
-                          placed_one_way_entrances: Optional[list[tuple[Entrance, Entrance]]] = None) -> list[tuple[Entrance, Entrance]]:
+                          placed_one_way_entrances: Optional[list[tuple[Entrance, Entrance]]] = None,
+                          compatibility: Optional[EntranceCompatibility] = None) -> list[tuple[Entrance, Entrance]]:
     if placed_one_way_entrances is None:
         placed_one_way_entrances = []
     # Split entrances between those that have requirements (restrictive) and those that do not (soft). These are primarily age or time of day requirements.
@@ -741,13 +968,13 @@ def shuffle_entrance_pool(world: World, worlds: list[World], entrance_pool: list
 
         try:
             # Shuffle restrictive entrances first while more regions are available in order to heavily reduce the chances of the placement failing.
-            shuffle_entrances(worlds, restrictive_entrances, target_entrances, rollbacks, locations_to_ensure_reachable, placed_one_way_entrances=placed_one_way_entrances)
+            shuffle_entrances(worlds, restrictive_entrances, target_entrances, rollbacks, locations_to_ensure_reachable, placed_one_way_entrances=placed_one_way_entrances, compatibility=compatibility)
 
             # Shuffle the rest of the entrances, we don't have to check for beatability/reachability of locations when placing those, unless specified otherwise
             if check_all:
-                shuffle_entrances(worlds, soft_entrances, target_entrances, rollbacks, locations_to_ensure_reachable, placed_one_way_entrances=placed_one_way_entrances)
+                shuffle_entrances(worlds, soft_entrances, target_entrances, rollbacks, locations_to_ensure_reachable, placed_one_way_entrances=placed_one_way_entrances, compatibility=compatibility)
             else:
-                shuffle_entrances(worlds, soft_entrances, target_entrances, rollbacks, placed_one_way_entrances=placed_one_way_entrances)
+                shuffle_entrances(worlds, soft_entrances, target_entrances, rollbacks, placed_one_way_entrances=placed_one_way_entrances, compatibility=compatibility)
 
             # Fully validate the resulting world to ensure everything is still fine after shuffling this pool
             complete_itempool = [item for world in worlds for item in world.get_itempool_with_dungeon_items()]
@@ -830,7 +1057,8 @@ def replace_entrance(worlds: list[World], entrance: Entrance, target: Entrance,
 # Target chosen will lead to one of the allowed regions.
 def place_one_way_priority_entrance(worlds: list[World], world: World, priority_name: str, allowed_regions: Container[str], allowed_types: Iterable[str],
                                     rollbacks: list[tuple[Entrance, Entrance]], locations_to_ensure_reachable: Iterable[Location], complete_itempool: list[Item],
-                                    one_way_entrance_pools: dict[str, list[Entrance]], one_way_target_entrance_pools: dict[str, list[Entrance]]) -> None:
+                                    one_way_entrance_pools: dict[str, list[Entrance]], one_way_target_entrance_pools: dict[str, list[Entrance]],
+                                    compatibility: Optional[EntranceCompatibility] = None) -> None:
     # Combine the entrances for allowed types in one list.
     # Shuffle this list.
     # Pick the first one not already set, not adult spawn, that has a valid target entrance.
@@ -851,6 +1079,8 @@ def place_one_way_priority_entrance(worlds: list[World], world: World, priority_
                 continue
         for target in one_way_target_entrance_pools[entrance.type]:
             if target.connected_region and target.connected_region.name in allowed_regions:
+                if compatibility is not None and not compatibility.plausible(entrance, target):
+                    continue
                 if replace_entrance(worlds, entrance, target, rollbacks, locations_to_ensure_reachable, complete_itempool):
                     logging.getLogger('').debug(f'Priority placement for {priority_name}: placing {entrance} as {target}')
                     return
@@ -860,7 +1090,8 @@ def place_one_way_priority_entrance(worlds: list[World], world: World, priority_
 # Shuffle entrances by placing them instead of entrances in the provided target entrances list
 # While shuffling entrances, the algorithm will ensure worlds are still valid based on multiple criterias
 def shuffle_entrances(worlds: list[World], entrances: list[Entrance], target_entrances: list[Entrance], rollbacks: list[tuple[Entrance, Entrance]],
-                      locations_to_ensure_reachable: Iterable[Location] = (), placed_one_way_entrances: Optional[list[tuple[Entrance, Entrance]]] = None) -> None:
+                      locations_to_ensure_reachable: Iterable[Location] = (), placed_one_way_entrances: Optional[list[tuple[Entrance, Entrance]]] = None,
+                      compatibility: Optional[EntranceCompatibility] = None) -> None:
     if placed_one_way_entrances is None:
         placed_one_way_entrances = []
     # Retrieve all items in the itempool, all worlds included
@@ -877,6 +1108,8 @@ def shuffle_entrances(worlds: list[World], entrances: list[Entrance], target_ent
         for target in target_entrances:
             if target.connected_region is None:
                 continue
+            if compatibility is not None and not compatibility.plausible(entrance, target):
+                continue
 
             if replace_entrance(worlds, entrance, target, rollbacks, locations_to_ensure_reachable, complete_itempool, placed_one_way_entrances=placed_one_way_entrances):
                 break
@@ -885,6 +1118,99 @@ def shuffle_entrances(worlds: list[World], entrances: list[Entrance], target_ent
             raise EntranceShuffleError('No more valid entrances to replace with %s in world %d' % (entrance, entrance.world.id))
 
 
+# Returns the names of the entrances that mustn't be reachable as child, and as adult.
+# For various reasons, we don't want the player to end up through certain entrances as the wrong age
+# This means we need to hard check that none of the relevant entrances are ever reachable as that age
+# This is mostly relevant when shuffling special interiors (such as windmill or kak potion shop)
+# Warp Songs and Overworld Spawns can also end up inside certain indoors so those need to be handled as well
+# Allowing child to enter Spirit from the boss would severely complicate key logic
+def forbidden_entrances(world: World) -> tuple[list[str], list[str]]:
+    child_forbidden = ['OGC Great Fairy Fountain -> Castle Grounds', 'GV Carpenter Tent -> GV Fortress Side', 'Ganons Castle Lobby -> Castle Grounds', 'Bongo Bongo Boss Room -> Shadow Temple Before Boss', 'Twinrova Boss Room -> Spirit Temple Before Boss']
+    adult_forbidden = ['HC Great Fairy Fountain -> Castle Grounds', 'HC Storms Grotto -> Castle Grounds', 'Bongo Bongo Boss Room -> Shadow Temple Before Boss', 'Twinrova Boss Room -> Spirit Temple Before Boss']
+    if world.dungeon_mq['Forest Temple'] and 'Forest Temple' in world.settings.dungeon_shortcuts:
+        child_forbidden.append('Phantom Ganon Boss Room -> Forest Temple Before Boss')
+        adult_forbidden.append('Phantom Ganon Boss Room -> Forest Temple Before Boss')
+    return child_forbidden, adult_forbidden
+
+
+# Returns the pairs of entrances (with the regions they lead to) whose replacements
+# have to be in the same hint area once interiors are placed, and the interior they lead to.
+def same_hint_area_entrances(world: World) -> list[tuple[tuple[str, str], tuple[str, str], str]]:
+    if not world.shuffle_interior_entrances or not (
+        (world.dungeon_rewards_hinted and (world.mixed_pools_bosses or world.settings.shuffle_dungeon_rewards in ('regional', 'overworld', 'anywhere')))
+        or any(hint_type in world.settings.misc_hints for hint_type in misc_item_hint_table) or world.settings.hints != 'none'
+    ):
+        return []
+    # Ensure Kak Potion Shop entrances are in the same hint area so there is no ambiguity as to which entrance is used for hints
+    pairs = [(('Kak Potion Shop Front', 'Kakariko Village -> Kak Potion Shop Front'), ('Kak Potion Shop Back', 'Kak Backyard -> Kak Potion Shop Back'), 'Kak Potion Shop')]
+    # When cows are shuffled, ensure the same thing for Impa's House, since the cow is reachable from both sides
+    if world.settings.shuffle_cows:
+        pairs.append((('Kak Impas House', 'Kakariko Village -> Kak Impas House'), ('Kak Impas House Back', 'Kak Impas Ledge -> Kak Impas House Back'), 'Kak Impas House'))
+    return pairs
+
+
+# Returns the hint area of the spot if it doesn't depend on how the entrances are connected, otherwise None
+def static_hint_area(spot: Region | Entrance) -> Optional[HintArea]:
+    region = spot if isinstance(spot, Region) else spot.parent_region
+    return region.hint if region.name != 'Root' else None
+
+
+# The targets each entrance of a world's pools could replace, as far as the checks of
+# check_entrances_compatibility and validate_world that only look at the entrance and
+# the target can tell, so that shuffle_entrances doesn't connect and validate the others.
+# Those checks are done once for every entrance and target of the pools. The hint areas
+# of paired interiors (see same_hint_area_entrances) depend on where the other entrance
+# of the pair was placed, and are looked up from the entrances currently connected.
+class EntranceCompatibility:
+    def __init__(self, world: World, entrance_pools: dict[str, list[Entrance]], target_entrance_pools: dict[str, list[Entrance]]) -> None:
+        self.world: World = world
+        child_forbidden, adult_forbidden = forbidden_entrances(world)
+        self.targets: dict[Entrance, set[Entrance]] = {}
+        for pool_type, entrance_pool in entrance_pools.items():
+            for entrance in entrance_pool:
+                self.targets[entrance] = {target for target in target_entrance_pools[pool_type]
+                                          if not self.incompatible(entrance, target, child_forbidden, adult_forbidden)}
+        # For each entrance of a pair, the other entrance and the region it leads to
+        self.paired_entrances: dict[str, tuple[str, str]] = {}
+        for front, back, _ in same_hint_area_entrances(world):
+            self.paired_entrances[front[1]] = back
+            self.paired_entrances[back[1]] = front
+
+    # Returns whether the entrance can never replace the target, whatever the rest of the graph looks like
+    @staticmethod
+    def incompatible(entrance: Entrance, target: Entrance, child_forbidden: list[str], adult_forbidden: list[str]) -> bool:
+        # Self scene connections, see check_entrances_compatibility
+        if entrance.parent_region.get_scene() and entrance.parent_region.get_scene() == target.connected_region.get_scene():
+            return True
+        # Entrances that would make a forbidden entrance reachable as the wrong age, from their type alone (see validate_world)
+        replaced = target.replaces
+        if (replaced.name in child_forbidden and entrance_type_unreachable_as(entrance, 'child') is False
+                or replaced.name in adult_forbidden and entrance_type_unreachable_as(entrance, 'adult') is False):
+            return True
+        if entrance.reverse and replaced.reverse and replaced.reverse.shuffled:
+            # The return of the target's entrance will replace the return of this entrance
+            if (entrance.reverse.name in child_forbidden and entrance_type_unreachable_as(replaced.reverse, 'child') is False
+                    or entrance.reverse.name in adult_forbidden and entrance_type_unreachable_as(replaced.reverse, 'adult') is False):
+                return True
+        return False
+
+    # Returns whether placing the entrance at the target is worth validating
+    def plausible(self, entrance: Entrance, target: Entrance) -> bool:
+        if entrance in self.targets and target not in self.targets[entrance]:
+            return False
+        other = self.paired_entrances.get(target.replaces.name)
+        if other is not None and entrance.type in ('Interior', 'SpecialInterior'):
+            other_region, other_name = other
+            other_entrance = get_entrance_replacing(self.world.get_region(other_region), other_name)
+            # The return of the target's entrance will lead to the entrance's parent region, so that one has to be left alone
+            if other_entrance is not None and entrance.parent_region.name != other_region:
+                hint_area = static_hint_area(entrance)
+                other_hint_area = static_hint_area(other_entrance)
+                if hint_area is not None and other_hint_area is not None and hint_area != other_hint_area:
+                    return False
+        return True
+
+
 # Check and validate that an entrance is compatible to replace a specific target
 def check_entrances_compatibility(entrance: Entrance, target: Entrance, rollbacks: list[tuple[Entrance, Entrance]] = (),
                                   placed_one_way_entrances: Optional[list[tuple[Entrance, Entrance]]] = None) -> None:
@@ -916,32 +1242,23 @@ def validate_world(world: World, worlds: list[World], entrance_placed: Optional[
                    itempool: list[Item], placed_one_way_entrances: Optional[list[tuple[Entrance, Entrance]]] = None) -> None:
     if placed_one_way_entrances is None:
         placed_one_way_entrances = []
-    # For various reasons, we don't want the player to end up through certain entrances as the wrong age
-    # This means we need to hard check that none of the relevant entrances are ever reachable as that age
-    # This is mostly relevant when shuffling special interiors (such as windmill or kak potion shop)
-    # Warp Songs and Overworld Spawns can also end up inside certain indoors so those need to be handled as well
-    # Allowing child to enter Spirit from the boss would severely complicate key logic
-    CHILD_FORBIDDEN = ['OGC Great Fairy Fountain -> Castle Grounds', 'GV Carpenter Tent -> GV Fortress Side', 'Ganons Castle Lobby -> Castle Grounds', 'Bongo Bongo Boss Room -> Shadow Temple Before Boss', 'Twinrova Boss Room -> Spirit Temple Before Boss']
-    ADULT_FORBIDDEN = ['HC Great Fairy Fountain -> Castle Grounds', 'HC Storms Grotto -> Castle Grounds', 'Bongo Bongo Boss Room -> Shadow Temple Before Boss', 'Twinrova Boss Room -> Spirit Temple Before Boss']
-    if world.dungeon_mq['Forest Temple'] and 'Forest Temple' in world.settings.dungeon_shortcuts:
-        CHILD_FORBIDDEN.append('Phantom Ganon Boss Room -> Forest Temple Before Boss')
-        ADULT_FORBIDDEN.append('Phantom Ganon Boss Room -> Forest Temple Before Boss')
+    CHILD_FORBIDDEN, ADULT_FORBIDDEN = forbidden_entrances(world)
 
     for entrance in world.get_shufflable_entrances():
         if entrance.shuffled:
             if entrance.replaces:
-                if entrance.replaces.name in CHILD_FORBIDDEN and not entrance_unreachable_as(entrance, 'child', already_checked=[entrance.replaces.reverse]):
+                if entrance.replaces.name in CHILD_FORBIDDEN and not cached_entrance_unreachable_as(entrance, 'child', entrance.replaces.reverse):
                     raise EntranceShuffleError('%s is replaced by an entrance with a potential child access' % entrance.replaces.name)
-                elif entrance.replaces.name in ADULT_FORBIDDEN and not entrance_unreachable_as(entrance, 'adult', already_checked=[entrance.replaces.reverse]):
+                elif entrance.replaces.name in ADULT_FORBIDDEN and not cached_entrance_unreachable_as(entrance, 'adult', entrance.replaces.reverse):
                     raise EntranceShuffleError('%s is replaced by an entrance with a potential adult access' % entrance.replaces.name)
         else:
-            if entrance.name in CHILD_FORBIDDEN and not entrance_unreachable_as(entrance, 'child', already_checked=[entrance.reverse]):
+            if entrance.name in CHILD_FORBIDDEN and not cached_entrance_unreachable_as(entrance, 'child', entrance.reverse):
                 raise EntranceShuffleError('%s is potentially accessible as child' % entrance.name)
-            elif entrance.name in ADULT_FORBIDDEN and not entrance_unreachable_as(entrance, 'adult', already_checked=[entrance.reverse]):
+            elif entrance.name in ADULT_FORBIDDEN and not cached_entrance_unreachable_as(entrance, 'adult', entrance.reverse):
                 raise EntranceShuffleError('%s is potentially accessible as adult' % entrance.name)
 
     if locations_to_ensure_reachable:
-        max_search = Search.max_explore([w.state for w in worlds], itempool)
+        max_search = validation_search('max', worlds, itempool, collect_locations=True)
         if world.check_beatable_only:
             if worlds[0].settings.reachable_locations == 'goals':
                 # If this entrance is required for a goal, it must be placed somewhere reachable.
@@ -955,42 +1272,31 @@ def validate_world(world: World, worlds: list[World], entrance_placed: Optional[
             # All entrances must be placed somewhere reachable.
             perform_access_check = True
         if perform_access_check:
+            max_search = max_search.copy()
             max_search.visit_locations(locations_to_ensure_reachable)
             for location in locations_to_ensure_reachable:
                 if not max_search.visited(location):
                     raise EntranceShuffleError('%s is unreachable' % location.name)
 
-    if (
-        world.shuffle_interior_entrances and (
-            (world.dungeon_rewards_hinted and (world.mixed_pools_bosses or world.settings.shuffle_dungeon_rewards in ('regional', 'overworld', 'anywhere')))
-            or any(hint_type in world.settings.misc_hints for hint_type in misc_item_hint_table) or world.settings.hints != 'none'
-        ) and (entrance_placed is None or entrance_placed.type in ['Interior', 'SpecialInterior'])
-    ):
-        # Ensure Kak Potion Shop entrances are in the same hint area so there is no ambiguity as to which entrance is used for hints
-        potion_front_entrance = get_entrance_replacing(world.get_region('Kak Potion Shop Front'), 'Kakariko Village -> Kak Potion Shop Front')
-        potion_back_entrance = get_entrance_replacing(world.get_region('Kak Potion Shop Back'), 'Kak Backyard -> Kak Potion Shop Back')
-        if potion_front_entrance is not None and potion_back_entrance is not None and not same_hint_area(potion_front_entrance, potion_back_entrance):
-            raise EntranceShuffleError('Kak Potion Shop entrances are not in the same hint area')
-
-        # When cows are shuffled, ensure the same thing for Impa's House, since the cow is reachable from both sides
-        if world.settings.shuffle_cows:
-            impas_front_entrance = get_entrance_replacing(world.get_region('Kak Impas House'), 'Kakariko Village -> Kak Impas House')
-            impas_back_entrance = get_entrance_replacing(world.get_region('Kak Impas House Back'), 'Kak Impas Ledge -> Kak Impas House Back')
-            if impas_front_entrance is not None and impas_back_entrance is not None and not same_hint_area(impas_front_entrance, impas_back_entrance):
-                raise EntranceShuffleError('Kak Impas House entrances are not in the same hint area')
+    if entrance_placed is None or entrance_placed.type in ['Interior', 'SpecialInterior']:
+        for (front_region, front_name), (back_region, back_name), interior in same_hint_area_entrances(world):
+            front_entrance = get_entrance_replacing(world.get_region(front_region), front_name)
+            back_entrance = get_entrance_replacing(world.get_region(back_region), back_name)
+            if front_entrance is not None and back_entrance is not None and not same_hint_area(front_entrance, back_entrance):
+                raise EntranceShuffleError('%s entrances are not in the same hint area' % interior)
 
     if (world.shuffle_special_interior_entrances or world.settings.shuffle_overworld_entrances or world.settings.spawn_positions) and \
        (entrance_placed == None or entrance_placed.type in ('SpecialInterior', 'Hideout', 'Overworld', 'OverworldOneWay', 'Spawn', 'WarpSong', 'OwlDrop')):
         # At least one valid starting region with all basic refills should be reachable without using any items at the beginning of the seed
         # Note this creates new empty states rather than reuse the worlds' states (which already have starting items)
-        no_items_search = Search([State(w) for w in worlds])
+        no_items_search = validation_search('no items', worlds, starting_items=False)
 
         valid_starting_regions = ('Kokiri Forest', 'Kakariko Village')
         if not any(no_items_search.can_reach(world.get_region(region)) for region in valid_starting_regions):
             raise EntranceShuffleError('Invalid starting area')
 
         # Check that a region where time passes is always reachable as both ages without having collected any items
-        time_travel_search = Search.with_items([w.state for w in worlds], [ItemFactory('Time Travel', world=w) for w in worlds])
+        time_travel_search = validation_search('time travel', worlds, [ItemFactory('Time Travel', world=w) for w in worlds])
 
         if not (any(region for region in time_travel_search.reachable_regions('child') if region.time_passes and region.world == world) and
                 any(region for region in time_travel_search.reachable_regions('adult') if region.time_passes and region.world == world)):
@@ -1008,7 +1314,7 @@ def validate_world(world: World, worlds: list[World], entrance_placed: Optional[
         # The Big Poe Shop should always be accessible as adult without the need to use any bottles
         # This is important to ensure that players can never lock their only bottles by filling them with Big Poes they can't sell
         # We can use starting items in this check as long as there are no exits requiring the use of a bottle without refills
-        time_travel_search = Search.with_items([w.state for w in worlds], [ItemFactory('Time Travel', world=w) for w in worlds])
+        time_travel_search = validation_search('time travel', worlds, [ItemFactory('Time Travel', world=w) for w in worlds])
 
         if not time_travel_search.can_reach(world.get_region('Market Guard House'), age='adult'):
             raise EntranceShuffleError('Big Poe Shop access is not guaranteed as adult')
@@ -1031,13 +1337,55 @@ def validate_world(world: World, worlds: list[World], entrance_placed: Optional[
                     pass
 
 
+# Returns whether or not we can affirm the entrance can never be accessed as the given age, without going through the ignored entrance.
+# The result only depends on the entrances of the regions the check goes through, so it is kept until one of them gains or loses an entrance.
+def cached_entrance_unreachable_as(entrance: Entrance, age: str, ignored: Optional[Entrance]) -> bool:
+    unreachable = entrance_type_unreachable_as(entrance, age)
+    if unreachable is not None:
+        return unreachable
+
+    key = (entrance, age, ignored)
+    cached = unreachable_as_results.get(key)
+    if cached is not None:
+        if all(region.entrances_version == version for region, version in cached[1]):
+            return cached[0]
+        # Keep the result with the change that invalidated it, in case that change is rolled back
+        if connection_journal:
+            next(reversed(connection_journal.values()))[2].setdefault(key, cached)
+    regions_checked = {}
+    unreachable = entrance_unreachable_as(entrance, age, [ignored], regions_checked)
+    unreachable_as_results[key] = (unreachable, tuple(regions_checked.items()))
+    return unreachable
+
+
 # Returns whether or not we can affirm the entrance can never be accessed as the given age
-def entrance_unreachable_as(entrance: Entrance, age: str, already_checked: Optional[list[Entrance]] = None) -> bool:
+def entrance_unreachable_as(entrance: Entrance, age: str, already_checked: Optional[list[Entrance]] = None,
+                            regions_checked: Optional[dict[Region, int]] = None) -> bool:
     if already_checked is None:
         already_checked = []
 
     already_checked.append(entrance)
 
+    unreachable = entrance_type_unreachable_as(entrance, age)
+    if unreachable is not None:
+        return unreachable
+
+    # Other entrances such as Interior, Dungeon or Grotto are fine unless they have a parent which is one of the above cases
+    # Recursively check parent entrances to verify that they are also not reachable as the wrong age
+    if regions_checked is not None:
+        regions_checked[entrance.parent_region] = entrance.parent_region.entrances_version
+    for parent_entrance in entrance.parent_region.entrances:
+        if parent_entrance in already_checked: continue
+        unreachable = entrance_unreachable_as(parent_entrance, age, already_checked, regions_checked)
+        if not unreachable:
+            return False
+
+    return True
+
+
+# Returns whether the entrance itself can be affirmed to never be accessed as the given age,
+# or None if that depends on the entrances of its parent region
+def entrance_type_unreachable_as(entrance: Entrance, age: str) -> Optional[bool]:
     # The following cases determine when we say an entrance is not safe to affirm unreachable as the given age
     if entrance.type in ('WarpSong', 'OverworldOneWay', 'Overworld'):
         # Note that we consider all overworld entrances as potentially accessible as both ages, to be completely safe
@@ -1048,16 +1396,7 @@ def entrance_unreachable_as(entrance: Entrance, age: str, already_checked: Optio
         return age == 'adult'
     elif entrance.name == 'Adult Spawn -> Temple of Time':
         return age == 'child'
-
-    # Other entrances such as Interior, Dungeon or Grotto are fine unless they have a parent which is one of the above cases
-    # Recursively check parent entrances to verify that they are also not reachable as the wrong age
-    for parent_entrance in entrance.parent_region.entrances:
-        if parent_entrance in already_checked: continue
-        unreachable = entrance_unreachable_as(parent_entrance, age, already_checked)
-        if not unreachable:
-            return False
-
-    return True
+    return None
 
 
 # Returns whether two entrances are in the same hint area
@@ -1087,24 +1426,43 @@ def get_entrance_replacing(region: Region, entrance_name: str) -> Optional[Entra
 
 # Change connections between an entrance and a target assumed entrance, in order to test the connections afterwards if necessary
 def change_connections(entrance: Entrance, target_entrance: Entrance) -> None:
+    regions = [target_entrance.connected_region]
+    if entrance.reverse:
+        regions.append(entrance.reverse.assumed.connected_region)
+    versions_before = {region: region.entrances_version for region in regions}
+
     entrance.connect(target_entrance.disconnect())
     entrance.replaces = target_entrance.replaces
     if entrance.reverse:
         target_entrance.replaces.reverse.connect(entrance.reverse.assumed.disconnect())
         target_entrance.replaces.reverse.replaces = entrance.reverse
 
+    connection_journal[(entrance, target_entrance)] = (versions_before, {region: region.entrances_version for region in regions}, {})
+
 
 # Restore connections between an entrance and a target assumed entrance
 def restore_connections(entrance: Entrance, target_entrance: Entrance) -> None:
+    versions_before, versions_after, replaced_results = connection_journal.pop((entrance, target_entrance), ({}, {}, {}))
+    # Regions whose entrances didn't change again since are about to get exactly the entrances they had before
+    restored_regions = [region for region, version in versions_after.items() if region.entrances_version == version]
+
     target_entrance.connect(entrance.disconnect())
     entrance.replaces = None
     if entrance.reverse:
         entrance.reverse.assumed.connect(target_entrance.replaces.reverse.disconnect())
         target_entrance.replaces.reverse.replaces = None
 
+    # So they get their versions back, along with the results derived from their entrances at the time
+    for region in restored_regions:
+        region.entrances_version = versions_before[region]
+    for key, result in replaced_results.items():
+        if all(region.entrances_version == version for region, version in result[1]):
+            unreachable_as_results[key] = result
+
 
 # Confirm the replacement of a target entrance by a new entrance, logging the new connections and completely deleting the target entrances
 def confirm_replacement(entrance: Entrance, target_entrance: Entrance) -> None:
+    connection_journal.pop((entrance, target_entrance), None)
     delete_target_entrance(target_entrance)
     logging.getLogger('').debug('Connected %s To %s [World %d]', entrance, entrance.connected_region, entrance.world.id)
     if entrance.reverse:
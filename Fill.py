@@ -1,6 +1,7 @@
 from __future__ import annotations
 import random
 import logging
+from collections.abc import Callable, Iterator
 from typing import TYPE_CHECKING, Optional
 
 from Hints import HintArea
@@ -17,6 +18,9 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger('')
 
+# The number of the latest placements fill_restrictive undoes when it backtracks.
+BACKTRACK_PLACEMENTS: int = 10
+
 
 class ShuffleError(RuntimeError):
     pass
@@ -26,8 +30,34 @@ class FillError(ShuffleError):
     pass
 
 
+# Whether items can be placed at locations, ignoring reachability (see
+# Location.can_fill_fast). Items with the same name and world can be placed
+# at the same locations, so a fill only checks each location once for
+# every kind of item, however many copies of it there are.
+class FillableLocations:
+    def __init__(self) -> None:
+        self.results: dict[tuple[str, int], dict[Location, bool]] = {}
+
+    def can_fill_fast(self, location: Location, item: Item) -> bool:
+        key = (item.name, item.world.id)
+        results = self.results.get(key)
+        if results is None:
+            results = self.results[key] = {}
+        result = results.get(location)
+        if result is None:
+            result = results[location] = location.can_fill_fast(item)
+        return result
+
+    # Location.can_fill without the access check.
+    def can_fill(self, location: Location, item: Item) -> bool:
+        if location.minor_only and item.majoritem:
+            return False
+        return not location.is_disabled and self.can_fill_fast(location, item)
+
+
 # Places all items into the world
-def distribute_items_restrictive(worlds: list[World], fill_locations: Optional[list[Location]] = None) -> None:
+# Returns how many times the progression fill backtracked instead of failing.
+def distribute_items_restrictive(worlds: list[World], fill_locations: Optional[list[Location]] = None) -> int:
     if worlds[0].settings.shuffle_song_items == 'song':
         song_location_names = location_groups['Song']
     elif worlds[0].settings.shuffle_song_items == 'dungeon':
@@ -190,7 +220,7 @@ def distribute_items_restrictive(worlds: list[World], fill_locations: Optional[l
     # Items in this group will check for reachability and will be placed
     # such that the game is guaranteed beatable.
     logger.info('Placing progression items.')
-    fill_restrictive(worlds, search, fill_locations, progitempool)
+    backtracked = fill_restrictive(worlds, search, fill_locations, progitempool, backtracks=worlds[0].settings.fill_backtracks)
     search.collect_locations()
 
     # Place all priority items.
@@ -234,6 +264,8 @@ def distribute_items_restrictive(worlds: list[World], fill_locations: Optional[l
                 elif world.maximum_wallets < 1 and location.price > 99:
                     world.maximum_wallets = 1
 
+    return backtracked
+
 
 # Places restricted dungeon items into the worlds. To ensure there is room for them.
 # they are placed first, so it will assume all other items are reachable
@@ -285,6 +317,7 @@ def fill_dungeon_unique_item(worlds: list[World], search: Search, fill_locations
     base_search = search.copy()
     base_search.collect_all(minor_items)
     base_search.collect_locations()
+    fillable = FillableLocations()
     all_dungeon_locations = []
 
     # iterate of all the dungeons in a random order, placing the item there
@@ -311,7 +344,7 @@ def fill_dungeon_unique_item(worlds: list[World], search: Search, fill_locations
 
         # place 1 item into the dungeon
         try:
-            fill_restrictive(worlds, base_search, dungeon_locations, major_items, 1)
+            fill_restrictive(worlds, base_search, dungeon_locations, major_items, 1, fillable)
         except FillError as e:
             raise FillError(f'Could not place a major item in {dungeon} because there are no remaining locations in the dungeon. If you have excluded some of the locations in this dungeon, try reincluding one.') from e
 
@@ -354,6 +387,7 @@ def fill_ownworld_restrictive(worlds: list[World], search: Search, locations: li
         unplaced_prizes = [item for item in unplaced_prizes if item not in prizepool_dict[world.id]]
         base_search = search.copy()
         base_search.collect_all(itempool + unplaced_prizes)
+        fillable = FillableLocations()
 
         world_attempts = attempts
         while world_attempts:
@@ -362,7 +396,7 @@ def fill_ownworld_restrictive(worlds: list[World], search: Search, locations: li
                 prizepool = list(prizepool_dict[world.id])
                 prize_locs = list(prize_locs_dict[world.id])
                 random.shuffle(prizepool)
-                fill_restrictive(worlds, base_search, prize_locs, prizepool)
+                fill_restrictive(worlds, base_search, prize_locs, prizepool, fillable=fillable)
 
                 logger.info("Placed %s items for world %s.", description, (world.id+1))
             except FillError as e:
@@ -395,8 +429,19 @@ def fill_ownworld_restrictive(worlds: list[World], search: Search, locations: li
 # This function will modify the location and itempool arguments. placed items and
 # filled locations will be removed. If this returns an error, then the state of
 # those two lists cannot be guaranteed.
-def fill_restrictive(worlds: list[World], base_search: Search, locations: list[Location], itempool: list[Item], count: int = -1) -> None:
+#
+# fillable can be shared by the fills of the same items into the same locations.
+#
+# When an item can't be placed, the fill undoes its last placements and places
+# those items again in a new order, up to backtracks times, before it gives up.
+# Returns the number of times it backtracked.
+def fill_restrictive(worlds: list[World], base_search: Search, locations: list[Location], itempool: list[Item], count: int = -1,
+                     fillable: Optional[FillableLocations] = None, backtracks: int = 0) -> int:
     unplaced_items = []
+    fillable = fillable or FillableLocations()
+    # The location, item, their prices before, and whether the location was pending, of every placement.
+    placements: list[tuple[Location, Item, Optional[int], Optional[int], bool]] = []
+    backtracked = 0
 
     # don't run over this search, just keep it as an item collection
     items_search = base_search.copy()
@@ -413,7 +458,7 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
         # get an item and remove it from the itempool
         item_to_place = itempool.pop()
         if item_to_place.priority:
-            l2cations = [l for l in locations if l.can_fill_fast(item_to_place)]
+            l2cations = [l for l in locations if fillable.can_fill_fast(l, item_to_place)]
         elif item_to_place.majoritem:
             l2cations = [l for l in locations if not l.minor_only]
         else:
@@ -422,9 +467,12 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
 
         # generate the max search with every remaining item
         # this will allow us to place this item in a reachable location
+        # The items at the reachable locations are only collected as far as
+        # the checks below need them, see passes_with_spheres.
         items_search.uncollect(item_to_place)
         max_search = items_search.copy()
-        max_search.collect_locations()
+        spheres = iter(max_search.iter_collect_locations())
+        states = max_search.state_list
 
         # perform_access_check checks location reachability
         if worlds[0].check_beatable_only:
@@ -435,7 +483,7 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
             else:
                 # If the game is not beatable without this item, it must be placed somewhere reachable.
                 predicate = State.won
-            perform_access_check = not max_search.can_beat_game(scan_for_items=False, predicate=predicate)
+            perform_access_check = not passes_with_spheres(spheres, lambda: all(map(predicate, states)))
         else:
             # All items must be placed somewhere reachable.
             perform_access_check = True
@@ -443,8 +491,10 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
         # find a location that the item can be placed. It must be a valid location
         # in the world we are placing it (possibly checking for reachability)
         spot_to_fill = None
+        pending = False
         for location in l2cations:
-            if location.can_fill(max_search.state_list[location.world.id], item_to_place, perform_access_check):
+            if fillable.can_fill(location, item_to_place) and (
+                    not perform_access_check or passes_with_spheres(spheres, lambda: max_search.spot_access(location, 'either'))):
                 # for multiworld, make it so that the location is also reachable
                 # in the world the item is for. This is to prevent early restrictions
                 # in one world being placed late in another world. If this is not
@@ -452,7 +502,8 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
                 if location.world.id != item_to_place.world.id:
                     try:
                         source_location = item_to_place.world.get_location(location.name)
-                        if not source_location.can_fill(max_search.state_list[item_to_place.world.id], item_to_place, perform_access_check):
+                        if not (fillable.can_fill(source_location, item_to_place) and (
+                                not perform_access_check or passes_with_spheres(spheres, lambda: max_search.spot_access(source_location, 'either')))):
                             # location wasn't reachable in item's world, so skip it
                             continue
                     except KeyError:
@@ -463,7 +514,7 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
                         while parent_region:
                             try:
                                 source_region = item_to_place.world.get_region(parent_region.name)
-                                can_reach = max_search.can_reach(source_region)
+                                can_reach = passes_with_spheres(spheres, lambda: max_search.can_reach(source_region))
                                 break
                             except KeyError:
                                 parent_region = parent_region.entrances[0].parent_region
@@ -471,9 +522,10 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
                             continue
 
                 if location.disabled == DisableType.PENDING:
-                    if not max_search.can_beat_game(False):
+                    if not passes_with_spheres(spheres, lambda: all(map(State.won, states))):
                         continue
                     location.disabled = DisableType.DISABLED
+                    pending = True
 
                 # location is reachable (and reachable in item's world), so place item here
                 spot_to_fill = location
@@ -487,11 +539,35 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
                 unplaced_items.append(item_to_place)
                 items_search.collect(item_to_place)
                 continue
+            elif backtracks > 0 and placements:
+                backtracks -= 1
+                backtracked += 1
+                logger.debug('Could not place %s [World %d], undoing the last %d placements.', item_to_place, item_to_place.world.id + 1, min(len(placements), BACKTRACK_PLACEMENTS))
+                # Items are popped from the end of the pool, so putting the item back,
+                # then the undone items from the latest placement to the earliest,
+                # returns each of them to where it was in the pool.
+                itempool.append(item_to_place)
+                items_search.collect(item_to_place)
+                for _ in range(min(len(placements), BACKTRACK_PLACEMENTS)):
+                    location, item, location_price, item_price, pending = placements.pop()
+                    location.item = None
+                    item.location = None
+                    location.price = location_price
+                    item.price = item_price
+                    if pending:
+                        location.disabled = DisableType.PENDING
+                    locations.append(location)
+                    itempool.append(item)
+                    items_search.collect(item)
+                    count += 1
+                continue
             else:
                 # we expect all items to be placed
-                raise FillError(f'Game unbeatable: No more spots to place {item_to_place} [World {item_to_place.world.id + 1}] from {len(l2cations)} locations ({len(locations)} total); {len(itempool)} other items left to place, plus {len(unplaced_items)} skipped')
+                raise FillError(f'Game unbeatable: No more spots to place {item_to_place} [World {item_to_place.world.id + 1}] from {len(l2cations)} locations ({len(locations)} total); {len(itempool)} other items left to place, plus {len(unplaced_items)} skipped'
+                                + (f', after backtracking {backtracked} times' if backtracked else ''))
 
         # Place the item in the world and continue
+        placements.append((spot_to_fill, item_to_place, spot_to_fill.price, item_to_place.price, pending))
         spot_to_fill.world.push_item(spot_to_fill, item_to_place)
         locations.remove(spot_to_fill)
 
@@ -505,20 +581,36 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
         raise FillError(f'Could not place all the items. {len(itempool)} remaining to be placed.')
     # re-add unplaced items that were skipped
     itempool.extend(unplaced_items)
+    return backtracked
+
+
+# Returns whether the check passes once the search has collected every item it can
+# reach, with spheres from Search.iter_collect_locations. Collecting more items can
+# only make more locations reachable, so only as many spheres are collected as it
+# takes for the check to pass, and the rest are left for the next check.
+def passes_with_spheres(spheres: Iterator[None], check: Callable[[], bool]) -> bool:
+    if check():
+        return True
+    for _ in spheres:
+        if check():
+            return True
+    # The items of the last sphere were collected after it started.
+    return check()
 
 
 # This places items in the itempool into the locations
 # It does not check for reachability, only that the item is
 # allowed in the location
 def fill_restrictive_fast(worlds: list[World], locations: list[Location], itempool: list[Item]) -> None:
+    fillable = FillableLocations()
     while itempool and locations:
         item_to_place = itempool.pop()
         random.shuffle(locations)
 
         # get location that allows this item
         spot_to_fill = None
-        for location in locations:
-            if location.can_fill_fast(item_to_place):
+        for index, location in enumerate(locations):
+            if fillable.can_fill_fast(location, item_to_place):
                 spot_to_fill = location
                 break
 
@@ -532,7 +624,7 @@ def fill_restrictive_fast(worlds: list[World], locations: list[Location], itempo
 
         # Place the item in the world and continue
         spot_to_fill.world.push_item(spot_to_fill, item_to_place)
-        locations.remove(spot_to_fill)
+        del locations[index]
 
 
 # this places item in item_pool completely randomly into
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# Writes the pre-parsed form of the logic files that Utils.read_logic_file
+# loads instead of parsing the json. The randomizer writes it again by itself
+# once a logic file changed, running this only saves that first run the work.
+from __future__ import annotations
+import hashlib
+import marshal
+import os
+import sys
+from typing import Any
+
+from Utils import LOGIC_BINARY_MAGIC, data_path, logic_binary_path, parse_logic_file
+
+
+def logic_files() -> list[str]:
+    files = [data_path('LogicHelpers.json')]
+    for logic_folder in ('World', 'Glitched World'):
+        files += sorted(os.path.join(data_path(logic_folder), filename)
+                        for filename in os.listdir(data_path(logic_folder)) if filename.endswith('.json'))
+    return files
+
+
+# Region, location and event names are looked up in dictionaries again and
+# again, and identical rules are only stored once.
+def intern_logic(logic: Any) -> Any:
+    if isinstance(logic, dict):
+        return {sys.intern(key): intern_logic(value) for key, value in logic.items()}
+    if isinstance(logic, list):
+        return [intern_logic(value) for value in logic]
+    if isinstance(logic, str):
+        return sys.intern(logic)
+    return logic
+
+
+def create_logic_binary(path: str) -> None:
+    index = {}
+    contents = []
+    offset = 0
+    for file_path in logic_files():
+        with open(file_path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).digest()
+            stat = os.fstat(f.fileno())
+        content = marshal.dumps(intern_logic(parse_logic_file(file_path)))
+        index[os.path.relpath(file_path, data_path())] = (digest, stat.st_mtime_ns, stat.st_size, offset, len(content))
+        contents.append(content)
+        offset += len(content)
+
+    index_data = marshal.dumps(index)
+    # Write the whole file at once, other processes may be reading it.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(LOGIC_BINARY_MAGIC)
+        f.write(marshal.version.to_bytes(4, 'little'))
+        f.write(len(index_data).to_bytes(4, 'little'))
+        f.write(index_data)
+        for content in contents:
+            f.write(content)
+    os.replace(temp_path, path)
+
+
+def main() -> None:
+    create_logic_binary(logic_binary_path())
+
+
+if __name__ == '__main__':
+    main()
@@ -7,30 +7,37 @@ import platform
 import random
 import shutil
 import time
-import zipfile
-from typing import Optional
+import traceback
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Optional, Any
 
-
-from Cosmetics import CosmeticsLog, patch_cosmetics
 from EntranceShuffle import set_entrances
 from Fill import distribute_items_restrictive, ShuffleError
 from Goals import update_goal_items, replace_goal_names
 from Hints import build_gossip_hints
 from HintList import clear_hint_exclusion_cache, misc_item_hint_table, misc_location_hint_table
+from Item import ItemInfo
 from ItemPool import generate_itempool
-from MBSDIFFPatch import apply_ootr_3_web_patch
-from Models import patch_model_adult, patch_model_child
-from N64Patch import create_patch_file, apply_patch_file
-from Patches import patch_rom
-from Rom import Rom
+from Messages import new_messages
 from Rules import set_rules, set_shop_rules
+from RulesCommon import allowed_globals
+from Search import rule_result_statistics
 from Settings import Settings
 from SettingsList import logic_tricks
 from Spoiler import Spoiler
-from Utils import default_output_path, is_bundled, run_process, data_path
-from World import World
+from Utils import can_fork_attempts, default_output_path, is_bundled, run_process
+from World import World, world_graph_templates
 from version import __version__
 
+# The modules that patch and output the ROM are imported only by the functions
+# that use them, so that runs that don't output a ROM start faster.
+if TYPE_CHECKING:
+    from Cosmetics import CosmeticsLog
+    from Rom import Rom
+
+# Called whenever a generation attempt starts, see --startup_profile in OoTRandomizer.py.
+generation_start_hooks: list[Callable[[], None]] = []
+
 
 def main(settings: Settings, max_attempts: int = 10) -> Spoiler:
     clear_hint_exclusion_cache()
@@ -41,17 +48,20 @@ def main(settings: Settings, max_attempts: int = 10) -> Spoiler:
 
     max_attempts = max(max_attempts, 1)
     spoiler = None
-    for attempt in range(1, max_attempts + 1):
-        try:
-            spoiler = generate(settings)
-            break
-        except ShuffleError as e:
-            logger.warning('Failed attempt %d of %d: %s', attempt, max_attempts, e)
-            if attempt >= max_attempts:
-                raise
-            else:
-                logger.info('Retrying...\n\n')
-            settings.reset_distribution()
+    if settings.speculative_attempts > 1 and max_attempts > 1 and can_fork_attempts():
+        spoiler = generate_speculatively(settings, max_attempts, settings.speculative_attempts)
+    else:
+        for attempt in range(1, max_attempts + 1):
+            try:
+                spoiler = generate(settings)
+                break
+            except ShuffleError as e:
+                logger.warning('Failed attempt %d of %d: %s', attempt, max_attempts, e)
+                if attempt >= max_attempts:
+                    raise
+                else:
+                    logger.info('Retrying...\n\n')
+                settings.reset_distribution()
     if spoiler is None:
         raise RuntimeError("Generation failed.")
     patch_and_output(settings, spoiler, rom)
@@ -59,6 +69,208 @@ def main(settings: Settings, max_attempts: int = 10) -> Spoiler:
     return spoiler
 
 
+# Seed used for the given attempt when attempts are run speculatively.
+# The first attempt keeps the random state left by resolve_settings, so it is
+# identical to the first attempt of the serial loop.
+def attempt_seed(settings: Settings, attempt: int) -> int:
+    return int(hashlib.sha256(f'{settings.numeric_seed}-attempt-{attempt}'.encode('utf-8')).hexdigest(), 16)
+
+
+# Runs the first attempt in this process while the next ones run in forked worker
+# processes, up to parallel_attempts at once. Each attempt has its own seed, so the
+# winner is always the lowest numbered attempt that succeeds, no matter which one
+# finishes first. Workers only report whether their attempt succeeded; the winning
+# attempt is then generated again in this process to get its spoiler. Should that
+# fail after all, the next attempts are tried in the same way.
+def generate_speculatively(settings: Settings, max_attempts: int, parallel_attempts: int) -> Spoiler:
+    import multiprocessing.connection
+    logger = logging.getLogger('')
+    context = multiprocessing.get_context('fork')
+    module_state = save_module_state()
+    running: dict[int, tuple[multiprocessing.Process, Any]] = {}
+    results: dict[int, bool] = {}
+    # Attempts that aren't running yet, lowest first. Stopped attempts go back in here.
+    waiting = list(range(2, max_attempts + 1))
+
+    def launch_attempts(below: int) -> None:
+        while waiting and waiting[0] < below and len(running) < parallel_attempts - 1:
+            attempt = waiting.pop(0)
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=speculative_attempt, args=(settings, module_state, attempt, sender), daemon=True)
+            process.start()
+            sender.close()
+            running[attempt] = (process, receiver)
+
+    def stop_attempts(attempts: list[int]) -> None:
+        for attempt in attempts:
+            process, receiver = running.pop(attempt)
+            process.terminate()
+            process.join()
+            receiver.close()
+            waiting.append(attempt)
+        waiting.sort()
+
+    launch_attempts(max_attempts + 1)
+    try:
+        try:
+            return generate(settings)
+        except ShuffleError as e:
+            logger.warning('Failed attempt %d of %d: %s', 1, max_attempts, e)
+            results[1] = False
+
+        while True:
+            winner = 1
+            while results.get(winner) is False:
+                winner += 1
+            if winner > max_attempts:
+                raise ShuffleError(f'All {max_attempts} attempts failed.')
+            if results.get(winner):
+                logger.info('Attempt %d of %d succeeded, generating it again.\n\n', winner, max_attempts)
+                restore_module_state(module_state)
+                settings.reset_distribution()
+                random.seed(attempt_seed(settings, winner))
+                try:
+                    return generate(settings)
+                except ShuffleError as e:
+                    logger.warning('Failed attempt %d of %d when generating it again: %s', winner, max_attempts, e)
+                    results[winner] = False
+                    continue
+
+            # Attempts after a successful one can never win.
+            successes = [attempt for attempt, success in results.items() if success]
+            first_success = min(successes, default=max_attempts + 1)
+            stop_attempts([attempt for attempt in running if attempt > first_success])
+            launch_attempts(first_success)
+
+            receivers = {receiver: attempt for attempt, (_, receiver) in running.items()}
+            for receiver in multiprocessing.connection.wait(list(receivers)):
+                attempt = receivers[receiver]
+                try:
+                    success, error = receiver.recv()
+                except EOFError:
+                    success, error = False, 'Worker process exited unexpectedly.'
+                running[attempt][0].join()
+                receiver.close()
+                del running[attempt]
+                results[attempt] = success
+                if not success:
+                    logger.warning('Failed attempt %d of %d: %s', attempt, max_attempts, error)
+    finally:
+        stop_attempts(list(running))
+
+
+# Workers may be forked after this process generated attempts itself, so they
+# start from the same module state and distribution as the first attempt.
+def speculative_attempt(settings: Settings, module_state: dict[str, Any], attempt: int, connection: Any) -> None:
+    # The generation messages are logged again by the process that generates the winning attempt.
+    logging.disable(logging.WARNING)
+    restore_module_state(module_state)
+    settings.reset_distribution()
+    random.seed(attempt_seed(settings, attempt))
+    try:
+        generate(settings)
+        connection.send((True, None))
+    except ShuffleError as e:
+        connection.send((False, str(e)))
+    except Exception:
+        connection.send((False, traceback.format_exc()))
+    finally:
+        connection.close()
+
+
+# Generates settings.count seeds spread over a pool of worker processes.
+# Seeds are named the same way as in the serial loop of OoTRandomizer.start
+# and are reported in order, regardless of which worker finishes first.
+def batch_main(settings: Settings) -> None:
+    import logging.handlers
+    import multiprocessing
+    logger = logging.getLogger('')
+    start = time.time()
+
+    count = settings.count
+    processes = settings.processes if settings.processes > 0 else (os.cpu_count() or 1)
+    processes = max(1, min(processes, count))
+    seeds = [settings.seed + '-' + str(i) for i in range(count)]
+    # The json form of the settings replaces values which can't be pickled, such as starting_items.
+    settings_dict = {**settings.settings_dict, **settings.to_json()}
+    tasks = [(settings_dict, settings.custom_seed, seed) for seed in seeds]
+
+    logger.info('Generating %d seeds using %d processes.', count, processes)
+    failures = []
+    # The workers send their log records back here, to be handled like the ones of this process.
+    log_queue = multiprocessing.Queue()
+    log_listener = logging.handlers.QueueListener(log_queue, *logger.handlers, respect_handler_level=True)
+    log_listener.start()
+    try:
+        with multiprocessing.Pool(processes, initializer=batch_worker_init, initargs=(log_queue, logger.getEffectiveLevel())) as pool:
+            for i, (seed, error) in enumerate(pool.imap(batch_worker, tasks)):
+                if error is None:
+                    logger.info('Seed %d of %d (%s): Success', i + 1, count, seed)
+                else:
+                    logger.error('Seed %d of %d (%s): Failed: %s', i + 1, count, seed, error)
+                    failures.append((seed, error))
+    finally:
+        log_listener.stop()
+
+    logger.info('Generated %d of %d seeds in %.2f seconds.', count - len(failures), count, time.time() - start)
+    if failures:
+        for seed, error in failures:
+            logger.error('Failed seed %s: %s', seed, error)
+        raise Exception(f'{len(failures)} of {count} seeds failed to generate.')
+
+
+# The module state of a batch worker process before it generated any seed.
+batch_worker_module_state: dict[str, Any] = {}
+
+
+def batch_worker_init(log_queue: Any, loglevel: int) -> None:
+    import logging.handlers
+    logger = logging.getLogger('')
+    # Forked workers inherit the handlers of the parent, which handles their records instead.
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('[%(processName)s] %(message)s'))
+    logger.addHandler(queue_handler)
+    logger.setLevel(loglevel)
+    batch_worker_module_state.update(save_module_state())
+
+
+def batch_worker(task: tuple[dict[str, Any], bool, str]) -> tuple[str, Optional[str]]:
+    settings_dict, custom_seed, seed = task
+    restore_module_state(batch_worker_module_state)
+    try:
+        settings = Settings(settings_dict)
+        settings.custom_seed = custom_seed
+        settings.update_seed(seed)
+        main(settings)
+    except Exception as ex:
+        logging.getLogger('').exception(ex)
+        return seed, f'{type(ex).__name__}: {ex}'
+    return seed, None
+
+
+# Module level state that grows while generating a seed. Processes that generate
+# several seeds restore it between seeds, so that each seed is generated as if
+# it were the first one in the process.
+def save_module_state() -> dict[str, Any]:
+    return {
+        'events': dict(ItemInfo.events),
+        'solver_ids': dict(ItemInfo.solver_ids),
+        'allowed_globals': dict(allowed_globals),
+    }
+
+
+def restore_module_state(module_state: dict[str, Any]) -> None:
+    for name, saved in module_state.items():
+        current = allowed_globals if name == 'allowed_globals' else getattr(ItemInfo, name)
+        current.clear()
+        current.update(saved)
+    clear_hint_exclusion_cache()
+    new_messages.clear()
+    world_graph_templates.clear()
+
+
 def resolve_settings(settings: Settings) -> Optional[Rom]:
     logger = logging.getLogger('')
 
@@ -80,6 +292,7 @@ def resolve_settings(settings: Settings) -> Optional[Rom]:
         raise Exception('You must have at least one output type or spoiler log enabled to produce anything.')
 
     if using_rom:
+        from Rom import Rom
         rom = Rom(settings.rom)
     else:
         rom = None
@@ -111,13 +324,20 @@ def resolve_settings(settings: Settings) -> Optional[Rom]:
 
 
 def generate(settings: Settings) -> Spoiler:
+    for hook in generation_start_hooks:
+        hook()
+    rule_result_statistics.clear()
     worlds = build_world_graphs(settings)
     place_items(worlds)
     for world in worlds:
         world.distribution.configure_effective_starting_items(worlds, world)
     if worlds[0].enable_goal_hints:
         replace_goal_names(worlds)
-    return make_spoiler(settings, worlds)
+    spoiler = make_spoiler(settings, worlds)
+    if settings.rule_result_cache_size > 0:
+        logging.getLogger('').info('Access rule result cache: %d hits, %d misses.',
+                                   rule_result_statistics['hits'], rule_result_statistics['misses'])
+    return spoiler
 
 
 def build_world_graphs(settings: Settings) -> list[World]:
@@ -130,20 +350,7 @@ def build_world_graphs(settings: Settings) -> list[World]:
     for id, world in enumerate(worlds):
         logger.info('Generating World %d.' % (id + 1))
         logger.info('Creating Overworld')
-
-        # Load common json rule files (those used regardless of MQ status)
-        if settings.logic_rules == 'glitched':
-            path = 'Glitched World'
-        else:
-            path = 'World'
-        path = data_path(path)
-
-        for filename in ('Overworld.json', 'Bosses.json'):
-            savewarps_to_connect += world.load_regions_from_json(os.path.join(path, filename))
-
-        # Compile the json rules based on settings
-        savewarps_to_connect += world.create_dungeons()
-        world.create_internal_locations()
+        savewarps_to_connect += world.create_region_graph()
 
         if settings.shopsanity != 'off':
             world.random_shop_prices()
@@ -170,10 +377,13 @@ def build_world_graphs(settings: Settings) -> list[World]:
     return worlds
 
 
-def place_items(worlds: list[World]) -> None:
+def place_items(worlds: list[World]) -> int:
     logger = logging.getLogger('')
     logger.info('Fill the world.')
-    distribute_items_restrictive(worlds)
+    backtracked = distribute_items_restrictive(worlds)
+    if backtracked:
+        logger.info('The fill backtracked %d times instead of starting the attempt over.', backtracked)
+    return backtracked
 
 
 def make_spoiler(settings: Settings, worlds: list[World]) -> Spoiler:
@@ -194,6 +404,10 @@ def make_spoiler(settings: Settings, worlds: list[World]) -> Spoiler:
 
 
 def prepare_rom(spoiler: Spoiler, world: World, rom: Rom, settings: Settings, rng_state: Optional[tuple] = None, restore: bool = True) -> CosmeticsLog:
+    from Cosmetics import patch_cosmetics
+    from Models import patch_model_adult, patch_model_child
+    from Patches import patch_rom
+
     if rng_state:
         random.setstate(rng_state)
         # Use different seeds for each world when patching.
@@ -288,6 +502,9 @@ def generate_wad(wad_file: str, rom_file: str, output_file: str, channel_title:
 
 
 def patch_and_output(settings: Settings, spoiler: Spoiler, rom: Optional[Rom]) -> None:
+    import zipfile
+    from N64Patch import create_patch_file
+
     logger = logging.getLogger('')
     worlds = spoiler.worlds
     cosmetics_log = None
@@ -429,6 +646,12 @@ def patch_and_output(settings: Settings, spoiler: Spoiler, rom: Optional[Rom]) -
 
 
 def from_patch_file(settings: Settings) -> None:
+    from Cosmetics import patch_cosmetics
+    from MBSDIFFPatch import apply_ootr_3_web_patch
+    from Models import patch_model_adult, patch_model_child
+    from N64Patch import create_patch_file, apply_patch_file
+    from Rom import Rom
+
     start = time.process_time()
     logger = logging.getLogger('')
 
@@ -510,6 +733,11 @@ def from_patch_file(settings: Settings) -> None:
 
 
 def cosmetic_patch(settings: Settings) -> None:
+    from Cosmetics import patch_cosmetics
+    from Models import patch_model_adult, patch_model_child
+    from N64Patch import apply_patch_file, create_patch_file
+    from Rom import Rom
+
     start = time.process_time()
     logger = logging.getLogger('')
 
@@ -572,6 +800,9 @@ def cosmetic_patch(settings: Settings) -> None:
 
 
 def diff_roms(settings: Settings, diff_rom_file: str) -> None:
+    from N64Patch import create_patch_file
+    from Rom import Rom
+
     start = time.process_time()
     logger = logging.getLogger('')
 
@@ -5,13 +5,71 @@ if sys.version_info < (3, 8):
     sys.exit(1)
 
 import datetime
+import importlib.machinery
 import logging
 import os
 import time
+from typing import Any, Callable, Optional
 
 
-def start() -> None:
-    from Main import main, from_patch_file, cosmetic_patch, diff_roms
+class StartupProfile:
+    """Times every module imported after it is created, until the first generation step."""
+
+    # Loaders that are created for a single module, so their exec_module can be wrapped.
+    timed_loaders = (importlib.machinery.SourceFileLoader, importlib.machinery.SourcelessFileLoader, importlib.machinery.ExtensionFileLoader)
+
+    def __init__(self) -> None:
+        self.start: float = time.perf_counter()
+        self.modules: list[tuple[str, float, float]] = []
+        self.import_time: float = 0.0
+        # Time spent importing the dependencies of each module being imported.
+        self.dependency_time: list[float] = []
+        self.reported: bool = False
+        sys.meta_path.insert(0, self)
+
+    def find_spec(self, fullname: str, path: Any, target: Any = None) -> Any:
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if isinstance(spec.loader, self.timed_loaders):
+                    spec.loader.exec_module = self.timed(fullname, spec.loader.exec_module)
+                return spec
+        return None
+
+    def timed(self, name: str, exec_module: Callable[[Any], None]) -> Callable[[Any], None]:
+        def timed_exec_module(module: Any) -> None:
+            start = time.perf_counter()
+            self.dependency_time.append(0.0)
+            try:
+                exec_module(module)
+            finally:
+                total = time.perf_counter() - start
+                self.modules.append((name, total, total - self.dependency_time.pop()))
+                if self.dependency_time:
+                    self.dependency_time[-1] += total
+                else:
+                    self.import_time += total
+        return timed_exec_module
+
+    def report(self, step: str = 'first generation step', count: int = 25) -> None:
+        if self.reported:
+            return
+        self.reported = True
+        elapsed = time.perf_counter() - self.start
+        sys.meta_path.remove(self)
+
+        logger = logging.getLogger('')
+        logger.info('Startup profile, slowest of %d imported modules:', len(self.modules))
+        logger.info('%-32s %10s %10s', 'Module', 'Self (ms)', 'Total (ms)')
+        for name, total, own in sorted(self.modules, key=lambda module: module[2], reverse=True)[:count]:
+            logger.info('%-32s %10.1f %10.1f', name, own * 1000, total * 1000)
+        logger.info('Importing modules took %.1f ms.', self.import_time * 1000)
+        logger.info('Time to %s: %.1f ms.\n', step, elapsed * 1000)
+
+
+def start(startup_profile: Optional[StartupProfile] = None) -> None:
     from Settings import get_settings_from_command_line_args
     from Utils import check_version, VersionError, local_path
     settings, gui, args_loglevel, no_log_file, diff_rom = get_settings_from_command_line_args()
@@ -32,6 +90,10 @@ def start() -> None:
         log_file.setFormatter(logging.Formatter('[%(asctime)s] %(message)s', datefmt='%H:%M:%S'))
         logger.addHandler(log_file)
 
+    from Main import main, batch_main, from_patch_file, cosmetic_patch, diff_roms, generation_start_hooks
+    if startup_profile:
+        generation_start_hooks.append(startup_profile.report)
+
     if not settings.check_version:
         try:
             check_version(settings.checked_version)
@@ -48,6 +110,8 @@ def start() -> None:
             cosmetic_patch(settings)
         elif settings.patch_file != '':
             from_patch_file(settings)
+        elif settings.count is not None and settings.count > 1 and settings.processes != 1:
+            batch_main(settings)
         elif settings.count is not None and settings.count > 1:
             orig_seed = settings.seed
             for i in range(settings.count):
@@ -58,7 +122,10 @@ def start() -> None:
     except Exception as ex:
         logger.exception(ex)
         sys.exit(1)
+    finally:
+        if startup_profile:
+            startup_profile.report('finish')
 
 
 if __name__ == '__main__':
-    start()
+    start(StartupProfile() if '--startup_profile' in sys.argv or '--startup-profile' in sys.argv else None)
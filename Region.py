@@ -1,5 +1,6 @@
 from __future__ import annotations
 from enum import Enum, unique
+from itertools import count
 from typing import TYPE_CHECKING, Optional, Any
 
 from ItemList import REWARD_COLORS
@@ -34,6 +35,10 @@ class TimeOfDay:
     ALL: int = DAY | DAMPE
 
 
+# Handed out to regions whenever their entrances change. Numbers are never reused, so a region's number identifies its set of entrances at one point in time
+entrances_versions = count(1)
+
+
 class Region:
     def __init__(self, world: World, name: str, region_type: RegionType = RegionType.Overworld) -> None:
         self.world: World = world
@@ -52,6 +57,8 @@ class Region:
         self.scene: Optional[str] = None
         self.is_boss_room: bool = False
         self.savewarp: Optional[Entrance] = None
+        self.index: Optional[int] = None
+        self.entrances_version: int = 0
 
     def copy(self) -> Region:
         new_region = Region(world=self.world, name=self.name, region_type=self.type)
@@ -72,6 +79,7 @@ class Region:
         new_region.scene = self.scene
         new_region.is_boss_room = self.is_boss_room
         new_region.savewarp = self.savewarp
+        new_region.index = self.index
 
         return new_region
 
@@ -0,0 +1,181 @@
+from __future__ import annotations
+import hashlib
+import importlib.util
+import io
+import logging
+import marshal
+import os
+import pickle
+import sys
+import types
+from typing import TYPE_CHECKING, Any, Optional
+
+from Hints import HintArea
+from Item import Item, ItemInfo
+from RuleParser import rule_profile_path
+from RulesCommon import allowed_globals
+from Utils import data_path, local_path
+from version import __version__
+
+if TYPE_CHECKING:
+    from World import World, WorldGraphTemplate
+
+# Compiled world graphs are saved to disk, so that later runs with the same
+# logic files and settings skip parsing and compiling the access rules. Each
+# cache file is named after a hash of everything the graphs depend on, so
+# changing a logic file or the source of anything in a graph simply stops using
+# the old files.
+CACHE_VERSION: int = 5
+MAX_CACHED_GRAPHS: int = 8
+
+# The modules whose classes, defaults or functions are saved in the graphs, or
+# which decide how rules are compiled.
+CACHED_SOURCE_MODULES: tuple[str, ...] = (
+    'Entrance', 'Hints', 'Item', 'ItemList', 'Location', 'LocationList', 'Region',
+    'RuleParser', 'RulesCommon', 'State', 'World',
+)
+
+# The sha256 of every file hashed into a cache file name, by path. Source files
+# don't change while the randomizer runs, so they are only read once.
+source_digests: dict[str, bytes] = {}
+
+
+def rule_cache_path(world: World, key: tuple) -> str:
+    logic_folder = data_path('Glitched World' if world.settings.logic_rules == 'glitched' else 'World')
+    logic_files = [os.path.join(logic_folder, filename) for filename in ('Overworld.json', 'Bosses.json')]
+    for hint_area in HintArea:
+        if (name := hint_area.dungeon_name) is not None:
+            logic_files.append(os.path.join(logic_folder, name + (' MQ.json' if world.dungeon_mq[name] else '.json')))
+    logic_files.append(data_path('LogicHelpers.json'))
+    if os.path.isfile(rule_profile_path()):
+        logic_files.append(rule_profile_path())
+
+    digest = hashlib.sha256(repr((CACHE_VERSION, __version__, importlib.util.MAGIC_NUMBER, key)).encode('utf-8'))
+    for file_path in logic_files:
+        with open(file_path, 'rb') as f:
+            digest.update(f.read())
+    # Not shipped with bundled builds, which are covered by the version instead.
+    source_folder = os.path.dirname(os.path.realpath(__file__))
+    for module in CACHED_SOURCE_MODULES:
+        file_path = os.path.join(source_folder, module + '.py')
+        if file_path not in source_digests:
+            if not os.path.isfile(file_path):
+                continue
+            with open(file_path, 'rb') as f:
+                source_digests[file_path] = hashlib.sha256(f.read()).digest()
+        digest.update(source_digests[file_path])
+    return os.path.join(local_path('Logs'), 'RuleCache', digest.hexdigest() + '.cache')
+
+
+# Functions can't be pickled, so they are saved as their marshalled code and
+# attributes (like the dependencies of compiled rules).
+# Compiled rules are bound to allowed_globals again when loaded, anything else
+# (the default rules of locations and entrances) to the globals of its module.
+class GraphPickler(pickle.Pickler):
+    def __init__(self, file: io.BytesIO) -> None:
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.functions: list[tuple[bytes, Optional[str], Optional[tuple], Optional[dict[str, Any]], dict[str, Any]]] = []
+        self.function_ids: dict[int, int] = {}
+
+    def persistent_id(self, obj: Any) -> Optional[int]:
+        if not isinstance(obj, types.FunctionType):
+            return None
+        if id(obj) not in self.function_ids:
+            if obj.__closure__:
+                raise pickle.PicklingError(f'Can not cache rule {obj.__code__.co_filename} with a closure')
+            self.function_ids[id(obj)] = len(self.functions)
+            module = None if obj.__globals__ is allowed_globals else obj.__module__
+            self.functions.append((marshal.dumps(obj.__code__), module, obj.__defaults__, obj.__kwdefaults__, obj.__dict__))
+        return self.function_ids[id(obj)]
+
+
+class GraphUnpickler(pickle.Unpickler):
+    def __init__(self, file: io.BytesIO, functions: list[tuple[bytes, Optional[str], Optional[tuple], Optional[dict[str, Any]], dict[str, Any]]]) -> None:
+        super().__init__(file)
+        self.functions: list[types.FunctionType] = []
+        for code, module, defaults, kwdefaults, attributes in functions:
+            function = types.FunctionType(marshal.loads(code), allowed_globals if module is None else sys.modules[module].__dict__, None, defaults)
+            function.__kwdefaults__ = kwdefaults
+            function.__dict__.update(attributes)
+            self.functions.append(function)
+
+    def persistent_load(self, pid: int) -> types.FunctionType:
+        return self.functions[pid]
+
+
+def read_rule_cache(file_path: str) -> list[dict[str, Any]]:
+    with open(file_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def dump_world_graph_template(template: WorldGraphTemplate) -> dict[str, Any]:
+    data = io.BytesIO()
+    pickler = GraphPickler(data)
+    pickler.dump(template)
+    return {
+        'events': list(ItemInfo.events),
+        'solver_ids': dict(ItemInfo.solver_ids),
+        'functions': pickler.functions,
+        'template': data.getvalue(),
+    }
+
+
+def load_world_graph_template(entry: dict[str, Any]) -> WorldGraphTemplate:
+    # Rules refer to the solver ids of the events they use, which have
+    # to be registered before the rules run.
+    for event in entry['events']:
+        Item(event, event=True)
+    # Solver ids are numbered in the order items are first seen, which differs
+    # between processes, so the ids rules read are mapped to those of this one.
+    solver_ids = {solver_id: ItemInfo.solver_ids[name] for name, solver_id in entry['solver_ids'].items()}
+    functions = entry['functions']
+    if any(old != new for old, new in solver_ids.items()):
+        functions = [(code, module, defaults, kwdefaults, remap_solver_ids(attributes, solver_ids))
+                     for code, module, defaults, kwdefaults, attributes in functions]
+    return GraphUnpickler(io.BytesIO(entry['template']), functions).load()
+
+
+def remap_solver_ids(attributes: dict[str, Any], solver_ids: dict[int, int]) -> dict[str, Any]:
+    attributes = dict(attributes)
+    if attributes.get('dependencies') is not None:
+        attributes['dependencies'] = frozenset(solver_ids[solver_id] for solver_id in attributes['dependencies'])
+    if attributes.get('reads') is not None:
+        reads, reads_tod = attributes['reads']
+        attributes['reads'] = frozenset(solver_ids[solver_id] for solver_id in reads), reads_tod
+    return attributes
+
+
+# Returns the graphs saved for the key, or none if they can't be loaded, so
+# that the rules are compiled again instead.
+def load_world_graph_templates(world: World, key: tuple) -> list[WorldGraphTemplate]:
+    from World import WorldGraphTemplate
+    try:
+        file_path = rule_cache_path(world, key)
+        if not os.path.isfile(file_path):
+            return []
+        templates = [load_world_graph_template(entry) for entry in read_rule_cache(file_path)]
+        if not all(isinstance(template, WorldGraphTemplate) for template in templates):
+            raise TypeError(f'{file_path} is not a list of world graphs')
+        return templates
+    except Exception as e:
+        logging.getLogger('').warning('Ignoring rule cache, compiling the rules instead: %s', e)
+        return []
+
+
+def save_world_graph_template(world: World, key: tuple, template: WorldGraphTemplate) -> None:
+    try:
+        file_path = rule_cache_path(world, key)
+        try:
+            entries = read_rule_cache(file_path)[-(MAX_CACHED_GRAPHS - 1):]
+        except Exception:
+            entries = []
+        entries.append(dump_world_graph_template(template))
+
+        # Write the whole file at once, other processes may be reading it.
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        temp_path = f'{file_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(entries, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, file_path)
+    except (OSError, pickle.PicklingError) as e:
+        logging.getLogger('').debug('Could not save rule cache: %s', e)
@@ -1,7 +1,9 @@
 from __future__ import annotations
 import ast
+import json
 import logging
 import re
+import time
 from collections import defaultdict
 from typing import TYPE_CHECKING, Optional, Any
 
@@ -10,7 +12,7 @@ from Item import ItemInfo, Item, make_event_item
 from Location import Location
 from Region import TimeOfDay
 from RulesCommon import AccessRule, allowed_globals, escape_name
-from State import State
+from State import State, function_dependencies
 from Utils import data_path, read_logic_file
 
 if TYPE_CHECKING:
@@ -56,6 +58,266 @@ def isliteral(expr: ast.expr) -> bool:
     return isinstance(expr, ast.Constant)
 
 
+# Returns the solver ids a compiled rule body can read, or None if the rule
+# depends on anything else (the search, the spot, or an unknown State function).
+# The result of a rule with known dependencies only changes when the count of
+# one of them does, which lets the search skip rules that failed before.
+def rule_dependencies(body: ast.AST) -> Optional[frozenset[int]]:
+    reads = rule_reads(body)
+    if reads is None or reads[1]:
+        return None
+    return reads[0]
+
+
+# Returns the solver ids a compiled rule body can read, and whether it asks the
+# search if the spot's region is reachable at a time of day (see at_day), or
+# None if the rule depends on anything else.
+def rule_reads(body: ast.AST) -> Optional[tuple[frozenset[int], bool]]:
+    dependencies = set()
+    reads_tod = False
+    tod_spots = set()
+    for node in ast.walk(body):
+        if isinstance(node, ast.Name) and node.id == 'spot':
+            if id(node) not in tod_spots:
+                return None
+            continue
+        if not isinstance(node, ast.Call):
+            continue
+        if is_tod_check(node):
+            # The nodes are walked breadth first, so the spot is seen after the call.
+            reads_tod = True
+            tod_spots.update(id(child) for child in ast.walk(node.args[0]))
+            continue
+        if not (isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name) and node.func.value.id == 'state'):
+            return None
+        if node.func.attr in ('has', 'has_any_of', 'has_all_of'):
+            items = node.args[0].elts if isinstance(node.args[0], ast.Tuple) else [node.args[0]]
+            for item in items:
+                if not isinstance(item, ast.Name) or item.id not in ItemInfo.solver_ids:
+                    return None
+                dependencies.add(ItemInfo.solver_ids[item.id])
+        elif node.func.attr in function_dependencies:
+            dependencies.update(function_dependencies[node.func.attr])
+        else:
+            return None
+    return frozenset(dependencies), reads_tod
+
+
+# Whether the node is state.search.can_reach(spot.parent_region, ..., tod=...).
+def is_tod_check(node: ast.Call) -> bool:
+    func = node.func
+    return (isinstance(func, ast.Attribute) and func.attr == 'can_reach'
+            and isinstance(func.value, ast.Attribute) and func.value.attr == 'search'
+            and isinstance(func.value.value, ast.Name) and func.value.value.id == 'state'
+            and len(node.args) == 1 and isinstance(node.args[0], ast.Attribute) and node.args[0].attr == 'parent_region'
+            and isinstance(node.args[0].value, ast.Name) and node.args[0].value.id == 'spot'
+            and any(keyword.arg == 'tod' for keyword in node.keywords))
+
+
+# Estimated costs of evaluating rule expressions, used to order the operands
+# of and/or so that the cheap checks run first (see optimize_rule).
+# Reading item counts is cheap, other State functions do more work, and the
+# search may have to explore the regions again at a time of day.
+ITEM_CHECK_COST: int = 1
+STATE_CALL_COST: int = 4
+SEARCH_CALL_COST: int = 64
+
+
+def rule_cost(node: ast.AST) -> int:
+    if isinstance(node, ast.IfExp):
+        return rule_cost(node.test) + max(rule_cost(node.body), rule_cost(node.orelse))
+    cost = 0
+    if isinstance(node, ast.Call):
+        func = node.func
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Attribute) and func.value.attr == 'search':
+            cost = SEARCH_CALL_COST
+        elif isinstance(func, ast.Attribute) and func.attr in ('has', 'has_any_of', 'has_all_of'):
+            cost = ITEM_CHECK_COST
+        else:
+            cost = STATE_CALL_COST
+    return cost + sum(rule_cost(child) for child in ast.iter_child_nodes(node))
+
+
+def item_check(node: ast.AST, function: str) -> Optional[list[str]]:
+    # Returns the item names of state.has(Item) or state.<function>((Items, ...)).
+    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and isinstance(node.func.value, ast.Name) and node.func.value.id == 'state'
+            and node.func.attr in ('has', function) and len(node.args) == 1 and not node.keywords):
+        return None
+    items = node.args[0].elts if isinstance(node.args[0], ast.Tuple) else [node.args[0]]
+    if not all(isinstance(item, ast.Name) for item in items):
+        return None
+    return [item.id for item in items]
+
+
+# Simplifies a compiled rule body after the aliases have been expanded, by
+# - folding constants through and/or/not and conditional expressions,
+# - merging nested and/or chains and the item checks in them,
+# - dropping operands that appear twice in the same chain, and
+# - ordering the operands of and/or by their cost, then by their dump.
+# The resulting form is canonical, so rules that only differed in the order of
+# their operands compile to the same function (see make_access_rule).
+# Rules have no side effects that change their results, so only the value
+# they return may change, not whether it's true.
+def optimize_rule(node: ast.expr) -> ast.expr:
+    if isinstance(node, ast.BoolOp):
+        return optimize_bool_op(node)
+    if isinstance(node, ast.UnaryOp):
+        node.operand = optimize_rule(node.operand)
+        if isinstance(node.op, ast.Not) and isliteral(node.operand):
+            return ast.Constant(not node.operand.value)
+        return node
+    if isinstance(node, ast.IfExp):
+        node.test = optimize_rule(node.test)
+        node.body = optimize_rule(node.body)
+        node.orelse = optimize_rule(node.orelse)
+        if isliteral(node.test):
+            return node.body if node.test.value else node.orelse
+        return node
+    return node
+
+
+def optimize_bool_op(node: ast.BoolOp) -> ast.expr:
+    is_or = isinstance(node.op, ast.Or)
+    function = 'has_any_of' if is_or else 'has_all_of'
+    items = set()
+    values = {}
+    pending = list(node.values)
+    while pending:
+        value = optimize_rule(pending.pop(0))
+        if isliteral(value):
+            # True ends an or and False an and, anything else can be omitted
+            if bool(value.value) == is_or:
+                return ast.Constant(is_or)
+        elif isinstance(value, ast.BoolOp) and isinstance(value.op, node.op.__class__):
+            pending[:0] = value.values
+        elif (value_items := item_check(value, function)) is not None:
+            items.update(value_items)
+        else:
+            values.setdefault(ast.dump(value, False), value)
+
+    if items:
+        item_names = sorted(items)
+        if len(item_names) == 1:
+            check = ast.Call(func=ast.Attribute(value=ast.Name(id='state', ctx=ast.Load()), attr='has', ctx=ast.Load()),
+                             args=[ast.Name(id=item_names[0], ctx=ast.Load())], keywords=[])
+        else:
+            check = ast.Call(func=ast.Attribute(value=ast.Name(id='state', ctx=ast.Load()), attr=function, ctx=ast.Load()),
+                             args=[ast.Tuple(elts=[ast.Name(id=name, ctx=ast.Load()) for name in item_names], ctx=ast.Load())],
+                             keywords=[])
+        values[ast.dump(check, False)] = check
+    if not values:
+        # every operand was False (or) or True (and)
+        return ast.Constant(not is_or)
+    if len(values) == 1:
+        return next(iter(values.values()))
+    node.values = [value for _, value in sorted(values.items(), key=lambda entry: (rule_cost(entry[1]), entry[0]))]
+    return node
+
+
+# Profiles of the operands of and/or in compiled rules, written by RuleProfile.py:
+# for the dump of each operand, the number of times it was evaluated, the number
+# of times it was true, and the nanoseconds spent evaluating it. Used to order
+# operands by the time they are expected to take before the chain is decided.
+def rule_profile_path() -> str:
+    return data_path('generated/rule_profile.json')
+
+
+# The profiles read by this process, by path. A missing or unreadable profile is empty.
+rule_profiles: dict[str, dict[str, list[int]]] = {}
+
+
+def read_rule_profile() -> dict[str, list[int]]:
+    path = rule_profile_path()
+    if path not in rule_profiles:
+        try:
+            with open(path) as f:
+                rule_profiles[path] = json.load(f)
+        except (OSError, ValueError):
+            rule_profiles[path] = {}
+    return rule_profiles[path]
+
+
+# Reorders the operands of and/or that have all been profiled. An or should
+# first try what is most often true for its cost, an and what is most often false.
+def order_by_profile(node: ast.expr, profile: dict[str, list[int]]) -> ast.expr:
+    if isinstance(node, ast.BoolOp):
+        keys = [ast.dump(value, False) for value in node.values]
+        node.values = [order_by_profile(value, profile) for value in node.values]
+        if all(key in profile and profile[key][0] for key in keys):
+            is_or = isinstance(node.op, ast.Or)
+
+            def expected_cost(key: str) -> float:
+                evaluations, true_count, duration = profile[key]
+                decided = true_count if is_or else evaluations - true_count
+                return duration / max(decided, 0.5)
+
+            node.values = [value for _, value in sorted(zip(keys, node.values), key=lambda entry: expected_cost(entry[0]))]
+        return node
+    for field, value in ast.iter_fields(node):
+        if isinstance(value, ast.expr):
+            setattr(node, field, order_by_profile(value, profile))
+    return node
+
+
+# Counts how often the operands of and/or are evaluated and true, and how long
+# they take, while it is enabled (see RuleProfile.py).
+class RuleProfiler:
+    def __init__(self) -> None:
+        self.expression_ids: dict[str, int] = {}
+        self.evaluations: list[int] = []
+        self.true_counts: list[int] = []
+        self.durations: list[int] = []
+
+    clock = staticmethod(time.perf_counter_ns)
+
+    def record(self, expression_id: int, start: int, value: Any) -> Any:
+        self.durations[expression_id] += time.perf_counter_ns() - start
+        self.evaluations[expression_id] += 1
+        if value:
+            self.true_counts[expression_id] += 1
+        return value
+
+    # Wraps each operand of and/or in the body in a call to record.
+    def instrument(self, node: ast.expr) -> ast.expr:
+        if isinstance(node, ast.BoolOp):
+            node.values = [self.record_call(value) for value in node.values]
+            return node
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, ast.expr):
+                setattr(node, field, self.instrument(value))
+        return node
+
+    def record_call(self, node: ast.expr) -> ast.Call:
+        key = ast.dump(node, False)
+        if key not in self.expression_ids:
+            self.expression_ids[key] = len(self.evaluations)
+            self.evaluations.append(0)
+            self.true_counts.append(0)
+            self.durations.append(0)
+        profiler = ast.Name(id='__rule_profiler__', ctx=ast.Load())
+        return ast.Call(
+            func=ast.Attribute(value=profiler, attr='record', ctx=ast.Load()),
+            args=[ast.Constant(self.expression_ids[key]),
+                  ast.Call(func=ast.Attribute(value=profiler, attr='clock', ctx=ast.Load()), args=[], keywords=[]),
+                  self.instrument(node)],
+            keywords=[])
+
+    def profile(self) -> dict[str, list[int]]:
+        return {key: [self.evaluations[i], self.true_counts[i], self.durations[i]] for key, i in self.expression_ids.items()}
+
+
+# Set by enable_rule_profiling, rules compiled afterwards report to it.
+rule_profiler: Optional[RuleProfiler] = None
+
+
+def enable_rule_profiling() -> RuleProfiler:
+    global rule_profiler
+    rule_profiler = RuleProfiler()
+    allowed_globals['__rule_profiler__'] = rule_profiler
+    return rule_profiler
+
+
 class Rule_AST_Transformer(ast.NodeTransformer):
     def __init__(self, world: World) -> None:
         self.world: World = world
@@ -70,6 +332,8 @@ class Rule_AST_Transformer(ast.NodeTransformer):
             load_aliases()
         # final rule cache
         self.rule_cache: dict[str, AccessRule] = {}
+        # map world attribute or 'settings.' + setting name -> repr of the value inlined into rules
+        self.inlined_constants: dict[str, str] = {}
 
     def visit_Name(self, node: ast.Name) -> Any:
         if node.id in dir(self):
@@ -89,10 +353,10 @@ class Rule_AST_Transformer(ast.NodeTransformer):
                 args=[node],
                 keywords=[])
         elif node.id in self.world.__dict__:
-            return ast.parse('%r' % self.world.__dict__[node.id], mode='eval').body
+            return self.inline_constant(node.id, self.world.__dict__[node.id])
         elif node.id in self.world.settings.settings_dict:
             # Settings are constant
-            return ast.parse('%r' % self.world.settings.settings_dict[node.id], mode='eval').body
+            return self.inline_constant('settings.' + node.id, self.world.settings.settings_dict[node.id])
         elif node.id in State.__dict__:
             return self.make_call(node, node.id, [], [])
         elif node.id in kwarg_defaults or node.id in special_globals:
@@ -147,7 +411,7 @@ class Rule_AST_Transformer(ast.NodeTransformer):
 
         if isinstance(count, ast.Name):
             # Must be a settings constant
-            count = ast.parse('%r' % self.world.settings.settings_dict[count.id], mode='eval').body
+            count = self.inline_constant('settings.' + count.id, self.world.settings.settings_dict[count.id])
 
         if item.id not in ItemInfo.solver_ids:
             self.events.add(item.id.replace('_', ' '))
@@ -322,6 +586,12 @@ class Rule_AST_Transformer(ast.NodeTransformer):
                 else:
                     new_values.append(elt)
 
+        for item in items:
+            if item not in ItemInfo.solver_ids and item not in escaped_items and event_name.match(item):
+                # Ensure the item info is updated properly, so the rule's dependencies are known
+                self.events.add(item.replace('_', ' '))
+                Item(item, event=True)
+
         # package up the remaining items and values
         if not items and not new_values:
             # all values were True(And)/False(Or)
@@ -342,6 +612,12 @@ class Rule_AST_Transformer(ast.NodeTransformer):
             return node.values[0]
         return node
 
+    # Records the value so that rules compiled for this world can be reused
+    # by worlds that would inline the same values (see WorldGraphTemplate).
+    def inline_constant(self, name: str, value: Any) -> ast.expr:
+        self.inlined_constants[name] = '%r' % value
+        return ast.parse(self.inlined_constants[name], mode='eval').body
+
     # Generates an ast.Call invoking the given State function 'name',
     # providing given args and keywords, and adding in additional
     # keyword args from kwarg_defaults (age, etc.)
@@ -405,6 +681,13 @@ class Rule_AST_Transformer(ast.NodeTransformer):
         self.delayed_rules.clear()
 
     def make_access_rule(self, body: ast.AST) -> AccessRule:
+        body = optimize_rule(body)
+        dependencies = rule_dependencies(body)
+        reads = rule_reads(body)
+        if rule_profiler is not None:
+            body = rule_profiler.instrument(body)
+        elif profile := read_rule_profile():
+            body = order_by_profile(body, profile)
         rule_str = ast.dump(body, False)
         if rule_str not in self.rule_cache:
             # requires consistent iteration on dicts
@@ -428,6 +711,8 @@ class Rule_AST_Transformer(ast.NodeTransformer):
                     allowed_globals)
             except TypeError as e:
                 raise Exception('Parse Error: %s' % e, self.current_spot.name, ast.dump(body, False))
+            self.rule_cache[rule_str].dependencies = dependencies
+            self.rule_cache[rule_str].reads = reads
         return self.rule_cache[rule_str]
 
     ## Handlers for specific internal functions used in the json logic.
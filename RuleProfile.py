@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# Generates seeds with profiled access rules and writes the profile that the
+# rule parser orders the operands of and/or by (see RuleParser.order_by_profile).
+#
+#   python RuleProfile.py [--settings SETTINGS [SETTINGS ...]] [--seed SEED] [--count 5]
+#
+# Every settings file is generated count times. Run this again after changing
+# the logic files, operands that were never profiled keep their default order.
+from __future__ import annotations
+import argparse
+import json
+import logging
+import os
+
+from Main import generate, resolve_settings
+from RuleParser import enable_rule_profiling, rule_profile_path
+from Settings import Settings
+
+
+def profile_rules(settings_files: list[str], seed: str, count: int) -> dict[str, list[int]]:
+    profiler = enable_rule_profiling()
+    for settings_file in settings_files or [None]:
+        settings_dict = {}
+        if settings_file is not None:
+            with open(settings_file) as f:
+                settings_dict = json.load(f)
+        # Only the generation is profiled, so no ROM is needed.
+        settings_dict.update(create_patch_file=False, create_compressed_rom=False, create_wad_file=False, create_uncompressed_rom=False)
+        for i in range(count):
+            settings = Settings(settings_dict)
+            # Every rule has to be compiled with the profiler.
+            settings.cache_compiled_rules = False
+            settings.update_seed(f'{seed}{i}')
+            resolve_settings(settings)
+            generate(settings)
+    return profiler.profile()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--settings', nargs='*', default=[], help='Settings files to generate seeds with, the default settings if none.')
+    parser.add_argument('--seed', default='PROFILE', help='Prefix of the seeds to generate.')
+    parser.add_argument('--count', type=int, default=5, help='Number of seeds to generate with each settings file.')
+    parser.add_argument('--output', default=rule_profile_path(), help='File to write the profile to.')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(message)s', level=logging.WARNING)
+    profile = profile_rules(args.settings, args.seed, args.count)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(profile, f, separators=(',', ':'))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,13 @@
 from __future__ import annotations
-import copy
 import itertools
 import sys
+from collections import Counter
 from collections.abc import Callable, Iterable
 from dataclasses import dataclass, field
 from typing import TYPE_CHECKING, Optional
 
 from Region import Region, TimeOfDay
-from State import State
+from State import State, function_dependencies, predicate_dependencies
 
 if sys.version_info >= (3, 10):
     from typing import TypeAlias
@@ -19,29 +19,149 @@ if TYPE_CHECKING:
     from Item import Item
     from Location import Location
     from Goals import GoalCategory
+    from RulesCommon import AccessRule
 
 ValidGoals: TypeAlias = "dict[str, bool | dict[str, list[int] | dict[int, list[str]]]]"
 
 
+# Reachable regions and visited locations are kept per world in bytearrays,
+# indexed by Region.index and Location.index (see World.index_region_graph),
+# which are much cheaper to copy than sets and dicts.
+# A region's entry is zero if it hasn't been reached, otherwise REACHED plus
+# its lazily-determined tod flags (see TimeOfDay).
+REACHED: int = 0x80
+
+# Flags of the ages a spot's access rule failed at, see Search._rule_failed.
+RULE_FAILED_ADULT: int = 1
+RULE_FAILED_CHILD: int = 2
+
+# The hits and misses of every RuleResultCache, see the rule_result_cache_size setting.
+# Logged and cleared after each generation attempt.
+rule_result_statistics: Counter[str] = Counter()
+
+
 @dataclass
 class SearchCache:
-    child_queue: list[Entrance] = field(default_factory=list)
-    adult_queue: list[Entrance] = field(default_factory=list)
-    visited_locations: set[Location] = field(default_factory=set)
-    child_regions: dict[Region, int] = field(default_factory=dict)
-    adult_regions: dict[Region, int] = field(default_factory=dict)
+    child_queue: list[list[Entrance]] = field(default_factory=list)
+    adult_queue: list[list[Entrance]] = field(default_factory=list)
+    visited_locations: list[bytearray] = field(default_factory=list)
+    child_regions: list[bytearray] = field(default_factory=list)
+    adult_regions: list[bytearray] = field(default_factory=list)
+    # For each age and world id, the tods being spread through the regions (see
+    # Search._expand_tod_regions), with the version of the state they were spread with,
+    # the exits left to try, and the exits whose access rule failed.
+    tod_spread: dict[tuple[Optional[str], int], dict[int, tuple[int, tuple[Entrance, ...], tuple[Entrance, ...]]]] = field(default_factory=dict)
+    # For each world, the version of its state when its regions were last expanded,
+    # or -1 before they were. Exits never lead to another world, so the regions of a
+    # world only change once its own items do (see Search.next_sphere).
+    expanded_versions: list[int] = field(default_factory=list)
+    # The ids of the arrays only this cache uses. Copies share every array
+    # and queue, and copy an array when they first modify it (see writable).
+    # The queue of a world is never modified, only replaced.
+    owned: set[int] = field(default_factory=set)
 
     def copy(self) -> SearchCache:
-        new = type(self)()
-        for name, value in self.__dict__.items():
-            setattr(new, name, copy.copy(value))
-        return new
+        self.owned.clear()
+        return SearchCache(
+            child_queue=list(self.child_queue),
+            adult_queue=list(self.adult_queue),
+            visited_locations=list(self.visited_locations),
+            child_regions=list(self.child_regions),
+            adult_regions=list(self.adult_regions),
+            tod_spread=dict(self.tod_spread),
+            expanded_versions=list(self.expanded_versions),
+        )
+
+    # Returns the array for the world from one of the lists of this cache,
+    # after replacing it with a copy if it may be shared.
+    def writable(self, arrays: list[bytearray], world_id: int) -> bytearray:
+        array = arrays[world_id]
+        if id(array) not in self.owned:
+            array = arrays[world_id] = bytearray(array)
+            self.owned.add(id(array))
+        return array
+
+
+# The progression locations, and for each world the flags of the regions, that a
+# search has to visit to decide the predicate (see Search.goal), or None to visit
+# every region. Items placed or entrances connected after it is made may make
+# others relevant, while taking them out only leaves more to visit than needed.
+@dataclass
+class SearchGoal:
+    predicate: Callable[[State], bool]
+    locations: list[Location]
+    regions: Optional[list[bytearray]]
+
+
+# Returns the solver ids the spot's access rule can read, and whether it reads the
+# reachability of the spot's region at a time of day (see RuleParser.rule_reads),
+# or None if the rule can read anything else.
+def spot_reads(spot: Location | Entrance) -> Optional[tuple[frozenset[int], bool]]:
+    if hasattr(spot.access_rule, 'reads'):
+        return spot.access_rule.reads
+    # Spots with several rules run each of them. Spots without any keep
+    # their default rule, or a rule that is always false.
+    solver_ids = set()
+    reads_tod = False
+    for rule in spot.access_rules:
+        if hasattr(rule, 'reads'):
+            reads = rule.reads
+        elif getattr(State, getattr(rule, '__name__', ''), None) is rule and rule.__name__ in function_dependencies:
+            reads = function_dependencies[rule.__name__], False
+        else:
+            return None
+        if reads is None:
+            return None
+        solver_ids.update(reads[0])
+        reads_tod = reads_tod or reads[1]
+    return frozenset(solver_ids), reads_tod
+
+
+# Results of the access rules that only depend on item counts (see
+# RuleParser.rule_dependencies), keyed by the rule, the version of the state
+# it was evaluated with, the age and the tod. Copies of a search share its
+# cache, their states keep the same version until they collect or remove an item.
+# Starts over once it holds max_size results.
+@dataclass
+class RuleResultCache:
+    max_size: int
+    results: dict[tuple[AccessRule, int, Optional[str], int], bool] = field(default_factory=dict)
+
+    def evaluate(self, spot: Location | Entrance, state: State, age: Optional[str], tod: int = TimeOfDay.NONE) -> bool:
+        rule = spot.access_rule
+        if getattr(rule, 'dependencies', None) is None:
+            return rule(state, spot=spot, age=age, tod=tod)
+        key = (rule, state.version, age, tod)
+        result = self.results.get(key)
+        if result is not None:
+            rule_result_statistics['hits'] += 1
+            return result
+        rule_result_statistics['misses'] += 1
+        if len(self.results) >= self.max_size:
+            self.results.clear()
+        result = self.results[key] = rule(state, spot=spot, age=age, tod=tod)
+        return result
 
 
 class Search:
-    def __init__(self, state_list: Iterable[State], initial_cache: Optional[SearchCache] = None) -> None:
+    def __init__(self, state_list: Iterable[State], initial_cache: Optional[SearchCache] = None, used_exits: Optional[set[Entrance]] = None) -> None:
         self.state_list: list[State] = [state.copy() for state in state_list]
 
+        # The spots whose access rule failed, and for each world the spots to evaluate
+        # again once the count of a solver id they depend on changes.
+        # Shared with copies of the search until either modifies them.
+        self._failed_rules: dict[Location | Entrance, int] = {}
+        self._rule_dependents: list[dict[int, tuple[Location | Entrance, ...]]] = [{} for _ in self.state_list]
+        self._shared_rules: bool = False
+        # For each world, nonzero for the regions to explore (see SearchGoal), or None to explore all of them.
+        self._goal_regions: Optional[list[bytearray]] = None
+        # If set, gets the exits through which regions were reached or given a tod, by this
+        # search and its copies. Disconnecting any other exit wouldn't change what they find.
+        self.used_exits: Optional[set[Entrance]] = used_exits
+        # Shared with copies of the search. Off unless rule_result_cache_size is set.
+        cache_size = self.state_list[0].world.settings.rule_result_cache_size if self.state_list else 0
+        self.rule_results: Optional[RuleResultCache] = RuleResultCache(cache_size) if cache_size > 0 else None
+
         # Let the states reference this search.
         for state in self.state_list:
             state.search = self
@@ -54,24 +174,36 @@ class Search:
         else:
             root_regions = [state.world.get_region('Root') for state in self.state_list]
             # The cache is a dict with 5 values:
-            #  child_regions, adult_regions: maps of Region -> tod, all the regions in that sphere
-            #    values are lazily-determined tod flags (see TimeOfDay).
-            #  child_queue, adult_queue: queue of Entrance, all the exits to try next sphere
-            #  visited_locations: set of Locations visited in or before that sphere.
+            #  child_regions, adult_regions: per world, the tod flags of all the regions in that sphere,
+            #    indexed by Region.index.
+            #  child_queue, adult_queue: per world, queue of Entrance, all the exits to try next sphere
+            #  visited_locations: per world, flags of the Locations visited in or before that sphere,
+            #    indexed by Location.index.
             self._cache = SearchCache(
-                child_queue=list(exit for region in root_regions for exit in region.exits),
-                adult_queue=list(exit for region in root_regions for exit in region.exits),
-                visited_locations=set(),
-                child_regions={region: TimeOfDay.NONE for region in root_regions},
-                adult_regions={region: TimeOfDay.NONE for region in root_regions},
+                child_queue=[list(region.exits) for region in root_regions],
+                adult_queue=[list(region.exits) for region in root_regions],
+                visited_locations=[bytearray(len(state.world.get_locations())) for state in self.state_list],
+                child_regions=[bytearray(len(state.world.regions)) for state in self.state_list],
+                adult_regions=[bytearray(len(state.world.regions)) for state in self.state_list],
+                expanded_versions=[-1 for _ in self.state_list],
             )
+            for region in root_regions:
+                self._cache.child_regions[region.world.id][region.index] = REACHED | TimeOfDay.NONE
+                self._cache.adult_regions[region.world.id][region.index] = REACHED | TimeOfDay.NONE
             self.cached_spheres = [self._cache]
             self.next_sphere()
 
     def copy(self) -> Search:
         # we only need to copy the top sphere since that's what we're starting with and we don't go back
         # copy always makes a nonreversible instance
-        return Search(self.state_list, initial_cache=self._cache.copy())
+        search = Search(self.state_list, initial_cache=self._cache.copy())
+        # The states have the same items, so the same rules fail.
+        search._failed_rules = self._failed_rules
+        search._rule_dependents = self._rule_dependents
+        search._shared_rules = self._shared_rules = True
+        search.used_exits = self.used_exits
+        search.rule_results = self.rule_results
+        return search
 
     def collect_all(self, itempool: Iterable[Item]) -> None:
         for item in itempool:
@@ -123,57 +255,179 @@ class Search:
     def reset(self) -> None:
         raise Exception('Unimplemented for Search. Perhaps you want RewindableSearch.')
 
-    # Internal to the iteration. Modifies the exit_queue, regions.
+    # Explores the world of the state over from its Root, with a copy of the state,
+    # e.g. once entrances of the world were connected or disconnected.
+    # Exits never lead to another world, so the other worlds are kept as they are.
+    # Items the world collected for other worlds stay collected, so the caller has
+    # to make sure there aren't any. Not safe to call during iteration.
+    def restart_world(self, state: State) -> None:
+        world = state.world
+        state = self.state_list[world.id] = state.copy()
+        state.search = self
+        root = world.get_region('Root')
+        cache = self._cache
+        cache.child_queue[world.id] = list(root.exits)
+        cache.adult_queue[world.id] = list(root.exits)
+        cache.visited_locations[world.id] = bytearray(len(world.get_locations()))
+        cache.child_regions[world.id] = bytearray(len(world.regions))
+        cache.adult_regions[world.id] = bytearray(len(world.regions))
+        cache.child_regions[world.id][root.index] = REACHED | TimeOfDay.NONE
+        cache.adult_regions[world.id][root.index] = REACHED | TimeOfDay.NONE
+        cache.owned.update((id(cache.visited_locations[world.id]), id(cache.child_regions[world.id]), id(cache.adult_regions[world.id])))
+        cache.tod_spread = {key: spreads for key, spreads in cache.tod_spread.items() if key[1] != world.id}
+        cache.expanded_versions[world.id] = -1
+        self._own_rules()
+        self._failed_rules = {spot: failed for spot, failed in self._failed_rules.items() if spot.world.id != world.id}
+        self._rule_dependents[world.id] = {}
+        self.next_sphere()
+
+    # Internal to the iteration. Modifies the regions of the world of the exits.
     # Returns a queue of the exits whose access rule failed,
     # as a cache for the exits to try on the next iteration.
-    def _expand_regions(self, exit_queue: list[Entrance], regions: dict[Region, int], age: Optional[str]) -> list[Entrance]:
+    def _expand_regions(self, exit_queue: list[Entrance], regions: list[bytearray], age: Optional[str]) -> list[Entrance]:
+        # The queue may be shared with copies of the cache.
+        exit_queue = list(exit_queue)
         failed = []
+        age_failed = RULE_FAILED_ADULT if age == 'adult' else RULE_FAILED_CHILD
+        goal_regions = self._goal_regions
+        rule_results = self.rule_results
         for exit in exit_queue:
-            if exit.world and exit.connected_region and exit.connected_region not in regions:
+            if exit.world and exit.connected_region and not regions[exit.world.id][exit.connected_region.index]:
+                # Regions that can't lead to the goal are left unexplored.
+                if goal_regions is not None and not goal_regions[exit.world.id][exit.connected_region.index]:
+                    continue
+                # Skip rules that failed before, unless an item they depend on changed
+                if self._failed_rules.get(exit, 0) & age_failed:
+                    failed.append(exit)
                 # Evaluate the access rule directly, without tod
-                if exit.access_rule(self.state_list[exit.world.id], spot=exit, age=age):
-                    # If it found a new tod, make sure we try other entrances again.
-                    # Probably would take too long and not be worth it if we only grabbed the exits
-                    # for the given world...
-                    if exit.connected_region.provides_time and ~regions[exit.world.get_region('Root')] & exit.connected_region.provides_time:
+                elif (rule_results.evaluate(exit, self.state_list[exit.world.id], age) if rule_results is not None
+                      else exit.access_rule(self.state_list[exit.world.id], spot=exit, age=age)):
+                    world_regions = self._cache.writable(regions, exit.world.id)
+                    # If it found a new tod, make sure we try the other entrances of its world again.
+                    root_index = exit.world.get_region('Root').index
+                    if exit.connected_region.provides_time and ~world_regions[root_index] & exit.connected_region.provides_time:
                         exit_queue.extend(failed)
                         failed = []
-                        regions[exit.world.get_region('Root')] |= exit.connected_region.provides_time
-                    regions[exit.connected_region] = exit.connected_region.provides_time
+                        world_regions[root_index] |= exit.connected_region.provides_time
+                    world_regions[exit.connected_region.index] = REACHED | exit.connected_region.provides_time
+                    if self.used_exits is not None:
+                        self.used_exits.add(exit)
+                    # The tods have to be spread again, into or from the new region.
+                    if self._cache.tod_spread:
+                        self._cache.tod_spread.pop((age, exit.world.id), None)
                     exit_queue.extend(exit.connected_region.exits)
                 else:
+                    self._rule_failed(exit, age_failed)
                     failed.append(exit)
         return failed
 
-    def _expand_tod_regions(self, regions: dict[Region, int], goal_region: Region, age: Optional[str], tod: int) -> bool:
-        # grab all the exits from the regions with the given tod in the same world as our goal.
-        # we want those that go to existing regions without the tod, until we reach the goal.
-        has_tod_world = lambda regtod: regtod[1] & tod and regtod[0].world == goal_region.world
-        exit_queue = list(itertools.chain.from_iterable(region.exits for region, _ in filter(has_tod_world, regions.items())))
-        for exit in exit_queue:
+    # Evaluates the spot's access rule with the state of its world.
+    def access(self, spot: Location | Entrance, age: Optional[str], tod: int = TimeOfDay.NONE) -> bool:
+        state = self.state_list[spot.world.id]
+        if self.rule_results is not None:
+            return self.rule_results.evaluate(spot, state, age, tod)
+        return spot.access_rule(state, spot=spot, age=age, tod=tod)
+
+    # Remembers that the spot's access rule failed at the given age, if the
+    # rule's result only depends on the counts of known solver ids
+    # (see RuleParser.rule_dependencies), so it isn't evaluated again
+    # until one of those counts changes.
+    def _rule_failed(self, spot: Location | Entrance, age_failed: int) -> None:
+        dependencies = getattr(spot.access_rule, 'dependencies', None)
+        if dependencies is None:
+            return
+        self._own_rules()
+        previously_failed = self._failed_rules.get(spot, 0)
+        self._failed_rules[spot] = previously_failed | age_failed
+        if not previously_failed:
+            world_dependents = self._rule_dependents[spot.world.id]
+            for solver_id in dependencies:
+                world_dependents[solver_id] = world_dependents.get(solver_id, ()) + (spot,)
+
+    # Called by the states of this search whenever they collect or remove an item.
+    def items_changed(self, world_id: int, solver_ids: Iterable[int]) -> None:
+        for solver_id in solver_ids:
+            if solver_id in self._rule_dependents[world_id]:
+                self._own_rules()
+                for spot in self._rule_dependents[world_id].pop(solver_id):
+                    self._failed_rules.pop(spot, None)
+
+    def _own_rules(self) -> None:
+        if self._shared_rules:
+            self._failed_rules = dict(self._failed_rules)
+            self._rule_dependents = [dict(world_dependents) for world_dependents in self._rule_dependents]
+            self._shared_rules = False
+
+    # Spreads the tod through the goal's world until it reaches the goal, and returns
+    # whether it did. The exits left to try and those whose access rule failed are kept
+    # until new regions are reached, so later calls go on from there. Once none are left,
+    # the goal can't be reached at that tod until the items of the world change.
+    def _expand_tod_regions(self, regions: list[bytearray], goal_region: Region, age: Optional[str], tod: int) -> bool:
+        world = goal_region.world
+        version = self.state_list[world.id].version
+        spreads = self._cache.tod_spread.get((age, world.id), {})
+        if tod in spreads:
+            spread_version, exit_queue, failed = spreads[tod]
+            if spread_version != version:
+                # Exits that failed may pass with the new items.
+                exit_queue += failed
+                failed = ()
+            elif not exit_queue:
+                return False
+        else:
+            # grab all the exits from the regions with the given tod in the same world.
+            has_tod = [flags & tod for flags in regions[world.id]]
+            exit_queue = tuple(itertools.chain.from_iterable(region.exits for region in itertools.compress(world.regions, has_tod)))
+            failed = ()
+
+        exit_queue = list(exit_queue)
+        new_failed = []
+        world_regions = regions[world.id]
+        reached = False
+        for exit_index, exit in enumerate(exit_queue):
             # We don't look for new regions, just spreading the tod to our existing regions
-            if exit.connected_region in regions and tod & ~regions[exit.connected_region]:
+            # Exits never lead to another world, so the flags are in the same array.
+            if exit.connected_region is None:
+                continue
+            flags = world_regions[exit.connected_region.index]
+            if flags and tod & ~flags:
                 # Evaluate the access rule directly
-                if exit.access_rule(self.state_list[exit.world.id], spot=exit, age=age, tod=tod):
-                    regions[exit.connected_region] |= tod
-                    if exit.connected_region == goal_region:
-                        return True
+                if self.access(exit, age, tod):
+                    world_regions = self._cache.writable(regions, world.id)
+                    world_regions[exit.connected_region.index] |= tod
+                    if self.used_exits is not None:
+                        self.used_exits.add(exit)
                     exit_queue.extend(exit.connected_region.exits)
-        return False
+                    if exit.connected_region == goal_region:
+                        reached = True
+                        break
+                else:
+                    new_failed.append(exit)
+        else:
+            exit_index = len(exit_queue)
+        # The spreads may be shared with copies of the cache.
+        self._cache.tod_spread[(age, world.id)] = {**spreads, tod: (version, tuple(exit_queue[exit_index + 1:]), failed + tuple(new_failed))}
+        return reached
 
     # Explores available exits, updating relevant entries in the cache in-place.
     # Returns the regions accessible in the new sphere as child,
     # the regions accessible as adult, and the set of visited locations.
     # These are references to the new entry in the cache, so they can be modified
     # directly.
-    def next_sphere(self) -> tuple[dict[Region, int], dict[Region, int], set[Location]]:
+    def next_sphere(self) -> tuple[list[bytearray], list[bytearray], list[bytearray]]:
         # Use the queue to iteratively add regions to the accessed set,
         # until we are stuck or out of regions.
 
         # Replace the queues (which have been modified) with just the
         # failed exits that we can retry next time.
-        self._cache.adult_queue = self._expand_regions(self._cache.adult_queue, self._cache.adult_regions, 'adult')
-        self._cache.child_queue = self._expand_regions(self._cache.child_queue, self._cache.child_regions, 'child')
+        # Worlds whose items didn't change since they were last expanded
+        # can't reach any new region, so their queues are left as they are.
+        cache = self._cache
+        for world_id, state in enumerate(self.state_list):
+            if cache.expanded_versions[world_id] != state.version:
+                cache.expanded_versions[world_id] = state.version
+                cache.adult_queue[world_id] = self._expand_regions(cache.adult_queue[world_id], cache.adult_regions, 'adult')
+                cache.child_queue[world_id] = self._expand_regions(cache.child_queue[world_id], cache.child_regions, 'child')
 
         return self._cache.child_regions, self._cache.adult_regions, self._cache.visited_locations
 
@@ -186,31 +440,68 @@ class Search:
     # locations to see if the game is beatable. Collection should be done
     # using internal State (recommended to just call search.collect).
     def iter_reachable_locations(self, item_locations: Iterable[Location]) -> Iterable[Location]:
-        had_reachable_locations = True
-        # will loop as long as any visits were made, and at least once
-        while had_reachable_locations:
+        return self._iter_reachable_locations(item_locations, False)
+
+    # Also yields None at the start of every pass over the locations
+    # if sphere_starts is set, once the regions have been expanded.
+    def _iter_reachable_locations(self, item_locations: Iterable[Location], sphere_starts: bool) -> Iterable[Optional[Location]]:
+        # Locations stay visited, so each iteration only goes through
+        # the locations that weren't visited after the previous one.
+        # Most of the locations a fill goes through are visited in the
+        # first few passes, and checking them again was most of the work.
+        remaining_locations = item_locations
+        # The version of each state when the previous pass started.
+        # A location can only become reachable once the items of its own world
+        # change, so a pass passes over the locations of the worlds whose items
+        # didn't change since the previous one started. Versions are never reused,
+        # so a world whose items change during a pass has its remaining locations
+        # checked in that same pass, as they would be if every location was checked.
+        scanned_versions = [-1 for _ in self.state_list]
+        state_list = self.state_list
+        rule_results = self.rule_results
+        # will loop as long as the items of any world changed, and at least once
+        while True:
             child_regions, adult_regions, visited_locations = self.next_sphere()
 
+            pass_versions = [state.version for state in state_list]
+            if pass_versions == scanned_versions:
+                break
+            last_versions, scanned_versions = scanned_versions, pass_versions
+            if sphere_starts:
+                yield None
+
             # Get all locations in accessible_regions that aren't visited,
             # and check if they can be reached. Collect them.
-            had_reachable_locations = False
+            item_locations, remaining_locations = remaining_locations, []
             for loc in item_locations:
-                if loc in visited_locations:
+                world_id = loc.world.id
+                if state_list[world_id].version == last_versions[world_id]:
+                    remaining_locations.append(loc)
+                    continue
+                if visited_locations[world_id][loc.index]:
                     continue
+                # Rules that failed before are skipped until an item they depend on changes.
+                failed = self._failed_rules.get(loc, 0)
                 # Check adult first; it's the most likely.
-                if (loc.parent_region in adult_regions
-                        and loc.access_rule(self.state_list[loc.world.id], spot=loc, age='adult')):
-                    had_reachable_locations = True
-                    # Mark it visited for this algorithm
-                    visited_locations.add(loc)
-                    yield loc
-
-                elif (loc.parent_region in child_regions
-                      and loc.access_rule(self.state_list[loc.world.id], spot=loc, age='child')):
-                    had_reachable_locations = True
-                    # Mark it visited for this algorithm
-                    visited_locations.add(loc)
-                    yield loc
+                if adult_regions[world_id][loc.parent_region.index] and not failed & RULE_FAILED_ADULT:
+                    if (rule_results.evaluate(loc, self.state_list[world_id], 'adult') if rule_results is not None
+                            else loc.access_rule(self.state_list[world_id], spot=loc, age='adult')):
+                        # Mark it visited for this algorithm
+                        self._cache.writable(visited_locations, world_id)[loc.index] = 1
+                        yield loc
+                        continue
+                    self._rule_failed(loc, RULE_FAILED_ADULT)
+
+                if child_regions[world_id][loc.parent_region.index] and not failed & RULE_FAILED_CHILD:
+                    if (rule_results.evaluate(loc, self.state_list[world_id], 'child') if rule_results is not None
+                            else loc.access_rule(self.state_list[world_id], spot=loc, age='child')):
+                        # Mark it visited for this algorithm
+                        self._cache.writable(visited_locations, world_id)[loc.index] = 1
+                        yield loc
+                        continue
+                    self._rule_failed(loc, RULE_FAILED_CHILD)
+
+                remaining_locations.append(loc)
 
     # This collects all item locations available in the state list given that
     # the states have collected items. The purpose is that it will search for
@@ -221,6 +512,16 @@ class Search:
             # Collect the item for the state world it is for
             self.collect(location.item)
 
+    # Like collect_locations, but yields before collecting each sphere of items,
+    # so the caller can stop once what it's looking for is reachable.
+    def iter_collect_locations(self, item_locations: Optional[Iterable[Location]] = None) -> Iterable[None]:
+        item_locations = item_locations or self.progression_locations()
+        for location in self._iter_reachable_locations(item_locations, True):
+            if location is None:
+                yield
+            else:
+                self.collect(location.item)
+
     # A shorthand way to iterate over locations without collecting items.
     def visit_locations(self, locations: Optional[Iterable[Location]] = None) -> None:
         locations = locations or self.progression_locations()
@@ -258,6 +559,84 @@ class Search:
         else:
             return False
 
+    # Like can_beat_game, but only collects the items the goal's predicate depends on.
+    def can_beat_goal(self, goal: SearchGoal) -> bool:
+        if all(map(goal.predicate, self.state_list)):
+            return True
+        search = self.copy()
+        search._goal_regions = goal.regions
+        # Items may have been taken out of the locations since the goal was made.
+        goal_locations = [location for location in goal.locations if location.item is not None]
+        if goal_locations:
+            search.collect_locations(goal_locations)
+        return all(map(goal.predicate, search.state_list))
+
+    # Finds the progression locations whose items can change the counts of the solver
+    # ids the predicate reads (see State.predicate_dependencies), directly or through
+    # the access rules of other such locations, and the regions that can lead to them.
+    # Worlds with a rule that can read anything, or the reachability of a region at
+    # a time of day, which may spread through any region, keep all their regions.
+    # Searches for other predicates collect every progression location.
+    def goal(self, predicate: Callable[[State], bool] = State.won) -> SearchGoal:
+        if predicate not in predicate_dependencies:
+            return SearchGoal(predicate, self.progression_locations(), None)
+        worlds = [state.world for state in self.state_list]
+        # The locations holding items that change each solver id, for each world.
+        holders: list[dict[int, list[Location]]] = [{} for _ in worlds]
+        for location in self.progression_locations():
+            item = location.item
+            for solver_id in self.state_list[item.world.id].item_solver_ids(item):
+                holders[item.world.id].setdefault(solver_id, []).append(location)
+
+        relevant_ids: list[set[int]] = [set() for _ in worlds]
+        all_ids = [False] * len(worlds)
+        all_regions = [False] * len(worlds)
+        goal_regions = [bytearray(len(world.regions)) for world in worlds]
+        goal_locations: list[Location] = []
+        added_locations: set[Location] = set()
+        id_queue: list[tuple[int, int]] = [(state.world.id, solver_id) for state in self.state_list
+                                           for solver_id in predicate_dependencies[predicate](state)]
+        region_queue: list[Region] = []
+
+        def read(spot: Location | Entrance) -> None:
+            world_id = spot.world.id
+            reads = spot_reads(spot)
+            if reads is None:
+                if not all_ids[world_id]:
+                    all_ids[world_id] = True
+                    id_queue.extend((world_id, solver_id) for solver_id in holders[world_id])
+                return
+            solver_ids, reads_tod = reads
+            id_queue.extend((world_id, solver_id) for solver_id in solver_ids if solver_id not in relevant_ids[world_id])
+            if reads_tod and not all_regions[world_id]:
+                all_regions[world_id] = True
+                region_queue.extend(worlds[world_id].regions)
+
+        while id_queue or region_queue:
+            while id_queue:
+                world_id, solver_id = id_queue.pop()
+                if solver_id in relevant_ids[world_id]:
+                    continue
+                relevant_ids[world_id].add(solver_id)
+                for location in holders[world_id].pop(solver_id, ()):
+                    # A location changing several relevant ids is added once.
+                    if location not in added_locations:
+                        added_locations.add(location)
+                        goal_locations.append(location)
+                        read(location)
+                        region_queue.append(location.parent_region)
+            while region_queue:
+                region = region_queue.pop()
+                world_regions = goal_regions[region.world.id]
+                if world_regions[region.index]:
+                    continue
+                world_regions[region.index] = 1
+                for entrance in region.entrances:
+                    if entrance.world is not None and entrance.parent_region is not None:
+                        read(entrance)
+                        region_queue.append(entrance.parent_region)
+        return SearchGoal(predicate, goal_locations, goal_regions)
+
     def beatable_goals_fast(self, goal_categories: dict[str, GoalCategory], world_filter: Optional[int] = None) -> ValidGoals:
         valid_goals = self.test_category_goals(goal_categories, world_filter)
         if all(map(State.won, self.state_list)):
@@ -311,7 +690,7 @@ class Search:
             for location in state.world.distribution.skipped_locations:
                 # We need to use the locations in the current world
                 location = state.world.get_location(location.name)
-                self._cache.visited_locations.add(location)
+                self._cache.writable(self._cache.visited_locations, location.world.id)[location.index] = 1
                 yield location
 
     def collect_pseudo_starting_items(self) -> None:
@@ -323,15 +702,17 @@ class Search:
     # Implicitly requires is_starting_age or Time_Travel.
     def can_reach(self, region: Region, age: Optional[str] = None, tod: int = TimeOfDay.NONE) -> bool:
         if age == 'adult':
+            flags = self._cache.adult_regions[region.world.id][region.index]
             if tod:
-                return region in self._cache.adult_regions and (self._cache.adult_regions[region] & tod or self._expand_tod_regions(self._cache.adult_regions, region, age, tod))
+                return bool(flags) and bool(flags & tod or self._expand_tod_regions(self._cache.adult_regions, region, age, tod))
             else:
-                return region in self._cache.adult_regions
+                return bool(flags)
         elif age == 'child':
+            flags = self._cache.child_regions[region.world.id][region.index]
             if tod:
-                return region in self._cache.child_regions and (self._cache.child_regions[region] & tod or self._expand_tod_regions(self._cache.child_regions, region, age, tod))
+                return bool(flags) and bool(flags & tod or self._expand_tod_regions(self._cache.child_regions, region, age, tod))
             else:
-                return region in self._cache.child_regions
+                return bool(flags)
         elif age == 'both':
             return self.can_reach(region, age='adult', tod=tod) and self.can_reach(region, age='child', tod=tod)
         else:
@@ -345,32 +726,36 @@ class Search:
     # Use the cache in the search to determine location reachability.
     # Only works for locations that had progression items...
     def visited(self, location: Location) -> bool:
-        return location in self._cache.visited_locations
+        return bool(self._cache.visited_locations[location.world.id][location.index])
 
     # Use the cache in the search to get all reachable regions.
     def reachable_regions(self, age: Optional[str] = None) -> set[Region]:
         if age == 'adult':
-            return set(self._cache.adult_regions.keys())
+            return set(self._iter_regions(self._cache.adult_regions))
         elif age == 'child':
-            return set(self._cache.child_regions.keys())
+            return set(self._iter_regions(self._cache.child_regions))
         else:
-            return set(self._cache.adult_regions.keys()).union(self._cache.child_regions.keys())
+            return set(self._iter_regions(self._cache.adult_regions)).union(self._iter_regions(self._cache.child_regions))
+
+    def _iter_regions(self, regions: list[bytearray]) -> Iterable[Region]:
+        for state, world_regions in zip(self.state_list, regions):
+            yield from itertools.compress(state.world.regions, world_regions)
 
     # Returns whether the given age can access the spot at this age and tod,
     # by checking whether the search has reached the containing region, and evaluating the spot's access rule.
     def spot_access(self, spot: Location | Entrance, age: Optional[str] = None, tod: int = TimeOfDay.NONE) -> bool:
         if age == 'adult' or age == 'child':
             return (self.can_reach(spot.parent_region, age=age, tod=tod)
-                    and spot.access_rule(self.state_list[spot.world.id], spot=spot, age=age, tod=tod))
+                    and self.access(spot, age, tod))
         elif age == 'both':
             return (self.can_reach(spot.parent_region, age=age, tod=tod)
-                    and spot.access_rule(self.state_list[spot.world.id], spot=spot, age='adult', tod=tod)
-                    and spot.access_rule(self.state_list[spot.world.id], spot=spot, age='child', tod=tod))
+                    and self.access(spot, 'adult', tod)
+                    and self.access(spot, 'child', tod))
         else:
             return (self.can_reach(spot.parent_region, age='adult', tod=tod)
-                    and spot.access_rule(self.state_list[spot.world.id], spot=spot, age='adult', tod=tod)) or (
+                    and self.access(spot, 'adult', tod)) or (
                             self.can_reach(spot.parent_region, age='child', tod=tod)
-                            and spot.access_rule(self.state_list[spot.world.id], spot=spot, age='child', tod=tod))
+                            and self.access(spot, 'child', tod))
 
 
 class RewindableSearch(Search):
@@ -379,11 +764,11 @@ class RewindableSearch(Search):
         # in the top two caches (if it's the first being unvisited for a sphere)
         # in the topmost cache only (otherwise)
         # After we unvisit every location in a sphere, the top two caches have identical visited locations.
-        assert location in self.cached_spheres[-1].visited_locations
-        if location in self.cached_spheres[-2].visited_locations:
+        assert self.cached_spheres[-1].visited_locations[location.world.id][location.index]
+        if self.cached_spheres[-2].visited_locations[location.world.id][location.index]:
             self.cached_spheres.pop()
             self._cache = self.cached_spheres[-1]
-        self._cache.visited_locations.discard(location)
+        self._cache.writable(self._cache.visited_locations, location.world.id)[location.index] = 0
 
     def reset(self) -> None:
         self._cache = self.cached_spheres[0]
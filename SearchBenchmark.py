@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# Measures the time and memory used by search snapshots, the Search.copy
+# calls that the fill, goal and hint code makes in its inner loops.
+#
+#   python SearchBenchmark.py [--settings tests/multiworld.sav] [--seed SEED] [--count 1000]
+#
+# The worlds are built from the settings file without being filled, then
+# fully explored with their whole item pool, like the searches of the fill.
+from __future__ import annotations
+import argparse
+import json
+import logging
+import os
+import random
+import time
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+from Main import build_world_graphs, resolve_settings
+from Search import Search
+from Settings import Settings
+from Utils import local_path
+
+
+def time_per_call(function: Callable[[], Any], count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return (time.perf_counter() - start) / count
+
+
+def benchmark(settings_file: str, seed: str, count: int) -> dict[str, float]:
+    with open(settings_file) as f:
+        settings = Settings(json.load(f))
+    settings.update_seed(seed)
+    resolve_settings(settings)
+    worlds = build_world_graphs(settings)
+    itempool = [item for world in worlds for item in world.itempool]
+    search = Search.max_explore([world.state for world in worlds], itempool)
+    progression = [item for item in itempool if item.advancement]
+    rng = random.Random(seed)
+
+    # A copy that is only read, like the searches checking whether an item can be placed.
+    def read() -> None:
+        snapshot = search.copy()
+        snapshot.can_reach(worlds[0].get_region('Root'), age='adult')
+
+    # A copy that collects an item and explores again, like fill_restrictive.
+    def collect() -> None:
+        snapshot = search.copy()
+        snapshot.collect(rng.choice(progression))
+        snapshot.next_sphere()
+
+    results = {
+        'copy (us)': time_per_call(search.copy, count) * 1e6,
+        'copy and read (us)': time_per_call(read, count) * 1e6,
+        'copy, collect and expand (us)': time_per_call(collect, count) * 1e6,
+    }
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    snapshots = [search.copy() for _ in range(count)]
+    results['memory per copy (bytes)'] = (tracemalloc.get_traced_memory()[0] - before) / count
+    for snapshot in snapshots:
+        snapshot.collect(rng.choice(progression))
+        snapshot.next_sphere()
+    results['memory per expanded copy (bytes)'] = (tracemalloc.get_traced_memory()[0] - before) / count
+    tracemalloc.stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--settings', default=os.path.join(local_path('tests'), 'multiworld.sav'), help='Settings file to build the worlds from.')
+    parser.add_argument('--seed', default='BENCHMARK', help='Seed to build the worlds with.')
+    parser.add_argument('--count', type=int, default=1000, help='Number of snapshots to measure.')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(message)s', level=logging.WARNING)
+    for name, value in benchmark(args.settings, args.seed, args.count).items():
+        print(f'{name:>34}: {value:10.1f}')
+
+
+if __name__ == '__main__':
+    main()
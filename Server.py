@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# Long running generator. Keeps a pool of worker processes with every module
+# imported and the logic files already parsed, and generates seeds for settings
+# sent to a local HTTP API, either on a localhost port or on a Unix socket.
+#
+#   POST /generate           {"settings": {...}, "distribution": {...}, "seed": "..."}
+#                            Only "settings" is required. Responds with the seed info
+#                            and every output file, base64 encoded.
+#   POST /generate?stream=1  Same, but responds with newline delimited json events:
+#                            {"event": "log", ...} for every logged message, then
+#                            a single {"event": "result", ...} or {"event": "error", ...}.
+#   GET  /status             Worker count, queue depth and requests in flight.
+from __future__ import annotations
+import sys
+if sys.version_info < (3, 8):
+    print("OoT Randomizer requires Python version 3.8 or newer and you are using %s" % '.'.join([str(i) for i in sys.version_info[0:3]]))
+    sys.exit(1)
+
+import argparse
+import base64
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import socketserver
+import tempfile
+import threading
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import urlsplit, parse_qs
+
+from Main import main, save_module_state, restore_module_state
+from RuleParser import load_aliases
+from Settings import Settings
+from Utils import data_path, enable_logic_file_cache, read_logic_file
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class EventHandler(logging.Handler):
+    def __init__(self, events: queue.Queue) -> None:
+        super().__init__(logging.INFO)
+        self.events: queue.Queue = events
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.events.put({'event': 'log', 'level': record.levelname, 'message': record.getMessage()})
+        except Exception:
+            self.handleError(record)
+
+
+# The module state of a worker process once it parsed the logic files, restored
+# before every request.
+worker_module_state: dict[str, Any] = {}
+
+
+def worker_init(loglevel: int) -> None:
+    logging.basicConfig(format='[%(processName)s] %(message)s', level=loglevel, force=True)
+    # Parse every logic file once, so requests only pay for the generation itself.
+    enable_logic_file_cache()
+    load_aliases()
+    for logic_folder in ('World', 'Glitched World'):
+        for filename in os.listdir(data_path(logic_folder)):
+            if filename.endswith('.json'):
+                read_logic_file(os.path.join(data_path(logic_folder), filename))
+    worker_module_state.update(save_module_state())
+
+
+def worker_generate(request: dict[str, Any], events: Optional[queue.Queue] = None) -> dict[str, Any]:
+    restore_module_state(worker_module_state)
+    logger = logging.getLogger('')
+    handler = EventHandler(events) if events is not None else None
+    if handler:
+        logger.addHandler(handler)
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            settings_dict = dict(request['settings'])
+            settings_dict.update({
+                'output_dir': output_dir,
+                'output_file': '',
+                'count': 1,
+            })
+            if request.get('distribution') is not None:
+                distribution_file = os.path.join(output_dir, 'Plando.json')
+                with open(distribution_file, 'w') as f:
+                    json.dump(request['distribution'], f)
+                settings_dict['enable_distribution_file'] = True
+                settings_dict['distribution_file'] = distribution_file
+
+            settings = Settings(settings_dict)
+            if request.get('seed'):
+                settings.update_seed(request['seed'])
+                settings.custom_seed = True
+            main(settings)
+
+            files = {}
+            for filename in sorted(os.listdir(output_dir)):
+                if filename == 'Plando.json':
+                    continue
+                with open(os.path.join(output_dir, filename), 'rb') as f:
+                    files[filename] = base64.b64encode(f.read()).decode('ascii')
+        return {
+            'seed': settings.seed,
+            'settings_string': settings.settings_string,
+            'files': files,
+        }
+    finally:
+        if handler:
+            logger.removeHandler(handler)
+
+
+class Generator:
+    def __init__(self, workers: int, queue_depth: int, loglevel: int) -> None:
+        self.workers: int = workers
+        self.queue_depth: int = queue_depth
+        self.executor: ProcessPoolExecutor = ProcessPoolExecutor(workers, initializer=worker_init, initargs=(loglevel,))
+        self.manager = multiprocessing.Manager()
+        self.slots: threading.BoundedSemaphore = threading.BoundedSemaphore(workers + queue_depth)
+        self.lock: threading.Lock = threading.Lock()
+        self.in_flight: int = 0
+
+        # Start every worker now rather than on the first requests.
+        for future in [self.executor.submit(os.getpid) for _ in range(workers)]:
+            future.result()
+
+    def status(self) -> dict[str, int]:
+        return {'workers': self.workers, 'queue_depth': self.queue_depth, 'in_flight': self.in_flight}
+
+    def generate(self, request: dict[str, Any], on_event: Optional[Callable[[dict[str, Any]], None]] = None) -> dict[str, Any]:
+        if not self.slots.acquire(blocking=False):
+            raise QueueFullError(f'Generator queue is full ({self.workers + self.queue_depth} requests in flight).')
+        with self.lock:
+            self.in_flight += 1
+        try:
+            if on_event is None:
+                return self.executor.submit(worker_generate, request).result()
+
+            events = self.manager.Queue()
+            future = self.executor.submit(worker_generate, request, events)
+            while True:
+                try:
+                    on_event(events.get(timeout=0.1))
+                except queue.Empty:
+                    if future.done():
+                        break
+            # Everything logged before the worker returned is already in the queue.
+            while not events.empty():
+                on_event(events.get())
+            return future.result()
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            self.slots.release()
+
+    def shutdown(self) -> None:
+        self.executor.shutdown()
+        self.manager.shutdown()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server: ThreadingHTTPServer | ThreadingUnixHTTPServer
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address.
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def send_json(self, code: int, data: dict[str, Any]) -> None:
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_event(self, event: dict[str, Any]) -> None:
+        self.wfile.write(json.dumps(event).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+    def do_GET(self) -> None:
+        if urlsplit(self.path).path == '/status':
+            self.send_json(200, self.server.generator.status())
+        else:
+            self.send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        if url.path != '/generate':
+            self.send_json(404, {'error': f'Unknown path {self.path}'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if not isinstance(request, dict) or not isinstance(request.get('settings'), dict):
+                raise ValueError('Request must be a json object with a "settings" object.')
+        except ValueError as ex:
+            self.send_json(400, {'error': str(ex)})
+            return
+
+        if parse_qs(url.query).get('stream', ['0'])[0] not in ('1', 'true'):
+            try:
+                self.send_json(200, self.server.generator.generate(request))
+            except QueueFullError as ex:
+                self.send_json(503, {'error': str(ex)})
+            except Exception as ex:
+                self.send_json(500, {'error': f'{type(ex).__name__}: {ex}'})
+            return
+
+        # The response has no length, the end of the stream is the end of the connection.
+        self.close_connection = True
+        headers_sent = False
+        try:
+            def on_event(event: dict[str, Any]) -> None:
+                nonlocal headers_sent
+                if not headers_sent:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/x-ndjson')
+                    self.end_headers()
+                    headers_sent = True
+                self.write_event(event)
+            result = self.server.generator.generate(request, on_event)
+            on_event({'event': 'result', **result})
+        except QueueFullError as ex:
+            self.send_json(503, {'error': str(ex)})
+        except Exception as ex:
+            if headers_sent:
+                self.write_event({'event': 'error', 'error': f'{type(ex).__name__}: {ex}'})
+            else:
+                self.send_json(500, {'error': f'{type(ex).__name__}: {ex}'})
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def server_main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on.')
+    parser.add_argument('--socket', help='Listen on this Unix socket path instead of a TCP port.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of generator processes. Use 0 for one per CPU core.')
+    parser.add_argument('--queue_depth', type=int, default=4, help='Number of requests that may wait for a free worker before new ones are refused.')
+    parser.add_argument('--loglevel', default='info', const='info', nargs='?', choices=['error', 'info', 'warning', 'debug'], help='Select level of logging for output.')
+    args = parser.parse_args()
+
+    loglevel = {'error': logging.ERROR, 'info': logging.INFO, 'warning': logging.WARNING, 'debug': logging.DEBUG}[args.loglevel]
+    logging.basicConfig(format='%(message)s', level=loglevel)
+    logger = logging.getLogger('')
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    logger.info('Starting %d generator processes.', workers)
+    generator = Generator(workers, max(args.queue_depth, 0), loglevel)
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        httpd = ThreadingUnixHTTPServer(args.socket, RequestHandler)
+        logger.info('Listening on %s', args.socket)
+    else:
+        httpd = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+        logger.info('Listening on http://%s:%d', args.host, args.port)
+    httpd.generator = generator
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        generator.shutdown()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    server_main()
@@ -399,6 +399,9 @@ def get_settings_from_command_line_args() -> tuple[Settings, bool, str, bool, st
     parser.add_argument('--no_log', help='Suppresses the generation of a log file.', action='store_true')
     parser.add_argument('--output_settings', help='Always outputs a settings.json file even when spoiler is enabled.', action='store_true')
     parser.add_argument('--diff_rom', help='Generates a ZPF patch from the specified ROM file.')
+    parser.add_argument('--processes', type=int, help='Number of worker processes used to generate seeds when the count setting is greater than 1. Use 0 for one per CPU core.')
+    # Read by OoTRandomizer.py before anything is imported, only listed here for the help and validation.
+    parser.add_argument('--startup_profile', '--startup-profile', help='Logs how long each module took to import and how long it took to start generating.', action='store_true')
 
     args = parser.parse_args()
     settings_base = {}
@@ -440,6 +443,8 @@ def get_settings_from_command_line_args() -> tuple[Settings, bool, str, bool, st
     settings = Settings(settings_base)
 
     settings.output_settings = args.output_settings
+    if args.processes is not None:
+        settings.processes = args.processes
 
     if args.settings_string is not None:
         settings.update_with_settings_string(args.settings_string)
@@ -13,7 +13,7 @@ from Models import get_model_choices
 from SettingsListTricks import logic_tricks
 from SettingTypes import SettingInfo, SettingInfoStr, SettingInfoList, SettingInfoDict, Textbox, Button, Checkbutton, \
     Combobox, Radiobutton, Fileinput, Directoryinput, Textinput, ComboboxInt, Scale, Numberinput, MultipleSelect, \
-    SearchBox
+    SearchBox, SettingInfoInt
 import Sounds
 import StartingItems
 from Utils import data_path
@@ -33,6 +33,12 @@ class SettingInfos:
     generating_patch_file = Checkbutton(None)
     output_file = SettingInfoStr(None, None)
     seed = SettingInfoStr(None, None)
+    processes = SettingInfoInt(None, None, False, default=1)
+    speculative_attempts = SettingInfoInt(None, None, False, default=1)
+    speculative_entrance_attempts = SettingInfoInt(None, None, False, default=1)
+    fill_backtracks = SettingInfoInt(None, None, False, default=0)
+    cache_compiled_rules = Checkbutton(None, default=True)
+    rule_result_cache_size = SettingInfoInt(None, None, False, default=0)
 
     # GUI Only Buttons/Text
 
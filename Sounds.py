@@ -28,10 +28,13 @@ from __future__ import annotations
 import os
 from dataclasses import dataclass
 from enum import Enum
+from typing import TYPE_CHECKING
 
-from Rom import Rom
 from Utils import data_path
 
+if TYPE_CHECKING:
+    from Rom import Rom
+
 
 class Tags(Enum):
     LOOPED     = 0
@@ -3,7 +3,7 @@ import logging
 import random
 from collections import OrderedDict
 from itertools import chain
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Optional
 
 from Item import Item
 from LocationList import location_sort_order
@@ -16,6 +16,7 @@ if TYPE_CHECKING:
     from Hints import GossipText
     from Location import Location
     from Region import Region
+    from Search import SearchGoal
     from Settings import Settings
     from World import World
 
@@ -208,52 +209,13 @@ class Spoiler:
         # Reduce each sphere in reverse order, by checking if the game is beatable
         # when we remove the item. We do this to make sure that progressive items
         # like bow and slingshot appear as early as possible rather than as late as possible.
-        required_locations = []
-        for sphere in reversed(collection_spheres):
-            random.shuffle(sphere)
-            for location in sphere:
-                # we remove the item at location and check if the game is still beatable in case the item could be required
-                old_item = location.item
-
-                # Uncollect the item and location.
-                search.state_list[old_item.world.id].remove(old_item)
-                search.unvisit(location)
-
-                # Generic events might show up or not, as usual, but since we don't
-                # show them in the final output, might as well skip over them. We'll
-                # still need them in the final pass, so make sure to include them.
-                if location.internal:
-                    required_locations.append(location)
-                    continue
-
-                location.item = None
-
-                # An item can only be required if it isn't already obtained or if it's progressive
-                if search.state_list[old_item.world.id].item_count(old_item.solver_id) < old_item.world.max_progressions[old_item.name]:
-                    # Test whether the game is still beatable from here.
-                    logger.debug('Checking if %s is required to beat the game.', old_item.name)
-                    if not search.can_beat_game():
-                        # still required, so reset the item
-                        location.item = old_item
-                        required_locations.append(location)
+        # Taking items out and disconnecting entrances only makes fewer locations and
+        # regions relevant, so the goal stays valid through both reductions.
+        goal = search.goal()
+        required_locations = self.reduce_collection_spheres(search, goal, collection_spheres)
 
         # Reduce each entrance sphere in reverse order, by checking if the game is beatable when we disconnect the entrance.
-        required_entrances = []
-        for sphere in reversed(entrance_spheres):
-            random.shuffle(sphere)
-            for entrance in sphere:
-                # we disconnect the entrance and check if the game is still beatable
-                old_connected_region = entrance.disconnect()
-
-                # we use a new search to ensure the disconnected entrance is no longer used
-                sub_search = Search([world.state for world in worlds])
-
-                # Test whether the game is still beatable from here.
-                logger.debug('Checking if reaching %s, through %s, is required to beat the game.', old_connected_region.name, entrance.name)
-                if not sub_search.can_beat_game():
-                    # still required, so reconnect the entrance
-                    entrance.connect(old_connected_region)
-                    required_entrances.append(entrance)
+        required_entrances = self.reduce_entrance_spheres(worlds, goal, entrance_spheres)
 
         # Regenerate the spheres as we might not reach places the same way anymore.
         search.reset() # search state has no items, okay to reuse sphere 0 cache
@@ -305,6 +267,111 @@ class Spoiler:
         if worlds[0].entrance_shuffle:
             self.entrance_playthrough = OrderedDict((str(i + 1), list(sphere)) for i, sphere in enumerate(entrance_spheres))
 
+    # Takes the items out of the collection spheres, last sphere first, and returns the
+    # locations whose items are still required to reach the goal, along with the internal
+    # ones. Each item is kept exactly when the goal can't be reached without it and the
+    # items already taken out, but the items of a sphere are tested in blocks: the goal
+    # can only be reached without a whole block if it can without each of its items in
+    # turn, so a block that passes takes all of them out in a single test.
+    def reduce_collection_spheres(self, search: RewindableSearch, goal: SearchGoal, collection_spheres: list[list[Location]]) -> list[Location]:
+        logger = logging.getLogger('')
+        required_locations = []
+        for sphere in reversed(collection_spheres):
+            random.shuffle(sphere)
+            # The non-internal locations of the sphere with their items, in removal order.
+            removed: list[tuple[Location, Item]] = []
+            # The indexes in removed of the items taken out, and of the items to test.
+            dropped: set[int] = set()
+            candidates: list[int] = []
+            for location in sphere:
+                # Uncollect the item and location.
+                old_item = location.item
+                search.state_list[old_item.world.id].remove(old_item)
+                search.unvisit(location)
+
+                # Generic events might show up or not, as usual, but since we don't
+                # show them in the final output, might as well skip over them. We'll
+                # still need them in the final pass, so keep their items.
+                if location.internal:
+                    continue
+
+                # An item can only be required if it isn't already obtained or if it's progressive
+                if search.state_list[old_item.world.id].item_count(old_item.solver_id) < old_item.world.max_progressions[old_item.name]:
+                    candidates.append(len(removed))
+                else:
+                    dropped.add(len(removed))
+                removed.append((location, old_item))
+
+            # Tests the goal as it was when the last item of the block was taken out, without
+            # the items of the block. The items removed after it are still there to be found,
+            # since the whole sphere is reachable from the search's sphere cache.
+            def beatable_without(block: list[int]) -> bool:
+                last = block[-1]
+                for index, (location, item) in enumerate(removed):
+                    location.item = None if index <= last and (index in dropped or index in block) else item
+                logger.debug('Checking if %d items are required to beat the game.', len(block))
+                return search.can_beat_goal(goal)
+
+            # Goes through the candidates in blocks, growing while whole blocks can be
+            # taken out and shrinking when they hold a required item. In a block that
+            # can't be taken out, the first required item is found by bisection, and the
+            # ones after it are tested again with the next block.
+            start, size = 0, 1
+            while start < len(candidates):
+                block = candidates[start:start + size]
+                if beatable_without(block):
+                    dropped.update(block)
+                    start += len(block)
+                    size *= 2
+                    continue
+                while len(block) > 1:
+                    half = block[:len(block) // 2]
+                    if beatable_without(half):
+                        dropped.update(half)
+                        block = block[len(half):]
+                    else:
+                        block = half
+                start = candidates.index(block[0]) + 1
+                size = max(1, size // 2)
+            for index, (location, item) in enumerate(removed):
+                location.item = None if index in dropped else item
+            required_locations.extend(location for location in sphere if location.item is not None)
+        return required_locations
+
+    # Disconnects the entrances of the entrance spheres, last sphere first, and returns the
+    # ones the goal can't be reached without, which are connected again. Entrances the
+    # last search that reached the goal didn't go through are disconnected without a test,
+    # since that search would find the same regions without them.
+    def reduce_entrance_spheres(self, worlds: list[World], goal: SearchGoal, entrance_spheres: list[list[Entrance]]) -> list[Entrance]:
+        logger = logging.getLogger('')
+        used_entrances: Optional[set[Entrance]] = set()
+        if not Search([world.state for world in worlds], used_exits=used_entrances).can_beat_goal(goal):
+            # Without a search reaching the goal, every entrance is tested.
+            used_entrances = None
+        required_entrances = []
+        for sphere in reversed(entrance_spheres):
+            random.shuffle(sphere)
+            for entrance in sphere:
+                # we disconnect the entrance and check if the game is still beatable
+                old_connected_region = entrance.disconnect()
+                if used_entrances is not None and entrance not in used_entrances:
+                    # the last search reaching the goal didn't need it, so it isn't required
+                    continue
+
+                # we use a new search to ensure the disconnected entrance is no longer used
+                sub_used_entrances: set[Entrance] = set()
+                sub_search = Search([world.state for world in worlds], used_exits=sub_used_entrances)
+
+                # Test whether the game is still beatable from here.
+                logger.debug('Checking if reaching %s, through %s, is required to beat the game.', old_connected_region.name, entrance.name)
+                if sub_search.can_beat_goal(goal):
+                    used_entrances = sub_used_entrances
+                else:
+                    # still required, so reconnect the entrance
+                    entrance.connect(old_connected_region)
+                    required_entrances.append(entrance)
+        return required_entrances
+
 
 class Copier:
     def __init__(self, spoiler: Spoiler) -> None:
@@ -1,5 +1,6 @@
 from __future__ import annotations
-from collections.abc import Iterable
+import itertools
+from collections.abc import Callable, Iterable, Iterator
 from typing import TYPE_CHECKING, Optional, Any
 
 from Item import Item, ItemInfo
@@ -22,19 +23,64 @@ Ocarina_C_up_Button: int = ItemInfo.solver_ids['Ocarina_C_up_Button']
 Ocarina_C_down_Button: int = ItemInfo.solver_ids['Ocarina_C_down_Button']
 Ocarina_C_right_Button: int = ItemInfo.solver_ids['Ocarina_C_right_Button']
 
+# The solver ids read by the State functions that rules can call, besides the ids
+# passed to has, has_any_of and has_all_of. Rules calling any other function
+# are always evaluated again by the search (see RuleParser.rule_dependencies).
+function_dependencies: dict[str, frozenset[int]] = {
+    'has_bottle': frozenset(ItemInfo.bottle_ids | {Rutos_Letter}),
+    'has_hearts': frozenset({Piece_of_Heart}),
+    'has_medallions': frozenset(ItemInfo.medallion_ids),
+    'has_stones': frozenset(ItemInfo.stone_ids),
+    'has_dungeon_rewards': frozenset(ItemInfo.medallion_ids | ItemInfo.stone_ids),
+    'has_ocarina_buttons': frozenset(ItemInfo.ocarina_buttons_ids),
+    'has_all_notes_for_song': frozenset(ItemInfo.ocarina_buttons_ids),
+    'had_night_start': frozenset(),
+    'can_live_dmg': frozenset(),
+    'region_has_shortcuts': frozenset(),
+}
+
+# Item counts get a new version whenever they are created or changed, so states
+# with the same version have the same items (see Search.next_sphere and Search.RuleResultCache).
+state_versions: Iterator[int] = itertools.count()
+
+
 class State:
-    def __init__(self, parent: World) -> None:
-        self.solv_items: list[int] = [0] * len(ItemInfo.solver_ids)
+    def __init__(self, parent: World, solv_items: Optional[list[int]] = None) -> None:
+        # Copies share the item counts until either state collects or removes an item.
+        # The counts stay a list, and rules are evaluated for one state at a time: rules
+        # read single counts, which is faster from a list than from an array, sharing
+        # them makes copying one rare, and the search never has several states waiting
+        # on the same rule that an array-backed, batched evaluation could check at once.
+        self.solv_items: list[int]
+        self.shared_items: bool
+        if solv_items is None:
+            self.solv_items = [0] * len(ItemInfo.solver_ids)
+            self.shared_items = False
+        elif len(solv_items) < len(ItemInfo.solver_ids):
+            # Solver ids were added for events since the counts were created.
+            self.solv_items = solv_items + [0] * (len(ItemInfo.solver_ids) - len(solv_items))
+            self.shared_items = False
+        else:
+            self.solv_items = solv_items
+            self.shared_items = True
+        self.version: int = next(state_versions)
         self.world: World = parent
         self.search: Optional[Search] = None
 
     def copy(self, new_world: Optional[World] = None) -> State:
         new_world = new_world if new_world else self.world
-        new_state = State(new_world)
-        for i, val in enumerate(self.solv_items):
-            new_state.solv_items[i] = val
+        new_state = State(new_world, self.solv_items)
+        if new_state.shared_items:
+            self.shared_items = True
+            if new_world is self.world:
+                new_state.version = self.version
         return new_state
 
+    def own_items(self) -> None:
+        if self.shared_items:
+            self.solv_items = list(self.solv_items)
+            self.shared_items = False
+
     def item_name(self, location: str | Location) -> Optional[str]:
         location = self.world.get_location(location)
         if location.item is None:
@@ -50,6 +96,10 @@ class State:
     def won_normal(self) -> bool:
         return self.has(Triforce)
 
+    # The solver ids won reads.
+    def won_dependencies(self) -> frozenset[int]:
+        return frozenset({Triforce_Piece}) if self.world.settings.triforce_hunt else frozenset({Triforce})
+
     def has(self, item: int, count: int = 1) -> bool:
         return self.solv_items[item] >= count
 
@@ -121,6 +171,13 @@ class State:
                     return False
         return True
 
+    # The solver ids has_all_item_goals reads.
+    def item_goal_dependencies(self) -> frozenset[int]:
+        return frozenset(ItemInfo.solver_ids[escape_name(item_goal['name'])]
+                         for category in self.world.goal_categories.values()
+                         for goal in category.goals
+                         for item_goal in goal.items)
+
     def had_night_start(self) -> bool:
         stod = self.world.settings.starting_tod
         # These are all not between 6:30 and 18:00
@@ -146,36 +203,61 @@ class State:
     def guarantee_hint(self) -> bool:
         return self.world.parser.parse_rule('guarantee_hint')(self)
 
+    # The solver ids whose counts collecting or removing the item changes.
+    def item_solver_ids(self, item: Item) -> list[int]:
+        solver_ids = [item.solver_id]
+        if 'Small Key Ring' in item.name:
+            dungeon_name = item.name[:-1].split(' (', 1)[1]
+            if self.world.keyring_give_bk(dungeon_name):
+                solver_ids.append(ItemInfo.solver_ids[escape_name(f'Boss Key ({dungeon_name})')])
+        if item.alias and item.alias_id is not None:
+            solver_ids.append(item.alias_id)
+        return solver_ids
+
     # Be careful using this function. It will not collect any
     # items that may be locked behind the item, only the item itself.
     def collect(self, item: Item) -> None:
         if item.solver_id is None:
             raise Exception(f"Item '{item.name}' lacks a `solver_id` and can not be used in `State.collect()`.")
+        self.own_items()
+        self.version = next(state_versions)
+        changed = [item.solver_id]
         if 'Small Key Ring' in item.name:
             dungeon_name = item.name[:-1].split(' (', 1)[1]
             if self.world.keyring_give_bk(dungeon_name):
                 bk = f'Boss Key ({dungeon_name})'
                 self.solv_items[ItemInfo.solver_ids[escape_name(bk)]] = 1
+                changed.append(ItemInfo.solver_ids[escape_name(bk)])
         if item.alias and item.alias_id is not None:
             self.solv_items[item.alias_id] += item.alias[1]
+            changed.append(item.alias_id)
         self.solv_items[item.solver_id] += 1
+        if self.search is not None:
+            self.search.items_changed(self.world.id, changed)
 
     # Be careful using this function. It will not uncollect any
     # items that may be locked behind the item, only the item itself.
     def remove(self, item: Item) -> None:
         if item.solver_id is None:
             raise Exception(f"Item '{item.name}' lacks a `solver_id` and can not be used in `State.remove()`.")
+        self.own_items()
+        self.version = next(state_versions)
+        changed = [item.solver_id]
         if 'Small Key Ring' in item.name:
             dungeon_name = item.name[:-1].split(' (', 1)[1]
             if self.world.keyring_give_bk(dungeon_name):
                 bk = f'Boss Key ({dungeon_name})'
                 self.solv_items[ItemInfo.solver_ids[escape_name(bk)]] = 0
+                changed.append(ItemInfo.solver_ids[escape_name(bk)])
         if item.alias and item.alias_id is not None and self.solv_items[item.alias_id] > 0:
             self.solv_items[item.alias_id] -= item.alias[1]
             if self.solv_items[item.alias_id] < 0:
                 self.solv_items[item.alias_id] = 0
+            changed.append(item.alias_id)
         if self.solv_items[item.solver_id] > 0:
             self.solv_items[item.solver_id] -= 1
+        if self.search is not None:
+            self.search.items_changed(self.world.id, changed)
 
     def region_has_shortcuts(self, region_name: str) -> bool:
         return self.world.region_has_shortcuts(region_name)
@@ -218,3 +300,11 @@ class State:
                 for event in self.world.event_items
                 if self.solv_items[ItemInfo.solver_ids[event]]},
         }
+
+
+# The solver ids read by the predicates a SearchGoal can be made for, for each
+# state (see Search.goal). Goals for other predicates collect every progression location.
+predicate_dependencies: dict[Callable[[State], bool], Callable[[State], frozenset[int]]] = {
+    State.won: State.won_dependencies,
+    State.has_all_item_goals: State.item_goal_dependencies,
+}
@@ -3,26 +3,45 @@
 # See `python -m unittest -h` or `pytest -h` for more options.
 
 from __future__ import annotations
+import ast
+import base64
 import json
 import logging
 import os
+import pickle
 import random
 import re
+import tempfile
+import threading
+import urllib.error
+import urllib.request
 import unittest
+from unittest import mock
 from collections import Counter, defaultdict
 from typing import Literal, Optional, Any, overload
 
+from Entrance import Entrance
+import EntranceShuffle
 from EntranceShuffle import EntranceShuffleError
-from Fill import ShuffleError
+from Fill import FillError, ShuffleError, fill_restrictive
 from Hints import HintArea, build_misc_item_hints
-from Item import ItemInfo
+from Item import Item, ItemFactory, ItemInfo
 from ItemPool import remove_junk_items, remove_junk_ludicrous_items, ludicrous_items_base, ludicrous_items_extended, trade_items, ludicrous_exclusions
+from Location import Location
 from LocationList import location_is_viewable
-from Main import main, resolve_settings, build_world_graphs
+from LogicToBinary import create_logic_binary, logic_files
+from Main import main, batch_main, resolve_settings, build_world_graphs, place_items, attempt_seed, generate_speculatively
 from Messages import Message, read_messages, shuffle_messages
 from Settings import Settings, get_preset_files
 from Spoiler import Spoiler
 from Rom import Rom
+from Server import Generator, RequestHandler, ThreadingHTTPServer
+import RuleCache
+from RuleCache import dump_world_graph_template, load_world_graph_template, remap_solver_ids
+from RuleParser import optimize_rule, rule_reads
+from Search import RewindableSearch, Search, SearchGoal, rule_result_statistics
+from Utils import LogicBinary, can_fork_attempts, data_path, load_logic_file, parse_logic_file, read_logic_binary
+from World import World, WorldGraphTemplate, world_graph_templates
 
 test_dir = os.path.join(os.path.dirname(__file__), 'tests')
 output_dir = os.path.join(test_dir, 'Output')
@@ -30,6 +49,20 @@ os.makedirs(output_dir, exist_ok=True)
 
 logging.basicConfig(level=logging.INFO, filename=os.path.join(output_dir, 'LAST_TEST_LOG'), filemode='w')
 
+# Compiled world graphs are cached in a temporary folder instead of the checkout's Logs folder.
+rule_cache_dir = tempfile.TemporaryDirectory()
+rule_cache_patch = mock.patch('RuleCache.rule_cache_path', lambda world, key, rule_cache_path=RuleCache.rule_cache_path:
+                              os.path.join(rule_cache_dir.name, os.path.basename(rule_cache_path(world, key))))
+
+
+def setUpModule() -> None:
+    rule_cache_patch.start()
+
+
+def tearDownModule() -> None:
+    rule_cache_patch.stop()
+    rule_cache_dir.cleanup()
+
 # items never required:
 # refills, maps, compasses, capacity upgrades, masks (not listed in logic)
 never_prefix = ['Bombs', 'Arrows', 'Rupee', 'Deku Seeds', 'Map', 'Compass']
@@ -663,6 +696,492 @@ class TestEntranceRandomizer(unittest.TestCase):
                 build_world_graphs(settings)
 
 
+# Shuffles every type of entrance of a seed, and returns where each entrance leads.
+def shuffle_entrances_for_test(settings_dict: Optional[dict[str, Any]] = None) -> list[tuple[str, str]]:
+    settings = make_settings_for_test({
+        'shuffle_interior_entrances': 'all', 'shuffle_grotto_entrances': True, 'shuffle_dungeon_entrances': 'all',
+        'shuffle_overworld_entrances': True, 'owl_drops': True, 'warp_songs': True, 'spawn_positions': ['child', 'adult'],
+        'open_forest': 'open', **(settings_dict or {}),
+    }, seed='TESTTESTTEST1')
+    resolve_settings(settings)
+    worlds = build_world_graphs(settings)
+    return [(entrance.name, entrance.connected_region.name) for entrance in worlds[0].get_shuffled_entrances()]
+
+
+# The caches of EntranceShuffle have to lead to the same placements as recomputing everything.
+class TestEntranceValidation(unittest.TestCase):
+    def test_validation_searches(self):
+        validation_search = EntranceShuffle.validation_search
+
+        def new_search(*args, **kwargs) -> Search:
+            EntranceShuffle.validation_searches.clear()
+            return validation_search(*args, **kwargs)
+        with mock.patch('EntranceShuffle.validation_search', new_search):
+            expected = shuffle_entrances_for_test()
+        self.assertEqual(expected, shuffle_entrances_for_test())
+
+    def test_compatibility(self):
+        plausible = EntranceShuffle.EntranceCompatibility.plausible
+        ruled_out = []
+
+        # Every target ruled out has to fail the checks replace_entrance makes.
+        def checked(compatibility: EntranceShuffle.EntranceCompatibility, entrance: Entrance, target: Entrance) -> bool:
+            if plausible(compatibility, entrance, target):
+                return True
+            ruled_out.append((entrance.name, target.name))
+            rollbacks = []
+            if EntranceShuffle.replace_entrance([entrance.world], entrance, target, rollbacks, (), []):
+                EntranceShuffle.restore_connections(entrance, target)
+                self.fail(f'{entrance} was ruled out for {target}, but can replace it')
+            return False
+        with mock.patch('EntranceShuffle.EntranceCompatibility.plausible', checked):
+            expected = shuffle_entrances_for_test()
+        self.assertTrue(ruled_out, 'Some targets should have been ruled out')
+        with mock.patch('EntranceShuffle.EntranceCompatibility.plausible', return_value=True):
+            self.assertEqual(expected, shuffle_entrances_for_test())
+
+    def test_age_checks(self):
+        restore_connections = EntranceShuffle.restore_connections
+        rollbacks = 0
+
+        # Once a placement is rolled back, the age checks kept have to be what checking again would give.
+        def checked(entrance: Entrance, target: Entrance) -> None:
+            nonlocal rollbacks
+            restore_connections(entrance, target)
+            rollbacks += 1
+            for (checked_entrance, age, ignored), (unreachable, regions) in EntranceShuffle.unreachable_as_results.items():
+                if all(region.entrances_version == version for region, version in regions):
+                    self.assertEqual(EntranceShuffle.entrance_unreachable_as(checked_entrance, age, [ignored]), unreachable)
+        with mock.patch('EntranceShuffle.restore_connections', checked):
+            expected = shuffle_entrances_for_test()
+        self.assertGreater(rollbacks, 0)
+        with mock.patch('EntranceShuffle.cached_entrance_unreachable_as',
+                        lambda entrance, age, ignored: EntranceShuffle.entrance_unreachable_as(entrance, age, [ignored])):
+            self.assertEqual(expected, shuffle_entrances_for_test())
+
+    def test_age_check_rollback(self):
+        settings = make_settings_for_test({}, seed='TESTTESTTEST')
+        resolve_settings(settings)
+        world = build_world_graphs(settings)[0]
+        self.addCleanup(EntranceShuffle.unreachable_as_results.clear)
+        self.addCleanup(EntranceShuffle.connection_journal.clear)
+        fountain_exit = world.get_entrance('OGC Great Fairy Fountain -> Castle Grounds')
+        potion_shop = world.get_entrance('Kakariko Village -> Kak Potion Shop Front')
+        fountain_target, _ = EntranceShuffle.assume_entrance_pool([fountain_exit.reverse, potion_shop])
+        key = (fountain_exit, 'child', fountain_exit.reverse)
+
+        def unreachable_as_child() -> bool:
+            unreachable = EntranceShuffle.cached_entrance_unreachable_as(fountain_exit, 'child', fountain_exit.reverse)
+            self.assertEqual(EntranceShuffle.entrance_unreachable_as(fountain_exit, 'child', [fountain_exit.reverse]), unreachable)
+            return unreachable
+        self.assertTrue(unreachable_as_child())
+        result = EntranceShuffle.unreachable_as_results[key]
+
+        # Leading the potion shop into the fountain makes its exit reachable as child from Kakariko, so
+        # validate_world rejects the placement. Rolling it back gives the first result back.
+        EntranceShuffle.change_connections(potion_shop, fountain_target)
+        self.assertFalse(unreachable_as_child())
+        EntranceShuffle.restore_connections(potion_shop, fountain_target)
+        self.assertIs(result, EntranceShuffle.unreachable_as_results[key])
+        with mock.patch('EntranceShuffle.entrance_unreachable_as', side_effect=AssertionError('The result should be kept')):
+            self.assertTrue(EntranceShuffle.cached_entrance_unreachable_as(fountain_exit, 'child', fountain_exit.reverse))
+        self.assertTrue(unreachable_as_child())
+
+    def test_restart_world(self):
+        settings = make_settings_for_test({'shuffle_interior_entrances': 'simple', 'open_forest': 'open'}, seed='TESTTESTTEST')
+        resolve_settings(settings)
+        world = build_world_graphs(settings)[0]
+
+        def reachable(search: Search) -> list[tuple[bool, bool]]:
+            return [(search.can_reach(region, 'child'), search.can_reach(region, 'adult')) for region in world.regions]
+        search = Search([world.state])
+        before = reachable(search)
+        # Without items, disconnecting the way to the Market cuts it off until it is connected again.
+        entrance = world.get_entrance('Hyrule Field -> Market Entrance')
+        region = entrance.disconnect()
+        search.restart_world(world.state)
+        self.assertEqual(reachable(Search([world.state])), reachable(search))
+        self.assertNotEqual(before, reachable(search))
+        entrance.connect(region)
+        search.restart_world(world.state)
+        self.assertEqual(before, reachable(search))
+
+
+@unittest.skipUnless(can_fork_attempts(), 'Entrance placement attempts can only run at once in forked processes')
+class TestSpeculativeEntranceAttempts(unittest.TestCase):
+    # The first attempt starts from the same random state as the placement would without workers.
+    def test_same_as_serial(self):
+        self.assertEqual(shuffle_entrances_for_test(), shuffle_entrances_for_test({'speculative_entrance_attempts': 3}))
+
+    # Errors other than EntranceShuffleError are raised as they would be without workers.
+    def test_unexpected_error(self):
+        with mock.patch('EntranceShuffle.place_entrances', side_effect=KeyError('Unknown entrance')):
+            with self.assertRaises(KeyError):
+                shuffle_entrances_for_test({'speculative_entrance_attempts': 2})
+
+    # Shuffles the entrances with three attempts. The first two fail, and the third places the entrances as
+    # they would be placed without workers. The worker of the second attempt exits without a word instead,
+    # unless crash_file exists, which it creates first.
+    def shuffle_with_crash(self, crash_file: str) -> list[tuple[str, str]]:
+        speculative_random_states = EntranceShuffle.speculative_random_states
+        place_entrances = EntranceShuffle.place_entrances
+        # Workers are forked once the states are known, so they see them too.
+        random_states = []
+
+        def record_states(attempts: int) -> list[tuple]:
+            random_states[:] = speculative_random_states(attempts)
+            return random_states
+
+        def attempt(*placement: Any) -> Any:
+            number = random_states.index(random.getstate()) + 1
+            if number == 2 and not os.path.exists(crash_file):
+                open(crash_file, 'w').close()
+                os._exit(1)
+            if number < 3:
+                raise EntranceShuffleError(f'Attempt {number} failed')
+            random.setstate(random_states[0])
+            return place_entrances(*placement)
+        with mock.patch('EntranceShuffle.speculative_random_states', record_states), mock.patch('EntranceShuffle.place_entrances', attempt):
+            return shuffle_entrances_for_test({'speculative_entrance_attempts': 3})
+
+    # A worker that dies has its attempt made again, and when that fails the next attempts are still used.
+    def test_crashed_worker(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            crash_file = os.path.join(temp_dir, 'crashed')
+            self.assertEqual(shuffle_entrances_for_test(), self.shuffle_with_crash(crash_file))
+            self.assertTrue(os.path.exists(crash_file), 'The worker of the second attempt should have exited')
+
+
+class TestFillBacktracking(unittest.TestCase):
+    # The Bow only fits in the first chest. Whenever the Slingshot is placed
+    # there first, the fill runs into a dead end with the Bow.
+    # Also returns the items in the order the fill went through them.
+    def fill(self, seed: int, backtracks: int) -> tuple[list[Location], int, list[str]]:
+        settings = make_settings_for_test({'reachable_locations': 'all', 'open_forest': 'open', 'starting_age': 'child'}, seed='TESTTESTTEST')
+        resolve_settings(settings)
+        worlds = build_world_graphs(settings)
+        world = worlds[0]
+        chests = [world.get_location('KF Midos Top Left Chest'), world.get_location('KF Midos Top Right Chest')]
+        chests[1].item_rule = lambda location, item: item.name != 'Bow'
+        order = []
+        uncollect = Search.uncollect
+
+        def record(search: Search, item: Item) -> None:
+            order.append(item.name)
+            uncollect(search, item)
+        random.seed(seed)
+        with mock.patch.object(Search, 'uncollect', record):
+            backtracked = fill_restrictive(worlds, Search([world.state]), list(chests), ItemFactory(['Bow', 'Slingshot'], world), backtracks=backtracks)
+        return chests, backtracked, order
+
+    def test_backtracking(self):
+        dead_ends = 0
+        for seed in range(8):
+            with self.subTest(seed=seed):
+                chests, backtracked, order = self.fill(seed, 20)
+                self.assertEqual(['Bow', 'Slingshot'], [chest.item.name for chest in chests])
+                # The undone items go back to where they were in the pool.
+                self.assertEqual(['Slingshot', 'Bow'] * (backtracked + 1), order)
+                if backtracked:
+                    dead_ends += 1
+                    with self.assertRaises(FillError):
+                        self.fill(seed, 0)
+        self.assertGreater(dead_ends, 0, 'Some seeds should run into the dead end')
+
+
+class TestReachableLocations(unittest.TestCase):
+    # Goes through the locations like iter_reachable_locations did before it passed over any,
+    # checking every unvisited location on every pass, and collects each one it reaches.
+    @staticmethod
+    def collect_every_pass(search: Search, locations: list[Location]) -> list[Location]:
+        reached = []
+        had_reachable_locations = True
+        while had_reachable_locations:
+            child_regions, adult_regions, visited_locations = search.next_sphere()
+            had_reachable_locations = False
+            for location in locations:
+                world_id = location.world.id
+                state = search.state_list[world_id]
+                if visited_locations[world_id][location.index]:
+                    continue
+                if ((adult_regions[world_id][location.parent_region.index] and location.access_rule(state, spot=location, age='adult'))
+                        or (child_regions[world_id][location.parent_region.index] and location.access_rule(state, spot=location, age='child'))):
+                    had_reachable_locations = True
+                    search._cache.writable(visited_locations, world_id)[location.index] = 1
+                    reached.append(location)
+                    search.collect(location.item)
+        return reached
+
+    # Items found for other worlds change their items during a pass.
+    def test_multiworld_order(self):
+        settings = make_settings_for_test({'world_count': 3}, seed='TESTTESTTEST')
+        resolve_settings(settings)
+        worlds = build_world_graphs(settings)
+        place_items(worlds)
+        search = Search([world.state for world in worlds])
+        locations = search.progression_locations()
+        self.assertTrue(any(location.item.world is not location.world for location in locations))
+
+        expected = self.collect_every_pass(Search([world.state for world in worlds]), locations)
+        reached = []
+        for location in search.iter_reachable_locations(locations):
+            reached.append(location)
+            search.collect(location.item)
+        self.assertEqual([(location.world.id, location.name) for location in expected], [(location.world.id, location.name) for location in reached])
+
+
+class TestRuleResultCache(unittest.TestCase):
+    def fill(self, cache_size: int) -> list[tuple[str, str]]:
+        settings = make_settings_for_test({'rule_result_cache_size': cache_size}, seed='TESTTESTTEST')
+        resolve_settings(settings)
+        worlds = build_world_graphs(settings)
+        place_items(worlds)
+        return [(location.name, location.item.name) for world in worlds for location in world.get_locations() if location.item is not None]
+
+    # Small caches start over many times during the fill.
+    def test_same_fill(self):
+        rule_result_statistics.clear()
+        expected = self.fill(0)
+        self.assertEqual(0, sum(rule_result_statistics.values()), 'The cache should be off by default')
+        for cache_size in (16, 65536):
+            with self.subTest(cache_size=cache_size):
+                rule_result_statistics.clear()
+                self.assertEqual(expected, self.fill(cache_size))
+                self.assertGreater(rule_result_statistics['hits'], 0)
+
+
+class TestWorldGraphCache(unittest.TestCase):
+    # Everything about a region graph that a copy has to reproduce.
+    def describe_graph(self, world: World) -> list[Any]:
+        return [(
+            region.name, region.dungeon and region.dungeon.name, region.savewarp and region.savewarp.name,
+            [(location.name, location.rule_string, location.access_rule and location.access_rule.__code__,
+              location.always, location.never, location.locked, location.internal, location.item and location.item.name)
+             for location in region.locations],
+            [(exit.name, exit.connected_region, exit.rule_string, exit.access_rule.__code__, exit.always, exit.never)
+             for exit in region.exits],
+        ) for region in world.regions]
+
+    def test_cached_graph(self):
+        settings = make_settings_for_test({
+            'world_count': 3, 'cache_compiled_rules': False, 'adult_trade_start': ['Claim Check'],
+            'mq_dungeons_mode': 'specific', 'mq_dungeons_specific': ['Deku Tree', 'Fire Temple', 'Ganons Castle'],
+        }, seed='TESTTESTTEST')
+        resolve_settings(settings)
+        world_graph_templates.clear()
+        world = World(0, settings.copy())
+        savewarps = world.create_region_graph()
+        expected = self.describe_graph(world)
+
+        copied = World(1, settings.copy())
+        copied_savewarps = copied.create_region_graph()
+        key = WorldGraphTemplate.get_key(world)
+        self.assertEqual(1, len(world_graph_templates[key]), 'The second world should use the graph of the first one')
+        self.assertEqual(expected, self.describe_graph(copied))
+        self.assertEqual([(exit.name, target) for exit, target in savewarps], [(exit.name, target) for exit, target in copied_savewarps])
+        self.assertTrue(all(region.world is copied for region in copied.regions))
+
+        template = load_world_graph_template(dump_world_graph_template(world_graph_templates[key][0]))
+        loaded = World(2, settings.copy())
+        self.assertTrue(template.matches(loaded))
+        template.apply(loaded)
+        self.assertEqual(expected, self.describe_graph(loaded))
+        self.assertEqual(world.parser.events, loaded.parser.events)
+        self.assertEqual(world.event_items, loaded.event_items)
+
+    def test_unreadable_cache(self):
+        settings = make_settings_for_test({'cache_compiled_rules': False}, seed='TESTTESTTEST')
+        resolve_settings(settings)
+        world_graph_templates.clear()
+        compiled = World(0, settings.copy())
+        compiled.create_region_graph()
+        expected = self.describe_graph(compiled)
+
+        settings.cache_compiled_rules = True
+        for contents in (b'not a pickle', pickle.dumps([{'template': None}]), pickle.dumps([])):
+            with self.subTest(contents=contents[:20]):
+                world_graph_templates.clear()
+                world = World(0, settings.copy())
+                file_path = RuleCache.rule_cache_path(world, WorldGraphTemplate.get_key(world))
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with open(file_path, 'wb') as f:
+                    f.write(contents)
+                world.create_region_graph()
+                self.assertEqual(expected, self.describe_graph(world))
+
+    def test_remap_solver_ids(self):
+        # Other processes may have numbered the events differently.
+        self.assertEqual({'dependencies': frozenset({5}), 'reads': (frozenset({5, 7}), True)},
+                         remap_solver_ids({'dependencies': frozenset({1}), 'reads': (frozenset({1, 2}), True)}, {1: 5, 2: 7}))
+        self.assertEqual({'dependencies': None, 'reads': None},
+                         remap_solver_ids({'dependencies': None, 'reads': None}, {1: 5}))
+
+
+class TestBatchGeneration(unittest.TestCase):
+    # A worker that generates several seeds has to generate each one as if it were the first.
+    def test_batch_matches_serial(self):
+        with tempfile.TemporaryDirectory() as batch_dir, tempfile.TemporaryDirectory() as serial_dir:
+            settings = make_settings_for_test({'output_dir': batch_dir}, seed='TESTTESTTEST')
+            settings.output_file = ''
+            settings.count = 2
+            settings.processes = 1
+            # The workers' records go to the handlers of this process.
+            with self.assertLogs(level=logging.INFO) as logs:
+                batch_main(settings)
+            self.assertTrue(any(record.getMessage().startswith('[') and 'OoT Randomizer Version' in record.getMessage() for record in logs.records))
+            batch_spoilers = sorted(filename for filename in os.listdir(batch_dir) if filename.endswith('_Spoiler.json'))
+            self.assertEqual(2, len(batch_spoilers))
+
+            settings = make_settings_for_test({'output_dir': serial_dir}, seed='TESTTESTTEST-1')
+            settings.output_file = ''
+            main(settings)
+            serial_spoiler, = [filename for filename in os.listdir(serial_dir) if filename.endswith('_Spoiler.json')]
+            self.assertIn(serial_spoiler, batch_spoilers)
+            batch = load_spoiler(os.path.join(batch_dir, serial_spoiler))
+            serial = load_spoiler(os.path.join(serial_dir, serial_spoiler))
+            self.assertEqual(serial['locations'], batch['locations'])
+
+
+class TestSpeculativeAttempts(unittest.TestCase):
+    # Runs generate_speculatively with a generate that only reports which attempt it
+    # was given, failing the attempts in worker_failures when run in a worker process
+    # and those in parent_failures when run in this one.
+    def run_attempts(self, worker_failures: dict[int, Exception], parent_failures: Optional[dict[int, Exception]] = None) -> str:
+        parent_failures = parent_failures or {}
+        settings = make_settings_for_test({}, seed='TESTTESTTEST')
+        resolve_settings(settings)
+        attempts = {random.Random(attempt_seed(settings, attempt)).random(): attempt for attempt in range(2, 6)}
+        parent = os.getpid()
+
+        def generate(settings: Settings) -> str:
+            attempt = attempts.get(random.random(), 1)
+            failures = parent_failures if os.getpid() == parent else worker_failures
+            if attempt in failures:
+                raise failures[attempt]
+            return f'attempt {attempt}'
+
+        random.seed(settings.numeric_seed)
+        with mock.patch('Main.generate', generate):
+            return generate_speculatively(settings, 5, 3)
+
+    def test_lowest_success_wins(self):
+        self.assertEqual('attempt 1', self.run_attempts({}))
+        self.assertEqual('attempt 4', self.run_attempts({2: ShuffleError('2'), 3: ShuffleError('3')}, {1: ShuffleError('1')}))
+
+    def test_failed_regeneration(self):
+        # The worker and this process disagree on attempt 2, so attempt 3 is used.
+        self.assertEqual('attempt 3', self.run_attempts({}, {1: ShuffleError('1'), 2: ShuffleError('2')}))
+        with self.assertRaises(ShuffleError):
+            self.run_attempts({}, {attempt: ShuffleError(str(attempt)) for attempt in range(1, 6)})
+
+    def test_crashed_worker(self):
+        self.assertEqual('attempt 3', self.run_attempts({2: ValueError('2')}, {1: ShuffleError('1')}))
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.generator = Generator(1, 0, logging.WARNING)
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), RequestHandler)
+        self.httpd.generator = self.generator
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%d' % self.httpd.server_address[1]
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.generator.shutdown()
+
+    def post(self, path: str, body: bytes) -> Any:
+        return urllib.request.urlopen(urllib.request.Request(self.url + path, data=body, method='POST'))
+
+    def test_generate(self):
+        with urllib.request.urlopen(self.url + '/status') as response:
+            self.assertEqual({'workers': 1, 'queue_depth': 0, 'in_flight': 0}, json.load(response))
+
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.post('/generate', b'{"seed": "TESTTESTTEST"}')
+        self.assertEqual(400, context.exception.code)
+
+        request = {
+            'settings': {'create_patch_file': False, 'create_compressed_rom': False, 'create_wad_file': False,
+                         'create_uncompressed_rom': False, 'create_spoiler': True},
+            'seed': 'TESTTESTTEST',
+        }
+        with self.post('/generate?stream=1', json.dumps(request).encode('utf-8')) as response:
+            events = [json.loads(line) for line in response]
+        self.assertTrue(any(event['event'] == 'log' for event in events))
+        result = events[-1]
+        self.assertEqual('result', result['event'])
+        self.assertEqual('TESTTESTTEST', result['seed'])
+        spoiler_files = [filename for filename in result['files'] if filename.endswith('_Spoiler.json')]
+        self.assertEqual(1, len(spoiler_files))
+        spoiler = json.loads(base64.b64decode(result['files'][spoiler_files[0]]))
+        self.assertEqual('TESTTESTTEST', spoiler[':seed'])
+
+
+class TestLogicBinary(unittest.TestCase):
+    def test_same_as_json(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'logic.bin')
+            create_logic_binary(path)
+            binary = LogicBinary(path)
+            for file_path in logic_files():
+                with self.subTest(file_path=file_path):
+                    self.assertEqual(parse_logic_file(file_path), binary.read(file_path))
+
+            # Unchanged json files are only looked up, not read again.
+            binary = LogicBinary(path)
+            with mock.patch('Utils.hashlib.sha256', side_effect=AssertionError('The json file should not be hashed')):
+                self.assertIsNotNone(binary.read(data_path('LogicHelpers.json')))
+
+            # A json file with another modification time is hashed, and only used if its contents are the same.
+            binary = LogicBinary(path)
+            binary.index = {name: (digest, mtime_ns + 1, size, offset, length) for name, (digest, mtime_ns, size, offset, length) in binary.index.items()}
+            self.assertEqual(parse_logic_file(data_path('LogicHelpers.json')), binary.read(data_path('LogicHelpers.json')))
+            binary = LogicBinary(path)
+            binary.index = {name: (b'', mtime_ns + 1, size, offset, length) for name, (digest, mtime_ns, size, offset, length) in binary.index.items()}
+            self.assertIsNone(binary.read(data_path('LogicHelpers.json')))
+
+    def test_written_on_first_use(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'generated', 'logic.bin')
+            with mock.patch('Utils.logic_binary_path', lambda: path):
+                file_path = os.path.join(data_path('World'), 'Overworld.json')
+                self.assertEqual(parse_logic_file(file_path), load_logic_file(file_path))
+                self.assertTrue(os.path.isfile(path))
+                self.assertEqual(parse_logic_file(file_path), read_logic_binary(file_path))
+
+
+class TestRuleOptimizer(unittest.TestCase):
+    def assertOptimized(self, expected: str, rule: str) -> None:
+        # Compares dumps, as ast.unparse needs Python 3.9. Before 3.9, parsed
+        # constants have a kind and those the optimizer makes don't.
+        def dump(node: ast.expr) -> str:
+            return ast.dump(node).replace(', kind=None', '')
+        self.assertEqual(dump(ast.parse(expected, mode='eval').body),
+                         dump(optimize_rule(ast.parse(rule, mode='eval').body)))
+
+    def test_optimize_rule(self):
+        self.assertOptimized('state.has_all_of((Bow, Hookshot))',
+                             'state.has(Hookshot) and True and (state.has(Bow) and state.has(Hookshot))')
+        self.assertOptimized('True', 'state.has(Bow) or not False')
+        self.assertOptimized('False', 'state.has(Bow) and (False or 0)')
+        self.assertOptimized('state.has(Bow)', 'state.has(Bow) if True else state.has(Hookshot)')
+        # Cheap checks run before the search has to explore at a time of day.
+        self.assertOptimized('state.has_any_of((Bow, Hookshot)) or state.search.can_reach(spot.parent_region, age=age, tod=TimeOfDay.DAY)',
+                             'state.search.can_reach(spot.parent_region, age=age, tod=TimeOfDay.DAY) or state.has(Bow) or state.has(Hookshot)')
+
+    def test_rule_reads(self):
+        def reads(rule: str):
+            return rule_reads(ast.parse(rule, mode='eval').body)
+        bow = ItemInfo.solver_ids['Bow']
+        self.assertEqual((frozenset({bow}), False), reads("age == 'adult' and state.has(Bow)"))
+        self.assertEqual((frozenset({bow}), True),
+                         reads('state.has(Bow) or state.search.can_reach(spot.parent_region, age=age, tod=TimeOfDay.DAY)'))
+        self.assertIsNone(reads("state.has(Bow) and spot.name == 'Pierre'"))
+        self.assertIsNone(reads('state.search.can_reach(spot.parent_region, age=age)'))
+
+
 class TestValidSpoilers(unittest.TestCase):
     # Normalizes spoiler dict for single world or multiple worlds
     # Single world worlds_dict is a map of key -> value
@@ -789,6 +1308,42 @@ class TestValidSpoilers(unittest.TestCase):
             {loc: items - junk_set for loc, items in locitems.items()},
             'Disabled locations have non-junk')
 
+    # The required locations found by removing the items of the spheres one at a
+    # time, as Spoiler.reduce_collection_spheres did before it tested them in blocks.
+    @staticmethod
+    def reduce_collection_spheres_one_by_one(spoiler: Spoiler, search: RewindableSearch, goal: SearchGoal, collection_spheres: list[list[Location]]) -> list[Location]:
+        required_locations = []
+        for sphere in reversed(collection_spheres):
+            random.shuffle(sphere)
+            for location in sphere:
+                old_item = location.item
+                search.state_list[old_item.world.id].remove(old_item)
+                search.unvisit(location)
+                if location.internal:
+                    required_locations.append(location)
+                    continue
+                location.item = None
+                if search.state_list[old_item.world.id].item_count(old_item.solver_id) < old_item.world.max_progressions[old_item.name]:
+                    if not search.can_beat_goal(goal):
+                        location.item = old_item
+                        required_locations.append(location)
+        return required_locations
+
+    # Checks that testing the items in blocks keeps the same items as removing them one at a time.
+    def verify_required_locations(self, spoiler: Spoiler) -> None:
+        results = []
+        for reduce in (Spoiler.reduce_collection_spheres, self.reduce_collection_spheres_one_by_one):
+            required = []
+            def record(*args, reduce=reduce, required=required):
+                required_locations = reduce(*args)
+                required.extend((location.world.id, location.name) for location in required_locations)
+                return required_locations
+            random.seed(spoiler.settings.seed)
+            with mock.patch.object(Spoiler, 'reduce_collection_spheres', record):
+                spoiler.create_playthrough()
+            results.append(required)
+        self.assertEqual(results[0], results[1], 'Required locations differ from removing items one at a time')
+
     def test_testcases(self):
         test_files = [filename
                       for filename in os.listdir(test_dir)
@@ -796,7 +1351,7 @@ class TestValidSpoilers(unittest.TestCase):
         for filename in test_files:
             with self.subTest(filename=filename):
                 settings = load_settings(filename, seed='TESTTESTTEST')
-                main(settings)
+                self.verify_required_locations(main(settings))
                 # settings.output_file contains the first part of the filename
                 spoiler = load_spoiler('%s_Spoiler.json' % settings.output_file)
                 self.verify_woth(spoiler)
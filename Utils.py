@@ -1,7 +1,10 @@
 from __future__ import annotations
+import hashlib
 import io
 import json
 import logging
+import marshal
+import mmap
 import os
 import re
 import subprocess
@@ -60,7 +63,122 @@ def default_output_path(path: str) -> str:
     return path
 
 
+# Parsed logic files, keyed by path. Only used by long running processes that
+# generate many seeds, see enable_logic_file_cache. Callers must not modify the
+# returned data.
+logic_file_cache: Optional[dict[str, Any]] = None
+
+
+def enable_logic_file_cache() -> None:
+    global logic_file_cache
+    if logic_file_cache is None:
+        logic_file_cache = {}
+
+
 def read_logic_file(file_path: str):
+    if logic_file_cache is not None:
+        if file_path not in logic_file_cache:
+            logic_file_cache[file_path] = load_logic_file(file_path)
+        return logic_file_cache[file_path]
+    return load_logic_file(file_path)
+
+
+def load_logic_file(file_path: str):
+    logic = read_logic_binary(file_path)
+    if logic is None:
+        logic = parse_logic_file(file_path)
+        update_logic_binary()
+    return logic
+
+
+# Pre-parsed logic files, written by LogicToBinary.py. The file starts with the
+# magic, the marshal version and the length of the index, followed by the
+# marshalled index and the marshalled contents of every logic file. The index
+# maps each path relative to the data folder to the sha256, modification time
+# (in ns) and size of the json file it was built from, and the offset and length
+# of its contents after the index.
+LOGIC_BINARY_MAGIC: bytes = b'OOTRLOGIC2'
+
+
+def logic_binary_path() -> str:
+    return data_path('generated/logic.bin')
+
+
+class LogicBinary:
+    def __init__(self, path: str) -> None:
+        self.index: dict[str, tuple[bytes, int, int, int, int]] = {}
+        self.data: Optional[memoryview] = None
+        # Whether the contents of each logic file were built from its current version, once checked.
+        self.current: dict[str, bool] = {}
+        self.data_folder: str = os.path.realpath(data_path())
+        # Whether this process already wrote the file, see update_logic_binary.
+        self.updated: bool = False
+        try:
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            header_size = len(LOGIC_BINARY_MAGIC) + 8
+            if data[:len(LOGIC_BINARY_MAGIC)] == LOGIC_BINARY_MAGIC:
+                version = int.from_bytes(data[len(LOGIC_BINARY_MAGIC):len(LOGIC_BINARY_MAGIC) + 4], 'little')
+                index_size = int.from_bytes(data[len(LOGIC_BINARY_MAGIC) + 4:header_size], 'little')
+                if version == marshal.version:
+                    self.index = marshal.loads(data[header_size:header_size + index_size])
+                    self.data = memoryview(data)[header_size + index_size:]
+        except (OSError, ValueError, EOFError, TypeError):
+            pass
+
+    # Returns the contents of the logic file, or None if the binary has none
+    # built from its current version.
+    def read(self, file_path: str):
+        name = os.path.relpath(os.path.realpath(file_path), self.data_folder)
+        entry = self.index.get(name)
+        if entry is None:
+            return None
+        digest, mtime_ns, size, offset, length = entry
+        # The json files are the source of truth, anything built from an older version is ignored.
+        # They don't change while the randomizer runs, so each one is only checked once. Only a json
+        # file whose modification time or size changed (after a checkout, say) is read and hashed.
+        if name not in self.current:
+            stat = os.stat(file_path)
+            if (stat.st_mtime_ns, stat.st_size) == (mtime_ns, size):
+                self.current[name] = True
+            else:
+                with open(file_path, 'rb') as f:
+                    self.current[name] = hashlib.sha256(f.read()).digest() == digest
+        if not self.current[name]:
+            return None
+        return marshal.loads(self.data[offset:offset + length])
+
+
+# The logic binary of this process, opened on first use.
+logic_binaries: dict[str, LogicBinary] = {}
+
+
+def read_logic_binary(file_path: str):
+    path = logic_binary_path()
+    if path not in logic_binaries:
+        logic_binaries[path] = LogicBinary(path)
+    return logic_binaries[path].read(file_path)
+
+
+# Writes the logic binary again once a logic file couldn't be read from it,
+# because it is missing or older than the json, so later runs can use it.
+# Only tried once per process, the data folder may not be writable.
+def update_logic_binary() -> None:
+    from LogicToBinary import create_logic_binary
+    path = logic_binary_path()
+    if path not in logic_binaries:
+        logic_binaries[path] = LogicBinary(path)
+    if logic_binaries[path].updated:
+        return
+    try:
+        create_logic_binary(path)
+    except OSError as e:
+        logging.getLogger('').debug('Could not write the logic binary: %s', e)
+    logic_binaries[path] = LogicBinary(path)
+    logic_binaries[path].updated = True
+
+
+def parse_logic_file(file_path: str):
     json_string = ""
     with io.open(file_path, 'r') as file:
         for line in file.readlines():
@@ -218,6 +336,13 @@ def run_process(logger: logging.Logger, args: Sequence[str], stdin: Optional[Any
                 break
 
 
+# Whether generation attempts can be forked from the current process, so they share its resolved
+# settings and world graphs. Daemonic processes, such as batch workers, are not allowed to have children.
+def can_fork_attempts() -> bool:
+    import multiprocessing
+    return 'fork' in multiprocessing.get_all_start_methods() and not multiprocessing.current_process().daemon
+
+
 # https://stackoverflow.com/a/23146126
 def try_find_last(source_list: Sequence[Any], sought_element: Any) -> Optional[int]:
     for reverse_index, element in enumerate(reversed(source_list)):
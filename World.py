@@ -20,6 +20,7 @@ from LocationList import business_scrubs, location_groups, location_table
 from OcarinaSongs import generate_song_list, Song
 from Plandomizer import WorldDistribution, InvalidFileException
 from Region import Region, TimeOfDay
+from RuleCache import load_world_graph_templates, save_world_graph_template
 from RuleParser import Rule_AST_Transformer
 from Settings import Settings
 from SettingsList import SettingInfos, get_settings_from_section
@@ -33,6 +34,8 @@ class World:
         self.id: int = world_id
         self.dungeons: list[Dungeon] = []
         self.regions: list[Region] = []
+        # Changes whenever an entrance of the world is connected or disconnected.
+        self.graph_version: int = 0
         self.itempool: list[Item] = []
         self._cached_locations: list[Location] = []
         self._entrance_cache: dict[str, Entrance] = {}
@@ -561,6 +564,36 @@ class World:
         elif self.settings.silver_rupee_pouches_choice == 'all':
             self.settings.silver_rupee_pouches = self.silver_rupee_puzzles()
 
+    # Loads every logic file and compiles its rules. Worlds with the same logic
+    # settings and MQ layout get a copy of a graph built earlier instead.
+    def create_region_graph(self) -> list[tuple[Entrance, str]]:
+        key = WorldGraphTemplate.get_key(self)
+        if key not in world_graph_templates and self.settings.cache_compiled_rules:
+            if templates := load_world_graph_templates(self, key):
+                world_graph_templates[key] = templates
+        for template in world_graph_templates.get(key, []):
+            if template.matches(self):
+                return template.apply(self)
+
+        logic_folder = data_path('Glitched World' if self.settings.logic_rules == 'glitched' else 'World')
+        savewarps_to_connect = []
+        for filename in ('Overworld.json', 'Bosses.json'):
+            savewarps_to_connect += self.load_regions_from_json(os.path.join(logic_folder, filename))
+        savewarps_to_connect += self.create_dungeons()
+        self.create_internal_locations()
+        self.index_region_graph()
+
+        template = WorldGraphTemplate(self, savewarps_to_connect)
+        world_graph_templates.setdefault(key, []).append(template)
+        if self.settings.cache_compiled_rules:
+            save_world_graph_template(self, key, template)
+        if sum(len(templates) for templates in world_graph_templates.values()) > MAX_WORLD_GRAPH_TEMPLATES:
+            oldest_key = next(iter(world_graph_templates))
+            del world_graph_templates[oldest_key][0]
+            if not world_graph_templates[oldest_key]:
+                del world_graph_templates[oldest_key]
+        return savewarps_to_connect
+
     def load_regions_from_json(self, file_path: str) -> list[tuple[Entrance, str]]:
         region_json = read_logic_file(file_path)
         savewarps_to_connect = []
@@ -641,6 +674,17 @@ class World:
         self.parser.create_delayed_rules()
         assert self.parser.events <= self.event_items, 'Parse error: undefined items %r' % (self.parser.events - self.event_items)
 
+    # Numbers the regions and locations of the world, which lets a search keep
+    # its reachable regions and visited locations in arrays rather than sets.
+    # Copies of the graph keep the same numbers.
+    def index_region_graph(self) -> None:
+        location_index = 0
+        for region_index, region in enumerate(self.regions):
+            region.index = region_index
+            for location in region.locations:
+                location.index = location_index
+                location_index += 1
+
     def initialize_entrances(self) -> None:
         for region in self.regions:
             for exit in region.exits:
@@ -1464,3 +1508,94 @@ class World:
 
     def __repr__(self) -> str:
         return "W%d" % (self.id)
+
+
+# Region graphs of the worlds built so far, by WorldGraphTemplate.get_key. Rules
+# only compile to the names registered in ItemInfo and allowed_globals, so this
+# has to be cleared whenever those are restored to an earlier state.
+world_graph_templates: dict[tuple, list[WorldGraphTemplate]] = {}
+MAX_WORLD_GRAPH_TEMPLATES: int = 16
+
+
+class WorldGraphTemplate:
+    def __init__(self, world: World, savewarps_to_connect: list[tuple[Entrance, str]]) -> None:
+        # Rules are compiled to lambdas that only use the state they are given,
+        # so they are shared. Everything else is copied, first from the world
+        # and then from the template to every world that uses it.
+        self.inlined_constants: dict[str, str] = dict(world.parser.inlined_constants)
+        self.events: set[str] = set(world.parser.events)
+        self.replaced_rules: dict[str, dict[str, Any]] = {target: dict(rules) for target, rules in world.parser.replaced_rules.items()}
+        self.rule_cache: dict[str, Any] = dict(world.parser.rule_cache)
+        self.dungeons: list[tuple[str, HintArea]] = [(dungeon.name, dungeon.hint) for dungeon in world.dungeons]
+        self.regions: list[Region]
+        self.savewarps_to_connect: list[tuple[Entrance, str]]
+        self.regions, self.savewarps_to_connect = self.copy_graph(world.regions, savewarps_to_connect, None)
+
+    @staticmethod
+    def get_key(world: World) -> tuple:
+        # Settings read while building the graph, other than through inlined rule constants.
+        return (
+            world.settings.logic_rules,
+            tuple(world.dungeon_mq.items()),
+            world.ensure_tod_access,
+            world.settings.logic_no_night_tokens_without_suns_song,
+            tuple(sorted(world.randomized_list)),
+        )
+
+    def matches(self, world: World) -> bool:
+        for name, value in self.inlined_constants.items():
+            if name.startswith('settings.'):
+                source, name = world.settings.settings_dict, name[len('settings.'):]
+            else:
+                source = world.__dict__
+            if name not in source or '%r' % source[name] != value:
+                return False
+        return True
+
+    def apply(self, world: World) -> list[tuple[Entrance, str]]:
+        world.regions, savewarps_to_connect = self.copy_graph(self.regions, self.savewarps_to_connect, world)
+        for name, hint in self.dungeons:
+            world.dungeons.append(Dungeon(world, name, hint))
+
+        world.parser.inlined_constants = dict(self.inlined_constants)
+        world.parser.events = set(self.events)
+        world.parser.replaced_rules.update({target: dict(rules) for target, rules in self.replaced_rules.items()})
+        world.parser.rule_cache = dict(self.rule_cache)
+        return savewarps_to_connect
+
+    @staticmethod
+    def copy_graph(regions: list[Region], savewarps_to_connect: list[tuple[Entrance, str]],
+                   world: Optional[World]) -> tuple[list[Region], list[tuple[Entrance, str]]]:
+        new_regions = []
+        new_exits = {}
+        for region in regions:
+            new_region = region.copy()
+            new_region.world = world
+            new_region.dungeon = None
+
+            new_region.locations = []
+            for location in region.locations:
+                new_location = location.copy()
+                new_location.parent_region = new_region
+                new_location.world = world
+                new_location.rule_string = location.rule_string
+                new_location.item = None
+                new_region.locations.append(new_location)
+                if location.item is not None:
+                    if world is None:
+                        new_location.item = Item(location.item.name, event=True)
+                    else:
+                        make_event_item(location.item.name, new_location)
+
+            new_region.exits = []
+            for exit in region.exits:
+                new_exit = exit.copy()
+                new_exit.parent_region = new_region
+                new_exit.world = world
+                new_exit.rule_string = exit.rule_string
+                new_region.exits.append(new_exit)
+                new_exits[id(exit)] = new_exit
+            new_region.savewarp = new_exits.get(id(region.savewarp))
+            new_regions.append(new_region)
+
+        return new_regions, [(new_exits[id(exit)], target) for exit, target in savewarps_to_connect]